@@ -0,0 +1,5 @@
+"""
+Benchmarks of the plugin, at realistic numbers of public hosts.
+
+Run them with `python -m benchmarks`, see `python -m benchmarks --help`.
+"""
@@ -0,0 +1,86 @@
+"""
+Run the benchmarks, and optionally save the results as a baseline or compare
+them with one:
+
+    python -m benchmarks --save benchmarks/baseline.json
+    python -m benchmarks --compare benchmarks/baseline.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+
+from . import (  # pylint: disable=unused-import
+    bench_doctor,
+    bench_render,
+    bench_resolvers,
+    bench_utils,
+)
+from .harness import (
+    DEFAULT_THRESHOLD,
+    REGISTRY,
+    compare,
+    format_duration,
+    load,
+    run,
+    save,
+)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument(
+        "-k",
+        dest="pattern",
+        default="",
+        help="Only run benchmarks whose name contains this",
+    )
+    parser.add_argument(
+        "--save", metavar="PATH", help="Save the results as a JSON baseline"
+    )
+    parser.add_argument(
+        "--compare", metavar="PATH", help="Compare the results with a JSON baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Flag a regression when the fastest round is slower than the baseline by more than this ratio (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    results = {}
+    for bench in REGISTRY:
+        if args.pattern not in bench.name:
+            continue
+        stats = run(bench)
+        results[bench.name] = stats
+        print(
+            f"{bench.name:<36} median {format_duration(stats['median']):>10}"
+            f"  min {format_duration(stats['min']):>10}  ({bench.rounds} rounds)"
+        )
+
+    if args.save:
+        save(args.save, results)
+        print(f"Saved the results to {args.save}")
+    if args.compare:
+        comparisons = compare(results, load(args.compare), args.threshold)
+        print(f"\nComparison with {args.compare}:")
+        for comparison in comparisons:
+            if comparison.ratio is None:
+                status = "new"
+            else:
+                status = f"{comparison.ratio:.2f}x"
+                if comparison.regression:
+                    status += "  REGRESSION"
+            print(f"{comparison.name:<36} {status}")
+        regressions = [c.name for c in comparisons if c.regression]
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
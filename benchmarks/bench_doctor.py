@@ -0,0 +1,87 @@
+"Benchmarks of the checks of `tutor cloudflared doctor`, against a local DoH server"
+
+from __future__ import annotations
+
+import atexit
+import json
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict
+
+from tutor import config as tutor_config
+from tutor import hooks
+
+from .configs import make_root
+from .harness import benchmark
+
+# Latency of the DoH server, in seconds, which is about the one of a public resolver
+DOH_LATENCY = 0.05
+
+
+class DoHHandler(BaseHTTPRequestHandler):
+    "Answer NS queries with Cloudflare name servers, after some latency"
+
+    latency = DOH_LATENCY
+
+    def do_GET(self) -> None:
+        time.sleep(self.latency)
+        body = json.dumps(
+            {
+                "Status": 0,
+                "Answer": [
+                    {"data": "ada.ns.cloudflare.com.", "TTL": 300},
+                    {"data": "bob.ns.cloudflare.com.", "TTL": 300},
+                ],
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/dns-json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+_doh_urls: Dict[float, str] = {}
+
+
+def get_doh_url(latency: float = DOH_LATENCY) -> str:
+    "Start a DoH server once for each latency, and return its URL"
+    if latency not in _doh_urls:
+        handler = type("Handler", (DoHHandler,), {"latency": latency})
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        _doh_urls[latency] = f"http://127.0.0.1:{server.server_address[1]}/resolve"
+    return _doh_urls[latency]
+
+
+@benchmark("doctor", params=(10, 1000), rounds=15)
+def doctor(count: int) -> Callable[[], Any]:
+    # pylint: disable=import-outside-toplevel
+    from tutorcloudflared.doctor import get_checks, run_checks
+
+    root = tempfile.mkdtemp(prefix="cloudflared-bench-")
+    atexit.register(shutil.rmtree, root, ignore_errors=True)
+    make_root(
+        root,
+        count,
+        CLOUDFLARED_CACHE_HEADERS=False,
+        CLOUDFLARED_DOH_URL=get_doh_url(),
+    )
+    # The same as what the tutor CLI does before running a plugin command
+    hooks.Actions.CORE_READY.do()
+    hooks.Actions.PROJECT_ROOT_READY.do(root)
+    # Loading the config is mostly tutor rendering its settings, which is not
+    # what is measured here, so it is only done once
+    configs = tutor_config.load(root)
+    assert configs["CLOUDFLARED_PUBLIC_HOSTS"]
+
+    def run() -> None:
+        list(run_checks(get_checks(root, configs)))
+
+    return run
@@ -0,0 +1,34 @@
+"Benchmarks of the rendering of the templates that list the public hosts"
+
+from __future__ import annotations
+
+from typing import Any, Callable
+
+from tutor import env
+
+from .bench_utils import HOST_COUNTS
+from .configs import make_configs
+from .harness import benchmark
+
+
+@benchmark("render.iter_domains", params=HOST_COUNTS)
+def iter_domains(count: int) -> Callable[[], Any]:
+    configs = make_configs(count)
+    template = "{% for key, value in iter_domains() %}{{ value }}\n{% endfor %}"
+    return lambda: env.render_str(configs, template)
+
+
+@benchmark("render.config_yml", params=HOST_COUNTS, rounds=10)
+def config_yml(count: int) -> Callable[[], Any]:
+    renderer = env.Renderer(make_configs(count))
+    return lambda: renderer.render_template("cloudflared/apps/config.yml")
+
+
+@benchmark("render.init_task", params=HOST_COUNTS, rounds=10)
+def init_task(count: int) -> Callable[[], Any]:
+    # pylint: disable=import-outside-toplevel
+    from tutorcloudflared import plugin
+
+    configs = make_configs(count)
+    task = plugin._read_init_task()  # pylint: disable=protected-access
+    return lambda: env.render_str(configs, task)
@@ -0,0 +1,43 @@
+"Benchmarks of the overhead of the NS resolvers, against local servers without latency"
+
+from __future__ import annotations
+
+import socket
+import struct
+import threading
+from typing import Any, Callable
+
+from tutorcloudflared import resolvers
+
+from .bench_doctor import get_doh_url
+from .harness import benchmark
+
+
+def start_dns_server() -> int:
+    "Start a UDP server that answers any query with a single NS record, and return its port"
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    rdata = b"\x03ada\x02ns\xc0\x0c"
+    answer = b"\xc0\x0c" + struct.pack("!HHIH", 2, 1, 300, len(rdata)) + rdata
+
+    def serve() -> None:
+        while True:
+            query, address = sock.recvfrom(512)
+            header = query[:2] + struct.pack("!HHHHH", 0x8180, 1, 1, 0, 0)
+            sock.sendto(header + query[12:] + answer, address)
+
+    threading.Thread(target=serve, daemon=True).start()
+    return int(sock.getsockname()[1])
+
+
+@benchmark("resolvers.lookup_ns[dns]", rounds=10)
+def lookup_ns_dns() -> Callable[[], Any]:
+    resolver = resolvers.DNSResolver(["127.0.0.1"], port=start_dns_server())
+    return lambda: resolver.lookup_ns("cloudflare.com")
+
+
+@benchmark("resolvers.lookup_ns[doh]", rounds=10)
+def lookup_ns_doh() -> Callable[[], Any]:
+    # The DoH server of the doctor benchmarks answers after some latency
+    resolver = resolvers.DoHResolver(get_doh_url(latency=0))
+    return lambda: resolver.lookup_ns("cloudflare.com")
@@ -0,0 +1,68 @@
+"Benchmarks of the domain utilities"
+
+from __future__ import annotations
+
+from typing import Any, Callable, List
+
+from tutorcloudflared import utils
+
+from .harness import benchmark
+
+HOST_COUNTS = (10, 1000, 10000)
+
+
+def make_hosts(count: int) -> List[str]:
+    "Tenant hosts, a third of them being subdomains of subdomains"
+    return [
+        f"t{i}.learn.example.com" if i % 3 == 0 else f"t{i}.example.com"
+        for i in range(count)
+    ]
+
+
+@benchmark("utils.parse_host.cold", params=HOST_COUNTS)
+def parse_host_cold(count: int) -> Callable[[], Any]:
+    hosts = make_hosts(count)
+
+    def run() -> None:
+        utils.parse_host.cache_clear()
+        for host in hosts:
+            utils.parse_host(host)
+
+    return run
+
+
+@benchmark("utils.parse_host.warm", params=HOST_COUNTS)
+def parse_host_warm(count: int) -> Callable[[], Any]:
+    hosts = make_hosts(count)[: utils.PARSED_HOSTS_CACHE_SIZE]
+
+    def run() -> None:
+        for host in hosts:
+            utils.parse_host(host)
+
+    return run
+
+
+@benchmark("utils.HostIndex", params=HOST_COUNTS)
+def host_index(count: int) -> Callable[[], Any]:
+    hosts = {f"TENANT_{i}_HOST": host for i, host in enumerate(make_hosts(count))}
+
+    def run() -> None:
+        utils.parse_host.cache_clear()
+        index = utils.HostIndex(hosts)
+        index.is_same_domain()
+        index.get_conflicted_hosts("example.com")
+
+    return run
+
+
+@benchmark("utils.domain_helpers")
+def domain_helpers() -> Callable[[], Any]:
+    hosts = make_hosts(1000)
+
+    def run() -> None:
+        for host in hosts:
+            utils.get_first_level_domain(host)
+            utils.is_one_or_less_subdomain(host)
+            utils.strip_out_subdomains_if_needed(host)
+
+    return run
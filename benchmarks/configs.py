@@ -0,0 +1,52 @@
+"Tutor configurations with many public hosts"
+
+from __future__ import annotations
+
+import os
+from typing import Any, Dict
+
+from tutor import serialize
+
+from .bench_utils import make_hosts
+
+
+def make_configs(count: int) -> Dict[str, Any]:
+    """
+    Return the settings that the plugin templates need, with `count` tenant
+    hosts in CLOUDFLARED_PUBLIC_HOSTS, on top of the LMS.
+    """
+    # pylint: disable=import-outside-toplevel
+    from tutor import config as tutor_config
+
+    # Importing the plugin registers its default settings and template variables
+    from tutorcloudflared import plugin  # pylint: disable=unused-import
+
+    configs = tutor_config.get_defaults()
+    hosts = {f"TENANT_{i}_HOST": host for i, host in enumerate(make_hosts(count))}
+    configs.update(hosts)
+    configs.update(
+        {
+            "LMS_HOST": "example.com",
+            "CLOUDFLARED_TUNNEL_UUID": "6ff42ae2-765d-4adf-8112-31c55c1551ef",
+            "CLOUDFLARED_PUBLIC_HOSTS": ["LMS_HOST", *hosts],
+        }
+    )
+    return configs
+
+
+def make_root(path: str, count: int, **settings: Any) -> str:
+    "Create a tutor project root with `count` tenant hosts, and return it"
+    hosts = {f"TENANT_{i}_HOST": host for i, host in enumerate(make_hosts(count))}
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "config.yml"), "w", encoding="utf-8") as f:
+        serialize.dump(
+            {
+                "PLUGINS": ["cloudflared"],
+                "LMS_HOST": "example.com",
+                "CLOUDFLARED_PUBLIC_HOSTS": ["LMS_HOST", *hosts],
+                **hosts,
+                **settings,
+            },
+            f,
+        )
+    return path
@@ -0,0 +1,152 @@
+"Registry, timing and comparison of the benchmarks"
+
+from __future__ import annotations
+
+import gc
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+# A regression is flagged when the fastest round is this much slower than the
+# baseline. The fastest round is the least disturbed by the rest of the machine,
+# and the regressions that matter, e.g a quadratic loop over the hosts, are much
+# larger than what is left of the noise.
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_ROUNDS = 20
+# Fast functions are called several times per round, so that each round lasts at
+# least this long, in seconds, and timer resolution and noise don't matter
+MIN_ROUND_TIME = 0.02
+
+
+class Benchmark(NamedTuple):
+    "A benchmark: `setup` is called once and returns the function that is timed"
+
+    name: str
+    setup: Callable[[], Callable[[], Any]]
+    rounds: int
+
+
+REGISTRY: List[Benchmark] = []
+
+
+def benchmark(
+    name: str, params: Optional[Iterable[Any]] = None, rounds: int = DEFAULT_ROUNDS
+) -> Callable[[Callable[..., Callable[[], Any]]], Callable[..., Callable[[], Any]]]:
+    """
+    Register a benchmark setup function. With `params`, one benchmark is
+    registered for each value, named "name[value]", and the value is passed
+    to the setup function.
+    """
+
+    def decorator(
+        setup: Callable[..., Callable[[], Any]],
+    ) -> Callable[..., Callable[[], Any]]:
+        if params is None:
+            REGISTRY.append(Benchmark(name, setup, rounds))
+        else:
+            for param in params:
+                REGISTRY.append(
+                    Benchmark(f"{name}[{param}]", partial(setup, param), rounds)
+                )
+        return setup
+
+    return decorator
+
+
+def run(bench: Benchmark) -> Dict[str, float]:
+    """
+    Time a benchmark, after a warmup call, and return the statistics of the
+    duration of a single call, in seconds. The garbage collector is disabled
+    while timing.
+    """
+    func = bench.setup()
+    started = time.perf_counter()
+    func()
+    calls = max(1, math.ceil(MIN_ROUND_TIME / (time.perf_counter() - started)))
+    timings = []
+    # As timeit does, collections are not timed, they depend on what ran before
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(bench.rounds):
+            started = time.perf_counter()
+            for _ in range(calls):
+                func()
+            timings.append((time.perf_counter() - started) / calls)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "rounds": bench.rounds,
+        "calls": calls,
+    }
+
+
+def get_machine() -> Dict[str, str]:
+    "Describe where the benchmarks ran, as timings only compare on the same machine"
+    return {
+        "python": platform.python_version(),
+        "implementation": sys.implementation.name,
+        "platform": platform.platform(),
+        "processor": platform.machine(),
+    }
+
+
+def save(path: str, results: Dict[str, Dict[str, float]]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"machine": get_machine(), "benchmarks": results}, f, indent=2)
+        f.write("\n")
+
+
+def load(path: str) -> Dict[str, Dict[str, float]]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["benchmarks"]  # type: ignore[no-any-return]
+
+
+class Comparison(NamedTuple):
+    name: str
+    baseline: Optional[float]
+    current: float
+    regression: bool
+
+    @property
+    def ratio(self) -> Optional[float]:
+        return self.current / self.baseline if self.baseline else None
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    threshold: float = DEFAULT_THRESHOLD,
+) -> List[Comparison]:
+    """
+    Compare the fastest round of each benchmark with its baseline. Benchmarks
+    that are not in the baseline are reported, but are never regressions.
+    """
+    comparisons = []
+    for name, stats in results.items():
+        before = baseline.get(name, {}).get("min")
+        comparisons.append(
+            Comparison(
+                name,
+                before,
+                stats["min"],
+                before is not None and stats["min"] > before * (1 + threshold),
+            )
+        )
+    return comparisons
+
+
+def format_duration(seconds: float) -> str:
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
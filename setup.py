@@ -36,10 +36,10 @@ setup(
     author="Ghassan Maslamani",
     description="cloudflared plugin for Tutor",
     long_description=load_readme(),
-    packages=find_packages(exclude=["tests*"]),
+    packages=find_packages(exclude=["tests*", "benchmarks*"]),
     include_package_data=True,
     python_requires=">=3.7",
-    install_requires=["tutor","tld","requests"],
+    install_requires=["tutor","tld","requests","importlib_resources"],
     entry_points={
         "tutor.plugin.v1": [
             "cloudflared = tutorcloudflared.plugin"
@@ -0,0 +1,25 @@
+import unittest
+
+from benchmarks import harness
+
+
+class CompareTests(unittest.TestCase):
+    def test_regressions(self):
+        baseline = {"fast": {"min": 1.0, "median": 3.0}, "slow": {"min": 1.0, "median": 1.0}}
+        results = {
+            "fast": {"min": 1.1, "median": 2.0},
+            "slow": {"min": 2.0, "median": 2.0},
+            "new": {"min": 1.0, "median": 1.0},
+        }
+        comparisons = {c.name: c for c in harness.compare(results, baseline, threshold=0.5)}
+        self.assertFalse(comparisons["fast"].regression)
+        self.assertTrue(comparisons["slow"].regression)
+        self.assertEqual(comparisons["slow"].ratio, 2.0)
+        self.assertFalse(comparisons["new"].regression)
+        self.assertIsNone(comparisons["new"].ratio)
+
+    def test_run(self):
+        bench = harness.Benchmark("noop", lambda: lambda: None, rounds=3)
+        stats = harness.run(bench)
+        self.assertEqual(stats["rounds"], 3)
+        self.assertLessEqual(stats["min"], stats["median"])
@@ -0,0 +1,85 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from tutorcloudflared import utils
+from tutorcloudflared.cache import NSCache
+
+
+class NSCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache", "ns-cache.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_entries_persist_and_expire(self):
+        NSCache(self.path).set("example.com", True, 3600)
+        NSCache(self.path).set("example.org", False, -1)
+        cache = NSCache(self.path)
+        self.assertTrue(cache.get("example.com"))
+        self.assertIsNone(cache.get("example.org"))
+        self.assertIsNone(NSCache(self.path, refresh=True).get("example.com"))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = NSCache(self.path, max_entries=2)
+        cache.set("one.com", True, 3600)
+        cache.set("two.com", True, 3600)
+        cache.get("one.com")
+        cache.set("three.com", True, 3600)
+        cache = NSCache(self.path)
+        self.assertTrue(cache.get("one.com"))
+        self.assertIsNone(cache.get("two.com"))
+        self.assertTrue(cache.get("three.com"))
+
+    def test_order_is_saved(self):
+        cache = NSCache(self.path, max_entries=2)
+        cache.set("one.com", True, 3600)
+        cache.set("two.com", True, 3600)
+        cache = NSCache(self.path, max_entries=2)
+        cache.get("one.com")
+        cache.save()
+        cache = NSCache(self.path, max_entries=2)
+        cache.set("three.com", True, 3600)
+        self.assertTrue(cache.get("one.com"))
+        self.assertIsNone(cache.get("two.com"))
+
+    def test_malformed_entries_are_dropped(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "example.com": {"value": True, "expires": time.time() + 3600},
+                    "example.org": {"value": True},
+                    "example.net": {"value": True, "expires": "tomorrow"},
+                    "example.edu": True,
+                },
+                f,
+            )
+        cache = NSCache(self.path)
+        self.assertTrue(cache.get("example.com"))
+        for domain in ["example.org", "example.net", "example.edu"]:
+            self.assertIsNone(cache.get(domain))
+        cache.save()
+        with open(self.path, encoding="utf-8") as f:
+            self.assertEqual(list(json.load(f)), ["example.com"])
+
+    def test_malformed_file(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("[1, 2]")
+        cache = NSCache(self.path)
+        self.assertIsNone(cache.get("example.com"))
+        cache.set("example.com", True, 3600)
+        self.assertTrue(NSCache(self.path).get("example.com"))
+
+    def test_check_ns_uses_cache(self):
+        cache = NSCache(self.path)
+        with mock.patch.object(utils, "lookup_ns", return_value=(True, 300)) as lookup:
+            self.assertTrue(utils.check_ns("lms.example.com", cache=cache))
+            self.assertTrue(utils.check_ns("studio.example.com", cache=cache))
+        lookup.assert_called_once_with("example.com", timeout=utils.DOH_TIMEOUT, resolver=None)
@@ -0,0 +1,161 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from click.testing import CliRunner
+from tutor.commands.context import Context
+from tutor.exceptions import TutorError
+
+from tutorcloudflared import cli, fingerprint
+
+CONFIGS = {
+    "CLOUDFLARED_TUNNEL_NAME": "openedx",
+    "CLOUDFLARED_PUBLIC_HOSTS": ["LMS_HOST"],
+    "LMS_HOST": "example.com",
+    "CLOUDFLARED_REPLICAS": 3,
+    "CLOUDFLARED_METRICS_PORT": 20241,
+    "CLOUDFLARED_METRICS_HOST": "127.0.0.1",
+}
+
+
+SERVICES = ["cloudflared", "cloudflared-2", "cloudflared-3"]
+
+
+class RestartTests(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        path = fingerprint.get_config_path(self.root.name)
+        os.makedirs(os.path.dirname(path))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("tunnel: openedx\ningress:\n  - service: http_status:404\n")
+        self.write_compose("--ha-connections 4")
+        self.fingerprint = fingerprint.get_config_fingerprint(self.root.name, SERVICES)
+        self.configs = dict(CONFIGS)
+        for target, mocked in [
+            ("config.load", mock.Mock(side_effect=lambda root: self.configs)),
+            ("recreate_service", mock.Mock()),
+            ("wait_ready", mock.Mock(return_value=4)),
+            ("start_surge_connector", mock.Mock(return_value="cloudflared-surge")),
+            ("stop_container", mock.Mock()),
+        ]:
+            patcher = mock.patch(f"tutorcloudflared.cli.{target}", mocked)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write_compose(self, args):
+        path = fingerprint.get_compose_path(self.root.name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("services:\n")
+            for service in SERVICES:
+                f.write(f"  {service}:\n    command: cloudflared tunnel {args} run openedx\n")
+
+    def invoke(self, *args):
+        return CliRunner().invoke(cli.restart, args, obj=Context(self.root.name))
+
+    def test_unchanged_config(self):
+        fingerprint.save_applied_fingerprint(self.root.name, self.fingerprint)
+        result = self.invoke()
+        self.assertEqual(result.exit_code, 0, result.output)
+        cli.recreate_service.assert_not_called()
+
+    def test_check(self):
+        self.assertEqual(self.invoke("--check").exit_code, 1)
+        fingerprint.save_applied_fingerprint(self.root.name, self.fingerprint)
+        self.assertEqual(self.invoke("--check").exit_code, 0)
+        cli.recreate_service.assert_not_called()
+
+    def test_record(self):
+        result = self.invoke("--record")
+        self.assertEqual(result.exit_code, 0, result.output)
+        cli.recreate_service.assert_not_called()
+        self.assertEqual(
+            fingerprint.read_applied_fingerprint(self.root.name), self.fingerprint
+        )
+
+    def test_restart_one_at_a_time(self):
+        result = self.invoke()
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(
+            [c.args for c in cli.recreate_service.call_args_list],
+            [(self.root.name, s) for s in SERVICES],
+        )
+        cli.start_surge_connector.assert_not_called()
+        self.assertEqual(
+            fingerprint.read_applied_fingerprint(self.root.name), self.fingerprint
+        )
+
+    def test_connector_definition_changed(self):
+        fingerprint.save_applied_fingerprint(self.root.name, self.fingerprint)
+        self.write_compose("--ha-connections 2")
+        self.assertEqual(self.invoke("--check").exit_code, 1)
+        result = self.invoke()
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(cli.recreate_service.call_count, 3)
+
+    def test_stop_at_connector_not_ready(self):
+        cli.wait_ready.side_effect = [4, TutorError("not ready")]
+        result = self.invoke()
+        self.assertEqual(result.exit_code, 1)
+        self.assertEqual(
+            [c.args[1] for c in cli.recreate_service.call_args_list],
+            ["cloudflared", "cloudflared-2"],
+        )
+        self.assertIsNone(fingerprint.read_applied_fingerprint(self.root.name))
+
+    def test_single_connector_is_surged(self):
+        self.configs["CLOUDFLARED_REPLICAS"] = 1
+        result = self.invoke()
+        self.assertEqual(result.exit_code, 0, result.output)
+        # The temporary connector is ready before the connector restarts
+        self.assertEqual(
+            [c.args[0] for c in cli.wait_ready.call_args_list],
+            ["http://127.0.0.1:20242/ready", "http://127.0.0.1:20241/ready"],
+        )
+        self.assertEqual(cli.start_surge_connector.call_args.args[3], 20242)
+        cli.stop_container.assert_called_once_with("cloudflared-surge")
+
+    def test_surge_kept_when_connector_not_ready(self):
+        self.configs["CLOUDFLARED_REPLICAS"] = 1
+        cli.wait_ready.side_effect = [4, TutorError("not ready")]
+        result = self.invoke()
+        self.assertEqual(result.exit_code, 1)
+        cli.stop_container.assert_not_called()
+
+
+class ContainerAddressTests(unittest.TestCase):
+    @mock.patch("tutorcloudflared.cli.subprocess.run")
+    def test_container_address(self, run):
+        run.side_effect = [
+            subprocess.CompletedProcess([], 0, "3f2a1b\n", ""),
+            subprocess.CompletedProcess([], 0, "172.18.0.5 \n", ""),
+        ]
+        self.assertEqual(
+            cli.get_container_address({"LOCAL_PROJECT_NAME": "tutor_local"}, "lms"),
+            "172.18.0.5",
+        )
+        self.assertIn("label=com.docker.compose.service=lms", run.call_args_list[0].args[0])
+        self.assertEqual(run.call_args_list[1].args[0][-1], "3f2a1b")
+
+    @mock.patch("tutorcloudflared.cli.subprocess.run")
+    def test_container_not_running(self, run):
+        run.return_value = subprocess.CompletedProcess([], 0, "", "")
+        with self.assertRaises(TutorError):
+            cli.get_container_address({}, "lms")
+
+
+class RecreateServiceTests(unittest.TestCase):
+    @mock.patch("tutorcloudflared.cli.subprocess.run")
+    def test_recreate_service(self, run):
+        run.return_value = subprocess.CompletedProcess([], 0)
+        cli.recreate_service("/tmp/root", "cloudflared-2")
+        self.assertEqual(
+            run.call_args.args[0][3:],
+            ["local", "dc", "up", "--detach", "--force-recreate", "--no-deps", "cloudflared-2"],
+        )
+        run.return_value = subprocess.CompletedProcess([], 1)
+        with self.assertRaises(TutorError):
+            cli.recreate_service("/tmp/root", "cloudflared-2")
@@ -0,0 +1,232 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from tutorcloudflared import doctor, profiling, tunnels, utils
+
+
+def _sleeping_check(title: str, seconds: float):
+    def check() -> doctor.CheckResult:
+        time.sleep(seconds)
+        return doctor.CheckResult(title)
+
+    return (title, check)
+
+
+class RunChecksTests(unittest.TestCase):
+    def test_results_keep_order_and_run_concurrently(self):
+        checks = [
+            _sleeping_check("slow", 0.3),
+            _sleeping_check("fast", 0.0),
+            _sleeping_check("medium", 0.2),
+        ]
+        started = time.monotonic()
+        results = list(doctor.run_checks(checks))
+        elapsed = time.monotonic() - started
+        self.assertEqual([r.title for r in results], ["slow", "fast", "medium"])
+        self.assertLess(elapsed, 0.45)
+
+    def test_check_timeout_is_reported_as_fatal_error(self):
+        checks = [_sleeping_check("hanging", 1), _sleeping_check("fast", 0)]
+        results = list(doctor.run_checks(checks, check_timeout=0.1))
+        self.assertEqual(results[0].fatal_errors, 1)
+        self.assertEqual(results[1].fatal_errors, 0)
+
+    def test_check_timeout_starts_with_each_check(self):
+        # With a single worker, the second check only starts once the first is
+        # done, and still has its whole check_timeout
+        checks = [_sleeping_check("slow", 0.2), _sleeping_check("queued", 0.2)]
+        with mock.patch("tutorcloudflared.doctor.DOCTOR_MAX_WORKERS", 1):
+            results = list(doctor.run_checks(checks, check_timeout=0.3))
+        self.assertEqual([r.fatal_errors for r in results], [0, 0])
+
+    def test_check_error_is_reported_as_fatal_error(self):
+        def failing_check():
+            raise KeyError("expires")
+
+        checks = [_sleeping_check("before", 0), ("failing", failing_check), _sleeping_check("after", 0)]
+        results = list(doctor.run_checks(checks))
+        self.assertEqual([r.id for r in results], ["before", "failing", "after"])
+        self.assertEqual([r.fatal_errors for r in results], [0, 1, 0])
+        self.assertIn("KeyError('expires')", results[1].messages[0][1])
+
+    def test_overall_timeout(self):
+        checks = [_sleeping_check("slow", 0.2), _sleeping_check("queued", 0.2)]
+        with mock.patch("tutorcloudflared.doctor.DOCTOR_MAX_WORKERS", 1):
+            results = list(doctor.run_checks(checks, check_timeout=0.3, timeout=0.3))
+        self.assertEqual([r.fatal_errors for r in results], [0, 1])
+
+    def test_results_have_id_duration_and_profile(self):
+        def check():
+            with profiling.phase(profiling.NETWORK):
+                time.sleep(0.05)
+            with profiling.phase(profiling.PARSING):
+                utils.parse_host("learn.example.com")
+            return doctor.CheckResult("Network check", host_keys=["LMS_HOST"])
+
+        (result,) = doctor.run_checks([("network-check", check)], profile=True)
+        report = result.to_dict(profile=True)
+        self.assertEqual(report["id"], "network-check")
+        self.assertEqual(report["status"], "ok")
+        self.assertEqual(report["host_keys"], ["LMS_HOST"])
+        self.assertGreaterEqual(report["duration_ms"], 50)
+        self.assertGreaterEqual(report["profile"]["network_ms"], 50)
+        self.assertIn("other_ms", report["profile"])
+
+    def test_timings_are_not_collected_without_profile(self):
+        (result,) = doctor.run_checks([_sleeping_check("fast", 0)])
+        self.assertEqual(result.timings, {})
+        self.assertNotIn("profile", result.to_dict())
+
+    def test_status_and_fix_commands(self):
+        result = doctor.check_subdomain_level(
+            "MFE_HOST", utils.parse_host("apps.learn.example.com")
+        )
+        report = result.to_dict()
+        self.assertEqual(report["status"], "warning")
+        self.assertEqual(report["host_keys"], ["MFE_HOST"])
+        self.assertEqual(
+            report["fix_commands"],
+            ["tutor config save --set MFE_HOST=apps.example.com"],
+        )
+
+    def test_subdomain_level_warning(self):
+        result = doctor.check_subdomain_level(
+            "MFE_HOST", utils.parse_host("apps.learn.example.com")
+        )
+        self.assertEqual(result.warnings, 1)
+        self.assertIn(
+            ("command", "tutor config save --set MFE_HOST=apps.example.com"),
+            result.messages,
+        )
+
+
+class StaticOriginHandler(BaseHTTPRequestHandler):
+    "Serve a page that links to a hashed asset, with or without cache headers"
+
+    cache_control = "public, max-age=31536000, immutable"
+
+    def do_GET(self):
+        if self.path == "/admin/login/":
+            body = b'<link href="/static/admin/css/base.0123456789ab.css" rel="stylesheet">'
+        else:
+            body = b"body {}"
+        self.send_response(200)
+        if self.path.startswith("/static/") and self.cache_control:
+            self.send_header("Cache-Control", self.cache_control)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class WildcardHostTests(unittest.TestCase):
+    def test_coverage(self):
+        index = utils.HostIndex({"LMS_HOST": "example.com", "CMS_HOST": "studio.example.com"})
+        result = doctor.check_wildcard_host("*.example.com", index, "example.com")
+        self.assertEqual((result.fatal_errors, result.warnings), (0, 0))
+        self.assertIn("CMS_HOST studio.example.com", result.messages[-1][1])
+        self.assertNotIn("LMS_HOST", result.messages[-1][1])
+
+    def test_two_level_and_other_zone(self):
+        index = utils.HostIndex({"LMS_HOST": "example.com"})
+        self.assertEqual(doctor.check_wildcard_host("*.learn.example.com", index, "example.com").warnings, 1)
+        self.assertEqual(doctor.check_wildcard_host("*.example.org", index, "example.com").fatal_errors, 1)
+
+
+class CacheHeadersTests(unittest.TestCase):
+    pattern = r"[./][0-9a-f]{12,32}\.[0-9a-z]+$"
+
+    def check(self, cache_control):
+        handler = type("Handler", (StaticOriginHandler,), {"cache_control": cache_control})
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        origin = f"http://127.0.0.1:{server.server_address[1]}"
+        return doctor.check_cache_headers(origin, "LMS_HOST", "example.com", self.pattern)
+
+    def test_immutable_assets(self):
+        result = self.check("public, max-age=31536000, immutable")
+        self.assertEqual(result.warnings, 0)
+        self.assertIn("base.0123456789ab.css", result.messages[0][1])
+
+    def test_missing_headers(self):
+        result = self.check("")
+        self.assertEqual(result.warnings, 1)
+        self.assertEqual(result.fatal_errors, 0)
+
+    def test_unreachable_origin_is_skipped(self):
+        result = doctor.check_cache_headers("http://127.0.0.1:9", "LMS_HOST", "example.com", self.pattern, timeout=1)
+        self.assertEqual((result.warnings, result.fatal_errors), (0, 0))
+        self.assertEqual(result.messages[0][0], "alert")
+
+    def test_find_sample_asset(self):
+        html = '<script src="/static/js/i18n.js"></script><link href="/static/css/lms.0123456789ab.css">'
+        self.assertEqual(doctor.find_sample_asset(html, self.pattern), "/static/css/lms.0123456789ab.css")
+
+
+class UdpBuffersTests(unittest.TestCase):
+    def sysctl_dir(self, rmem_max, wmem_max):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        os.makedirs(os.path.join(directory.name, "net", "core"))
+        for name, value in [("rmem_max", rmem_max), ("wmem_max", wmem_max)]:
+            with open(
+                os.path.join(directory.name, "net", "core", name), "w", encoding="utf-8"
+            ) as f:
+                f.write(f"{value}\n")
+        return directory.name
+
+    def test_small_buffers(self):
+        result = doctor.check_udp_buffers("quic", self.sysctl_dir(212992, 7500000))
+        self.assertEqual(result.warnings, 1)
+        self.assertIn(
+            "sudo sysctl -w net.core.rmem_max=7500000 net.core.wmem_max=7500000",
+            result.fix_commands,
+        )
+        self.assertIn("net.core.rmem_max=212992", result.messages[0][1])
+        self.assertNotIn("net.core.wmem_max=7500000", result.messages[0][1])
+
+    def test_large_buffers(self):
+        result = doctor.check_udp_buffers("auto", self.sysctl_dir(7500000, 8388608))
+        self.assertEqual(result.status, "ok")
+
+    def test_http2_and_unreadable_sysctls_are_skipped(self):
+        self.assertEqual(doctor.check_udp_buffers("http2", "/nonexistent").status, "ok")
+        result = doctor.check_udp_buffers("quic", "/nonexistent")
+        self.assertEqual(result.status, "ok")
+        self.assertEqual(result.messages[0][0], "alert")
+
+
+class TunnelTests(unittest.TestCase):
+    uuid = "6ff42ae2-765d-4adf-8112-31c55c1551ef"
+
+    def check(self, uuid, hosts, credentials=True):
+        tunnel = tunnels.Tunnel("openedx-lms", uuid, list(hosts), 2, "-openedx-lms")
+        with tempfile.TemporaryDirectory() as credentials_dir:
+            if credentials:
+                with open(os.path.join(credentials_dir, f"{self.uuid}.json"), "w", encoding="utf-8") as f:
+                    f.write("{}")
+            return doctor.check_tunnel(tunnel, hosts, credentials_dir)
+
+    def test_routed_hosts(self):
+        result = self.check(self.uuid, {"LMS_HOST": "example.com"})
+        self.assertEqual(result.status, "ok")
+        self.assertEqual(result.host_keys, ["LMS_HOST"])
+        self.assertIn("routes LMS_HOST example.com", result.messages[0][1])
+
+    def test_missing_uuid_and_credentials(self):
+        result = self.check("", {"LMS_HOST": "example.com"})
+        self.assertEqual(result.status, "warning")
+        self.assertIn("tutor cloudflared set-tunnel-uuid", result.fix_commands)
+        result = self.check(self.uuid, {"LMS_HOST": "example.com"}, credentials=False)
+        self.assertEqual(result.fix_commands, ["tutor local do init --limit=cloudflared"])
+        self.assertEqual(self.check("not-a-uuid", {}).status, "error")
+        self.assertEqual(self.check(self.uuid, {}).status, "warning")
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+from tutorcloudflared import fingerprint
+
+CONFIG = """tunnel: 6ff42ae2-765d-4adf-8112-31c55c1551ef
+ingress:
+  - hostname: example.com
+    service: http://caddy
+  - service: http_status:404
+"""
+
+
+class FingerprintTests(unittest.TestCase):
+    def test_formatting_does_not_change_fingerprint(self):
+        reformatted = "# comment\ningress:\n\n- {service: http://caddy, hostname: example.com}\n- service: http_status:404\ntunnel: 6ff42ae2-765d-4adf-8112-31c55c1551ef\n"
+        self.assertEqual(fingerprint.compute_fingerprint(CONFIG), fingerprint.compute_fingerprint(reformatted))
+
+    def test_ingress_changes_fingerprint(self):
+        changed = CONFIG.replace("http://caddy", "http://lms:8000")
+        self.assertNotEqual(fingerprint.compute_fingerprint(CONFIG), fingerprint.compute_fingerprint(changed))
+
+    def test_service_changes_fingerprint(self):
+        service = {"image": "cloudflared:2024.1.0", "command": "cloudflared tunnel run"}
+        changed = dict(service, command="cloudflared tunnel --ha-connections 2 run")
+        self.assertNotEqual(
+            fingerprint.compute_fingerprint(CONFIG, {"cloudflared": service}),
+            fingerprint.compute_fingerprint(CONFIG, {"cloudflared": changed}),
+        )
+        self.assertNotEqual(
+            fingerprint.compute_fingerprint(CONFIG, {"cloudflared": service}),
+            fingerprint.compute_fingerprint(CONFIG, {"cloudflared": service, "cloudflared-2": service}),
+        )
+
+    def test_applied_fingerprint(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = fingerprint.get_config_path(root)
+            os.makedirs(os.path.dirname(path))
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(CONFIG)
+            path = fingerprint.get_compose_path(root)
+            os.makedirs(os.path.dirname(path))
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("services:\n  cloudflared:\n    image: cloudflared:2024.1.0\n")
+            self.assertIsNone(fingerprint.read_applied_fingerprint(root))
+            current = fingerprint.get_config_fingerprint(root, ["cloudflared"])
+            fingerprint.save_applied_fingerprint(root, current)
+            self.assertEqual(fingerprint.read_applied_fingerprint(root), current)
@@ -0,0 +1,75 @@
+import unittest
+
+from tutor.exceptions import TutorError
+
+from tutorcloudflared import hosts
+
+
+class WildcardHostsTests(unittest.TestCase):
+    def test_covering_wildcard(self):
+        wildcard_hosts = ["*.example.com", "*.tenants.example.org"]
+        self.assertEqual(hosts.get_covering_wildcard("a.example.com", wildcard_hosts), "*.example.com")
+        self.assertEqual(hosts.get_covering_wildcard("a.tenants.example.org", wildcard_hosts), "*.tenants.example.org")
+        self.assertIsNone(hosts.get_covering_wildcard("a.b.example.com", wildcard_hosts))
+        self.assertIsNone(hosts.get_covering_wildcard("example.com", wildcard_hosts))
+        self.assertIsNone(hosts.get_covering_wildcard("aexample.com", wildcard_hosts))
+
+    def test_dns_routes(self):
+        configs = {
+            "CLOUDFLARED_PUBLIC_HOSTS": ["LMS_HOST", "CMS_HOST", "MFE_HOST"],
+            "CLOUDFLARED_WILDCARD_HOSTS": ["*.example.com"],
+            "LMS_HOST": "example.com",
+            "CMS_HOST": "studio.example.com",
+            "MFE_HOST": "apps.learn.example.com",
+        }
+        self.assertEqual(
+            hosts.get_dns_routes(configs),
+            ["example.com", "apps.learn.example.com", "*.example.com"],
+        )
+
+    def test_invalid_wildcard_hosts(self):
+        for wildcard_hosts in ["*.example.com", ["example.com"], ["*example.com"], ["*.Example.com"], [1]]:
+            with self.assertRaises(TutorError):
+                hosts.get_wildcard_hosts({"CLOUDFLARED_WILDCARD_HOSTS": wildcard_hosts})
+
+
+class TunnelsTests(unittest.TestCase):
+    configs = {
+        "CLOUDFLARED_TUNNEL_NAME": "openedx",
+        "CLOUDFLARED_PUBLIC_HOSTS": ["LMS_HOST", "CMS_HOST", "MFE_HOST", "DISCOVERY_HOST"],
+        "CLOUDFLARED_WILDCARD_HOSTS": ["*.example.com"],
+        "CLOUDFLARED_TUNNELS": {"openedx-lms": ["LMS_HOST", "MFE_HOST"]},
+        "LMS_HOST": "example.com",
+        "CMS_HOST": "studio.example.com",
+        "MFE_HOST": "apps.example.com",
+    }
+
+    def test_host_keys(self):
+        self.assertEqual(
+            hosts.get_tunnel_host_keys(self.configs),
+            {"openedx": ["CMS_HOST", "DISCOVERY_HOST"], "openedx-lms": ["LMS_HOST", "MFE_HOST"]},
+        )
+        self.assertEqual(hosts.get_tunnel_hosts(self.configs), {"CMS_HOST": "studio.example.com"})
+        self.assertEqual(
+            hosts.get_tunnel_hosts(self.configs, "openedx-lms"),
+            {"LMS_HOST": "example.com", "MFE_HOST": "apps.example.com"},
+        )
+
+    def test_dns_routes(self):
+        # The hosts of other tunnels get their own route, even if a wildcard covers them
+        self.assertEqual(hosts.get_dns_routes(self.configs), ["*.example.com"])
+        self.assertEqual(
+            hosts.get_dns_routes(self.configs, "openedx-lms"), ["example.com", "apps.example.com"]
+        )
+
+    def test_invalid_tunnels(self):
+        for tunnels in [
+            ["openedx-lms"],
+            {"Openedx-lms": ["LMS_HOST"]},
+            {"openedx": ["LMS_HOST"]},
+            {"openedx-lms": "LMS_HOST"},
+            {"openedx-lms": ["ECOMMERCE_HOST"]},
+            {"openedx-lms": ["LMS_HOST"], "openedx-mfe": ["LMS_HOST"]},
+        ]:
+            with self.assertRaises(TutorError):
+                hosts.get_tunnel_host_keys({**self.configs, "CLOUDFLARED_TUNNELS": tunnels})
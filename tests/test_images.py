@@ -0,0 +1,59 @@
+import os
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+from tutor.exceptions import TutorError
+
+from tutorcloudflared import images
+
+# Stands in for the docker CLI, and records the arguments of each call
+FAKE_DOCKER = """#!/bin/sh
+echo "$@" >> "$(dirname "$0")/calls"
+case "$1" in
+  image) echo 42000000 ;;
+  run) echo "cloudflared version 2024.12.2" ;;
+  *) echo "unknown command" >&2; exit 1 ;;
+esac
+"""
+
+
+class ImageReportTests(unittest.TestCase):
+    def setUp(self):
+        self.bin_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.bin_dir.cleanup)
+        docker = os.path.join(self.bin_dir.name, "docker")
+        with open(docker, "w", encoding="utf-8") as f:
+            f.write(FAKE_DOCKER)
+        os.chmod(docker, stat.S_IRWXU)
+        path = f"{self.bin_dir.name}{os.pathsep}{os.environ.get('PATH', '')}"
+        patcher = mock.patch.dict(os.environ, {"PATH": path})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def calls(self):
+        with open(os.path.join(self.bin_dir.name, "calls"), encoding="utf-8") as f:
+            return f.read().splitlines()
+
+    def test_report(self):
+        report = images.get_image_report("cloudflared:2024.12.2", runs=2)
+        self.assertEqual(report["size"], 42000000)
+        self.assertEqual(report["start_time"]["runs"], 2)
+        self.assertLessEqual(report["start_time"]["min"], report["start_time"]["median"])
+        self.assertEqual(
+            self.calls(),
+            [
+                "run --rm cloudflared:2024.12.2 cloudflared --version",
+                "run --rm cloudflared:2024.12.2 cloudflared --version",
+                "image inspect --format {{.Size}} cloudflared:2024.12.2",
+            ],
+        )
+
+    def test_docker_errors(self):
+        with self.assertRaises(TutorError):
+            images._docker("build", ".")
+
+    def test_format_size(self):
+        self.assertEqual(images.format_size(512), "512.0B")
+        self.assertEqual(images.format_size(42000000), "42.0MB")
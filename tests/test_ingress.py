@@ -0,0 +1,107 @@
+import unittest
+
+from tutor.exceptions import TutorError
+
+from tutorcloudflared import ingress
+
+
+class OriginRequestTests(unittest.TestCase):
+    def test_defaults_and_overrides(self):
+        configs = {
+            "CLOUDFLARED_PUBLIC_HOSTS": ["LMS_HOST", "CMS_HOST"],
+            "CLOUDFLARED_ORIGIN_REQUEST": {"keepAliveConnections": 200, "http2Origin": True},
+            "CLOUDFLARED_ORIGIN_REQUEST_OVERRIDES": {"LMS_HOST": {"keepAliveConnections": 500, "connectTimeout": "1m30s"}},
+        }
+        self.assertEqual(
+            ingress.get_origin_request(configs, "LMS_HOST", "example.com"),
+            [
+                ("originServerName", '"example.com"'),
+                ("keepAliveConnections", "500"),
+                ("http2Origin", "true"),
+                ("connectTimeout", "1m30s"),
+            ],
+        )
+        self.assertEqual(
+            ingress.get_origin_request(configs, "CMS_HOST", "studio.example.com")[1],
+            ("keepAliveConnections", "200"),
+        )
+
+    def test_wildcard_host(self):
+        configs = {
+            "CLOUDFLARED_WILDCARD_HOSTS": ["*.example.com"],
+            "CLOUDFLARED_ORIGIN_REQUEST_OVERRIDES": {"*.example.com": {"connectTimeout": "5s"}},
+        }
+        self.assertEqual(
+            ingress.get_origin_request(configs, "*.example.com", "*.example.com"),
+            [("matchSNItoHost", "true"), ("connectTimeout", "5s")],
+        )
+
+    def test_invalid_settings(self):
+        for settings in [
+            {"connectTimeout": 30},
+            {"connectTimeout": "0s"},
+            {"keepAliveTimeout": "2d"},
+            {"keepAliveConnections": -1},
+            {"http2Origin": "yes"},
+            {"unknown": True},
+        ]:
+            with self.assertRaises(TutorError):
+                ingress.get_origin_request({"CLOUDFLARED_ORIGIN_REQUEST": settings}, "LMS_HOST", "example.com")
+
+    def test_invalid_mappings(self):
+        for configs, message in [
+            ({"CLOUDFLARED_ORIGIN_REQUEST": ["http2Origin"]}, "CLOUDFLARED_ORIGIN_REQUEST"),
+            ({"CLOUDFLARED_ORIGIN_REQUEST_OVERRIDES": ["LMS_HOST"]}, "CLOUDFLARED_ORIGIN_REQUEST_OVERRIDES"),
+            ({"CLOUDFLARED_ORIGIN_REQUEST_OVERRIDES": {"LMS_HOTS": {"http2Origin": True}}}, "'LMS_HOTS'"),
+            ({"CLOUDFLARED_ORIGIN_REQUEST_OVERRIDES": {"LMS_HOST": "http2Origin"}}, "'LMS_HOST'"),
+        ]:
+            with self.assertRaises(TutorError) as context:
+                ingress.get_origin_request(
+                    {"CLOUDFLARED_PUBLIC_HOSTS": ["LMS_HOST"], **configs}, "LMS_HOST", "example.com"
+                )
+            self.assertIn(message, str(context.exception))
+
+    def test_parse_duration(self):
+        self.assertEqual(ingress.parse_duration("1m30s"), 90)
+        self.assertEqual(ingress.parse_duration("500ms"), 0.5)
+
+
+class IngressRulesTests(unittest.TestCase):
+    configs = {
+        "CLOUDFLARED_PUBLIC_HOSTS": ["LMS_HOST", "CMS_HOST", "MFE_HOST"],
+        "CLOUDFLARED_DIRECT_SERVICES": {"LMS_HOST": "http://lms:8000", "CMS_HOST": "http://cms:8000"},
+        "CLOUDFLARED_PATH_SERVICES": {"LMS_HOST": {"^/static/": "http://static:8080"}},
+    }
+
+    def test_caddy_by_default(self):
+        self.assertEqual(
+            ingress.get_ingress_rules(self.configs, "LMS_HOST"),
+            [('"^/static/"', "http://static:8080"), (None, "http://caddy")],
+        )
+
+    def test_direct_routing(self):
+        configs = dict(self.configs, CLOUDFLARED_DIRECT_ROUTING=True)
+        self.assertEqual(ingress.get_ingress_rules(configs, "CMS_HOST"), [(None, "http://cms:8000")])
+        # Hosts that are not mapped fall back to caddy
+        self.assertEqual(ingress.get_ingress_rules(configs, "MFE_HOST"), [(None, "http://caddy")])
+
+    def test_wildcard_host_rules(self):
+        configs = dict(
+            self.configs,
+            CLOUDFLARED_WILDCARD_HOSTS=["*.example.com"],
+            CLOUDFLARED_PATH_SERVICES={"*.example.com": {"^/media/": "http://media:8080"}},
+        )
+        self.assertEqual(
+            ingress.get_ingress_rules(configs, "*.example.com"),
+            [('"^/media/"', "http://media:8080"), (None, "http://caddy")],
+        )
+
+    def test_invalid_rules(self):
+        for settings in [
+            {"CLOUDFLARED_DIRECT_ROUTING": True, "CLOUDFLARED_DIRECT_SERVICES": {"LMS_HOST": "lms:8000"}},
+            {"CLOUDFLARED_PATH_SERVICES": {"LMS_HOST": {"^/static/(": "http://static:8080"}}},
+            {"CLOUDFLARED_PATH_SERVICES": {"LMS_HOST": {"^/static/": "ftp://static"}}},
+            {"CLOUDFLARED_PATH_SERVICES": {"UNKNOWN_HOST": {"^/static/": "http://static:8080"}}},
+        ]:
+            with self.assertRaises(TutorError):
+                ingress.get_ingress_rules(dict(self.configs, **settings), "LMS_HOST")
@@ -0,0 +1,126 @@
+import inspect
+import json
+import unittest
+from types import SimpleNamespace
+
+import yaml
+from kubernetes import client
+from tutor import env
+
+from tutorcloudflared import plugin
+
+# Kubernetes client models, which validate their required fields
+MODELS = {
+    "Deployment": "V1Deployment",
+    "Service": "V1Service",
+    "HorizontalPodAutoscaler": "V2HorizontalPodAutoscaler",
+}
+CONFIG = {
+    "CLOUDFLARED_DOCKER_IMAGE": "docker.io/cloudflared:latest",
+    "CLOUDFLARED_TUNNEL_NAME": "openedx",
+    "CLOUDFLARED_TUNNEL_UUID": "6ff42ae2-765d-4adf-8112-31c55c1551ef",
+    "CLOUDFLARED_REPLICAS": 2,
+    "CLOUDFLARED_METRICS_PORT": 20241,
+    "CLOUDFLARED_HA_CONNECTIONS": 4,
+    "CLOUDFLARED_K8S_CREDENTIALS_SECRET": "cloudflared-credentials",
+    "CLOUDFLARED_K8S_CPU_REQUEST": "100m",
+    "CLOUDFLARED_K8S_AUTOSCALING": False,
+    "CLOUDFLARED_K8S_AUTOSCALING_METRIC": "cpu",
+    "CLOUDFLARED_K8S_MIN_REPLICAS": 2,
+    "CLOUDFLARED_K8S_MAX_REPLICAS": 6,
+    "CLOUDFLARED_K8S_TARGET_CPU_UTILIZATION": 70,
+    "CLOUDFLARED_K8S_REQUESTS_METRIC": "cloudflared_tunnel_requests_per_second",
+    "CLOUDFLARED_K8S_TARGET_REQUESTS_PER_SECOND": 100,
+}
+
+
+def render_manifests(**config):
+    patches = dict(plugin._read_patches())
+    manifests = "\n".join(
+        env.render_str({**CONFIG, **config}, patches[name])
+        for name in ["k8s-deployments", "k8s-services"]
+    )
+    documents = [doc for doc in yaml.safe_load_all(manifests) if doc]
+    for document in documents:
+        deserialize(document, MODELS[document["kind"]])
+    return documents
+
+
+def deserialize(document, model):
+    """
+    Load a manifest into a client model, which raises a ValueError for missing
+    required fields. Recent clients take the response text, and older ones,
+    such as the pinned one, a response object.
+    """
+    api = client.ApiClient()
+    text = json.dumps(document)
+    if "response_text" in inspect.signature(api.deserialize).parameters:
+        return api.deserialize(text, model, "application/json")
+    return api.deserialize(SimpleNamespace(data=text), model)
+
+
+class K8sManifestsTests(unittest.TestCase):
+    def test_deployment(self):
+        deployment, service = render_manifests()
+        self.assertEqual(deployment["spec"]["replicas"], 2)
+        container = deployment["spec"]["template"]["spec"]["containers"][0]
+        self.assertEqual(container["readinessProbe"]["httpGet"]["path"], "/ready")
+        self.assertEqual(container["livenessProbe"]["httpGet"]["path"], "/ready")
+        self.assertEqual(service["spec"]["ports"][0]["port"], 20241)
+
+    def test_cpu_autoscaling(self):
+        deployment, hpa, _service = render_manifests(CLOUDFLARED_K8S_AUTOSCALING=True)
+        self.assertNotIn("replicas", deployment["spec"])
+        self.assertEqual(hpa["spec"]["metrics"][0]["resource"]["target"]["averageUtilization"], 70)
+
+    def test_requests_autoscaling(self):
+        _deployment, hpa, _service = render_manifests(
+            CLOUDFLARED_K8S_AUTOSCALING=True, CLOUDFLARED_K8S_AUTOSCALING_METRIC="requests"
+        )
+        self.assertEqual(
+            hpa["spec"]["metrics"][0]["pods"]["metric"]["name"],
+            "cloudflared_tunnel_requests_per_second",
+        )
+
+    def test_tunnels(self):
+        documents = render_manifests(
+            CLOUDFLARED_PUBLIC_HOSTS=["LMS_HOST"],
+            LMS_HOST="example.com",
+            CLOUDFLARED_TUNNELS={"openedx-lms": ["LMS_HOST"]},
+            CLOUDFLARED_TUNNEL_UUIDS={"openedx-lms": "0b2e40c2-ee07-4b0b-a0ea-3e1d0e1a0b5c"},
+            CLOUDFLARED_TUNNEL_REPLICAS={"openedx-lms": 3},
+        )
+        self.assertEqual(
+            [(d["kind"], d["metadata"]["name"]) for d in documents],
+            [
+                ("Deployment", "cloudflared"),
+                ("Deployment", "cloudflared-openedx-lms"),
+                ("Service", "cloudflared-metrics"),
+                ("Service", "cloudflared-openedx-lms-metrics"),
+            ],
+        )
+        deployment = documents[1]
+        self.assertEqual(deployment["spec"]["replicas"], 3)
+        pod = deployment["spec"]["template"]["spec"]
+        self.assertEqual(
+            pod["containers"][0]["args"][-3:],
+            ["--credentials-file", "/root/.cloudflared/0b2e40c2-ee07-4b0b-a0ea-3e1d0e1a0b5c.json", "openedx-lms"],
+        )
+        self.assertEqual(
+            [volume.get("configMap", volume.get("secret")) for volume in pod["volumes"]],
+            [{"name": "cloudflared-config"}, {"secretName": "cloudflared-credentials-openedx-lms"}],
+        )
+
+    def test_invalid_manifest_is_detected(self):
+        with self.assertRaises(ValueError):
+            deserialize({"kind": "Deployment", "spec": {"template": {}}}, "V1Deployment")
+
+    def test_models(self):
+        deployment, service = [
+            deserialize(document, MODELS[document["kind"]]) for document in render_manifests()
+        ]
+        self.assertIsInstance(deployment, client.V1Deployment)
+        self.assertEqual(deployment.spec.replicas, 2)
+        self.assertEqual(deployment.spec.template.spec.containers[0].ports[0].container_port, 20241)
+        self.assertIsInstance(service, client.V1Service)
+        self.assertEqual(service.spec.ports[0].port, 20241)
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tutor.exceptions import TutorError
+
+from tutorcloudflared import loadtest
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    "A keep-alive service that answers with fixed size, chunked or closing responses"
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, don't wait for the ACK in between
+    disable_nagle_algorithm = True
+    lock = threading.Lock()
+    connections = set()
+    hosts = set()
+
+    def do_GET(self):
+        with self.lock:
+            type(self).connections.add(self.client_address)
+            type(self).hosts.add(self.headers["Host"])
+        body = json.dumps({"path": self.path}).encode()
+        self.send_response(200)
+        if self.path == "/chunked":
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.wfile.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(body), body))
+        elif self.path == "/close":
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(body)
+            self.close_connection = True
+        else:
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class LoadTestTests(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(
+            ("127.0.0.1", 0),
+            type("Handler", (ServiceHandler,), {"connections": set(), "hosts": set()}),
+        )
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def run_load(self, path, **kwargs):
+        return asyncio.run(
+            loadtest.run_load(self.url, "learn.example.com", path, **kwargs)
+        ).to_dict()
+
+    def test_keep_alive(self):
+        for path in ["/", "/chunked"]:
+            result = self.run_load(path, concurrency=4, requests=200)
+            self.assertEqual(result["requests"], 200)
+            self.assertEqual(result["errors"], 0)
+            self.assertEqual(result["statuses"], {"200": 200})
+            self.assertEqual(result["connections"], 4)
+            p50, p95, p99 = result["latency_ms"].values()
+            self.assertLessEqual(p50, p95)
+            self.assertLessEqual(p95, p99)
+        handler = self.server.RequestHandlerClass
+        self.assertEqual(handler.hosts, {"learn.example.com"})
+
+    def test_closed_connections_are_reopened(self):
+        result = self.run_load("/close", concurrency=2, requests=10)
+        self.assertEqual(result["errors"], 0)
+        self.assertEqual(result["connections"], 10)
+
+    def test_duration_and_errors(self):
+        result = asyncio.run(
+            loadtest.run_load(
+                "http://127.0.0.1:9", "learn.example.com", concurrency=2, duration=0.1
+            )
+        ).to_dict()
+        self.assertGreater(result["errors"], 0)
+        self.assertEqual(result["latency_ms"]["p50"], None)
+
+    def test_percentile(self):
+        values = [i / 100 for i in range(1, 101)]
+        self.assertEqual(loadtest.percentile(values, 50), 0.5)
+        self.assertEqual(loadtest.percentile(values, 99), 0.99)
+        self.assertIsNone(loadtest.percentile([], 50))
+
+    def test_layer_urls(self):
+        configs = {
+            "CLOUDFLARED_PUBLIC_HOSTS": ["LMS_HOST", "DISCOVERY_HOST"],
+            "LMS_HOST": "learn.example.com",
+            "DISCOVERY_HOST": "discovery.example.com",
+            "CLOUDFLARED_DIRECT_SERVICES": {"LMS_HOST": "http://lms:8000"},
+            "CADDY_HTTP_PORT": 81,
+        }
+        self.assertEqual(
+            loadtest.get_layer_url(configs, "direct", "LMS_HOST", "learn.example.com"),
+            "http://lms:8000",
+        )
+        self.assertEqual(
+            loadtest.get_layer_url(configs, "caddy", "LMS_HOST", "learn.example.com"),
+            "http://127.0.0.1:81",
+        )
+        self.assertEqual(
+            loadtest.get_layer_url(configs, "tunnel", "LMS_HOST", "learn.example.com"),
+            "https://learn.example.com",
+        )
+        with self.assertRaises(TutorError):
+            loadtest.get_layer_url(
+                configs, "direct", "DISCOVERY_HOST", "discovery.example.com"
+            )
+        self.assertEqual(
+            loadtest.replace_host("http://lms:8000/heartbeat", "172.18.0.5"),
+            "http://172.18.0.5:8000/heartbeat",
+        )
+        self.assertEqual(loadtest.replace_host("http://mfe", "172.18.0.6"), "http://172.18.0.6")
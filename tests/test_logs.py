@@ -0,0 +1,151 @@
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from click.testing import CliRunner
+
+from tutorcloudflared import cli, logs
+
+
+def log_line(time, message, **fields):
+    return (
+        json.dumps({"level": "debug", "time": time, "message": message, **fields})
+        + "\n"
+    )
+
+
+def request_lines(time, response_time, ray, host="learn.example.com", status="200 OK"):
+    return [
+        log_line(time, f"GET https://{host}/courses HTTP/1.1", cfRay=ray),
+        log_line(response_time, status, cfRay=ray),
+    ]
+
+
+class LogAnalyzerTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        # A segment that was rotated, then compressed, and the current file, in
+        # the log directory of a connector
+        os.mkdir(self.path("cloudflared"))
+        with gzip.open(
+            self.path("cloudflared", "cloudflared-2024-05-01T12-00-30.000.log.gz"),
+            "wt",
+            encoding="utf-8",
+        ) as f:
+            f.writelines(
+                request_lines("2024-05-01T12:00:01Z", "2024-05-01T12:00:01.050Z", "a")
+                + request_lines("2024-05-01T12:00:02Z", "2024-05-01T12:00:02.100Z", "b")
+            )
+        with open(self.path("cloudflared", "cloudflared.log"), "w", encoding="utf-8") as f:
+            f.writelines(
+                ["not json\n"]
+                + request_lines(
+                    "2024-05-01T12:01:05.000000001Z",
+                    "2024-05-01T12:01:05.500Z",
+                    "c",
+                    host="studio.example.com",
+                    status="502 Bad Gateway",
+                )
+                + [
+                    log_line(
+                        "2024-05-01T12:01:06Z",
+                        "Request failed",
+                        level="error",
+                        originService="http://caddy",
+                        dest="https://studio.example.com/",
+                    ),
+                    log_line("2024-05-01T12:01:07Z", "Retrying connection in up to 2s"),
+                ]
+            )
+
+    def path(self, *parts):
+        return os.path.join(self.directory.name, *parts)
+
+    def analyze(self, window=60):
+        paths = logs.get_log_files(self.directory.name)
+        events = logs.merge_events(
+            [logs.parse_events(logs.read_lines(path)) for path in paths]
+        )
+        analyzer = logs.LogAnalyzer(window)
+        windows = [w.to_dict() for w in analyzer.feed(events)]
+        windows.append(analyzer.flush().to_dict())
+        return windows, analyzer.total.to_dict()
+
+    def test_windows(self):
+        windows, total = self.analyze()
+        self.assertEqual(
+            [w["start"] for w in windows],
+            ["2024-05-01T12:00:00+00:00", "2024-05-01T12:01:00+00:00"],
+        )
+        first, second = windows
+        lms = first["hosts"]["learn.example.com"]
+        self.assertEqual(lms["requests"], 2)
+        self.assertEqual(lms["statuses"], {"200": 2})
+        self.assertTrue(45 <= lms["latency_ms"]["p50"] <= 110)
+        studio = second["hosts"]["studio.example.com"]
+        self.assertEqual(studio["statuses"], {"502": 1})
+        self.assertEqual(studio["origin_errors"], 1)
+        self.assertEqual(second["reconnects"], 1)
+        self.assertEqual(total["requests"], 3)
+        self.assertEqual(total["duration"], 120)
+        self.assertIn(
+            "2024-05-01T12:01:00+00:00 (60s): 1 requests (502:1)",
+            logs.format_window(second)[0],
+        )
+
+    def test_pending_requests_are_bounded(self):
+        analyzer = logs.LogAnalyzer(60, max_pending=10)
+        events = logs.parse_events(
+            log_line(
+                f"2024-05-01T12:00:{i % 60:02d}Z",
+                "GET https://a.example.com/ HTTP/1.1",
+                cfRay=str(i),
+            )
+            for i in range(100)
+        )
+        list(analyzer.feed(sorted(events, key=lambda e: e["_time"])))
+        self.assertEqual(len(analyzer._pending), 10)
+
+    def test_parse_time(self):
+        self.assertEqual(logs.parse_time("2024-05-01T12:00:00Z"), 1714564800)
+        self.assertEqual(logs.parse_time("2024-05-01T14:00:00.5+02:00"), 1714564800.5)
+        self.assertIsNone(logs.parse_time("yesterday"))
+
+    def test_log_files(self):
+        paths = logs.get_log_files(self.directory.name)
+        self.assertEqual(
+            [os.path.relpath(path, self.directory.name) for path in paths],
+            ["cloudflared/cloudflared-2024-05-01T12-00-30.000.log.gz", "cloudflared/cloudflared.log"],
+        )
+        self.assertTrue(logs.is_rotated("logs/cloudflared/cloudflared-2024-05-01T12-00-30.000.log"))
+        self.assertFalse(logs.is_rotated("logs/cloudflared-2/cloudflared.log"))
+
+    def test_follow(self):
+        path = self.path("cloudflared", "cloudflared.log")
+        lines = logs.follow_lines([path], interval=0.01)
+        self.assertEqual(next(lines), "")
+
+        def append():
+            time.sleep(0.05)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(log_line("2024-05-01T12:02:00Z", "partial"))
+
+        threading.Thread(target=append).start()
+        line = next(line for line in lines if line)
+        self.assertIn('"partial"', line)
+        lines.close()
+
+    def test_command(self):
+        result = CliRunner().invoke(
+            cli.analyze,
+            [*logs.get_log_files(self.directory.name), "--format", "json"],
+            obj=None,
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+        windows = [json.loads(line) for line in result.output.splitlines()]
+        self.assertEqual([w["requests"] for w in windows], [2, 1])
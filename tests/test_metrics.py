@@ -0,0 +1,128 @@
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tutorcloudflared import metrics
+
+# Recorded from a cloudflared connector, trimmed
+RECORDED_METRICS = """# HELP cloudflared_tunnel_total_requests Amount of requests proxied through all the tunnels
+# TYPE cloudflared_tunnel_total_requests counter
+cloudflared_tunnel_total_requests {requests}
+# HELP cloudflared_tunnel_request_errors Amount of errors due to proxying request
+# TYPE cloudflared_tunnel_request_errors counter
+cloudflared_tunnel_request_errors {errors}
+# HELP cloudflared_tunnel_concurrent_requests_per_tunnel Concurrent requests proxied through each tunnel
+# TYPE cloudflared_tunnel_concurrent_requests_per_tunnel gauge
+cloudflared_tunnel_concurrent_requests_per_tunnel 3
+# HELP cloudflared_tunnel_ha_connections Number of active ha connections
+# TYPE cloudflared_tunnel_ha_connections gauge
+cloudflared_tunnel_ha_connections 4
+# HELP cloudflared_proxy_connect_latency Time it takes to establish and acknowledge connections in milliseconds
+# TYPE cloudflared_proxy_connect_latency histogram
+cloudflared_proxy_connect_latency_bucket{{le="1"}} 0
+cloudflared_proxy_connect_latency_bucket{{le="10"}} {fast}
+cloudflared_proxy_connect_latency_bucket{{le="100"}} {requests}
+cloudflared_proxy_connect_latency_bucket{{le="+Inf"}} {requests}
+cloudflared_proxy_connect_latency_sum 1234
+cloudflared_proxy_connect_latency_count {requests}
+cloudflared_tunnel_response_by_code{{hostname="studio.example.com",status_code="200"}} 7 1688393475000
+"""
+
+
+class MetricsServer(ThreadingHTTPServer):
+    "Serve recorded metrics, with more requests on each scrape"
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), MetricsHandler)
+        self.scrapes = 0
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.scrapes += 1
+        scrapes = self.server.scrapes
+        body = RECORDED_METRICS.format(
+            requests=100 * scrapes, errors=2 * scrapes, fast=50 * scrapes
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class MetricsTests(unittest.TestCase):
+    def setUp(self):
+        self.server = MetricsServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/metrics"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_parse_metrics(self):
+        samples = list(
+            metrics.parse_metrics(
+                [
+                    "# TYPE x counter",
+                    'x{a="1",b="with \\"quotes\\", and comma"} 2.5 1688393475000',
+                    "y 3",
+                    "invalid",
+                ]
+            )
+        )
+        self.assertEqual(
+            samples,
+            [
+                metrics.Sample("x", {"a": "1", "b": 'with "quotes", and comma'}, 2.5),
+                metrics.Sample("y", {}, 3),
+            ],
+        )
+
+    def test_summarize_scrapes(self):
+        previous = metrics.take_snapshot([self.url])
+        current = metrics.take_snapshot([self.url, self.url])
+        current.timestamp = previous.timestamp + 2
+        summary = metrics.summarize(current, previous)
+        tunnel = summary["hosts"]["tunnel"]
+        # The second snapshot sums two connectors, scraped a 2nd and 3rd time
+        self.assertEqual(tunnel["requests"], 400)
+        self.assertEqual(tunnel["requests_per_second"], 200)
+        self.assertEqual(tunnel["errors"], 8)
+        self.assertEqual(tunnel["error_rate"], 0.02)
+        # Only the concurrent requests gauge is recorded, as a fallback
+        self.assertEqual(tunnel["active_streams"], 6)
+        self.assertEqual(tunnel["origin_connect_latency_ms"]["p50"], 10)
+        self.assertEqual(summary["edge_connections"], 8)
+        self.assertEqual(summary["connectors"], 2)
+        self.assertIn("studio.example.com", summary["hosts"])
+
+    def test_active_streams(self):
+        snapshot = metrics.Snapshot()
+        snapshot.add(
+            [
+                metrics.Sample(metrics.ACTIVE_STREAMS_METRIC, {}, 2),
+                metrics.Sample(metrics.CONCURRENT_REQUESTS_METRIC, {}, 3),
+            ]
+        )
+        snapshot.add([metrics.Sample(metrics.ACTIVE_STREAMS_METRIC, {}, 1)])
+        self.assertEqual(metrics.summarize(snapshot)["hosts"]["tunnel"]["active_streams"], 3)
+        self.assertEqual(
+            metrics.summarize(metrics.Snapshot())["hosts"]["tunnel"]["active_streams"], 0
+        )
+
+    def test_format_summary(self):
+        snapshot = metrics.take_snapshot([self.url])
+        (name, description), *_hosts = metrics.format_summary(metrics.summarize(snapshot))
+        self.assertEqual(name, "tunnel")
+        self.assertIn(", origin connect latency p50 10.0ms", description)
+
+    def test_histogram_quantile(self):
+        buckets = {1.0: 0, 10.0: 50, 100.0: 100, float("inf"): 100}
+        self.assertEqual(metrics.histogram_quantile(0.5, buckets), 10)
+        self.assertEqual(metrics.histogram_quantile(0.9, buckets), 82)
+        self.assertIsNone(metrics.histogram_quantile(0.5, {}))
@@ -0,0 +1,36 @@
+import unittest
+
+from tutor.exceptions import TutorError
+
+from tutorcloudflared import options
+
+
+class TunnelOptionsTests(unittest.TestCase):
+    def test_options(self):
+        tunnel_options = options.get_tunnel_options(
+            {
+                "CLOUDFLARED_PROTOCOL": "quic",
+                "CLOUDFLARED_EDGE_IP_VERSION": 6,
+                "CLOUDFLARED_POST_QUANTUM": True,
+            }
+        )
+        self.assertEqual(
+            tunnel_options,
+            [
+                ("protocol", '"quic"'),
+                ("edge-ip-version", '"6"'),
+                ("post-quantum", "true"),
+                ("loglevel", '"info"'),
+                ("output", '"json"'),
+            ],
+        )
+
+    def test_invalid_options(self):
+        for configs in [
+            {"CLOUDFLARED_PROTOCOL": "h2mux"},
+            {"CLOUDFLARED_EDGE_IP_VERSION": "5"},
+            {"CLOUDFLARED_PROTOCOL": "http2", "CLOUDFLARED_POST_QUANTUM": True},
+            {"CLOUDFLARED_LOG_LEVEL": "verbose"},
+        ]:
+            with self.assertRaises(TutorError):
+                options.get_tunnel_options(configs)
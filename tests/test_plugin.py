@@ -0,0 +1,269 @@
+import os
+import re
+import subprocess
+import sys
+import unittest
+
+import yaml
+from tutor import env, hooks
+from tutor.__about__ import __version__ as tutor_version
+from tutor.exceptions import TutorError
+
+from tutorcloudflared import plugin
+
+# Maximum time, in microseconds, that importing the plugin may add to a tutor
+# command, once tutor itself is loaded.
+IMPORT_TIME_BUDGET = 30000
+# Modules that should only be imported by the commands that need them
+LAZY_MODULES = ["pkg_resources", "requests", "tld"]
+PACKAGE_DIR = os.path.dirname(plugin.__file__)
+REQUIREMENTS_DIR = os.path.join(os.path.dirname(PACKAGE_DIR), "requirements")
+
+
+def run_python(code):
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+class PluginImportTests(unittest.TestCase):
+    def test_import_time_budget(self):
+        result = run_python("import tutor.commands.cli; import tutorcloudflared.plugin")
+        # Lines are formatted as "import time: self [us] | cumulative | imported package"
+        cumulative = [
+            int(line.split("|")[1])
+            for line in result.stderr.splitlines()
+            if line.split("|")[-1] == " tutorcloudflared.plugin"
+        ]
+        self.assertEqual(len(cumulative), 1)
+        self.assertLess(cumulative[0], IMPORT_TIME_BUDGET)
+
+    def test_heavy_modules_are_lazy(self):
+        result = run_python(
+            "import sys, tutor.commands.cli\n"
+            "before = set(sys.modules)\n"
+            "import tutorcloudflared.plugin\n"
+            "print(' '.join(sorted(set(sys.modules) - before)))"
+        )
+        imported = result.stdout.split()
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, imported)
+
+
+class MinimumTutorTests(unittest.TestCase):
+    """
+    requirements/base.txt pins the oldest supported tutor version, which CI
+    installs, and checks that it did, before running the tests. The hooks are
+    checked against the installed tutor, so that in CI the plugin doesn't use
+    hooks that the oldest supported version lacks. Elsewhere, they are only
+    checked against the installed version, which the failure messages name.
+    """
+
+    def test_requirements_pin_minimum_tutor(self):
+        with open(os.path.join(REQUIREMENTS_DIR, "base.in"), encoding="utf-8") as f:
+            minimum = re.search(r"^tutor>=([0-9.]+)", f.read(), re.MULTILINE)
+        with open(os.path.join(REQUIREMENTS_DIR, "base.txt"), encoding="utf-8") as f:
+            pinned = re.search(r"^tutor==([0-9.]+)", f.read(), re.MULTILINE)
+        assert minimum and pinned
+        self.assertTrue(pinned.group(1).startswith(minimum.group(1) + "."))
+
+    def test_hooks_exist(self):
+        for filename in sorted(os.listdir(PACKAGE_DIR)):
+            if not filename.endswith(".py"):
+                continue
+            with open(os.path.join(PACKAGE_DIR, filename), encoding="utf-8") as f:
+                source = f.read()
+            for kind, name in re.findall(r"hooks\.(Filters|Actions)\.([A-Z_]+)", source):
+                with self.subTest(hook=f"{kind}.{name}", module=filename):
+                    self.assertTrue(
+                        hasattr(getattr(hooks, kind), name),
+                        f"{kind}.{name} is missing in tutor {tutor_version}",
+                    )
+
+
+class IterDomainsTests(unittest.TestCase):
+    def test_pairs_skip_undefined_hosts(self):
+        config = {
+            "CLOUDFLARED_PUBLIC_HOSTS": ["LMS_HOST", "DISCOVERY_HOST", "CMS_HOST"],
+            "LMS_HOST": "example.com",
+            "CMS_HOST": "studio.example.com",
+        }
+        rendered = env.render_str(
+            config,
+            "{% for key, value in iter_domains() %}{{ key }}={{ value }} {% endfor %}",
+        )
+        self.assertEqual(rendered, "LMS_HOST=example.com CMS_HOST=studio.example.com ")
+
+
+class InitTaskTests(unittest.TestCase):
+    def test_desired_routes(self):
+        config = {
+            "CLOUDFLARED_TUNNEL_NAME": "openedx",
+            "CLOUDFLARED_DNS_ROUTES_CONCURRENCY": 8,
+            "CLOUDFLARED_PUBLIC_HOSTS": ["LMS_HOST", "CMS_HOST"],
+            "LMS_HOST": "example.com",
+            "CMS_HOST": "studio.example.com",
+        }
+        rendered = env.render_str(config, plugin._read_init_task())
+        # Routes are recorded with the UUID of the tunnel, which changes when it is created again
+        self.assertIn("tunnel_uuid=$(cloudflared tunnel info -o json openedx | ", rendered)
+        self.assertIn("\n$tunnel_uuid example.com\n$tunnel_uuid studio.example.com\nEOF\n", rendered)
+        self.assertIn("xargs -r -n 2 -P 8 ", rendered)
+
+
+class TunnelConfigTests(unittest.TestCase):
+    def test_wildcard_hosts_come_last(self):
+        config = {
+            "CLOUDFLARED_TUNNEL_UUID": "6ff42ae2-765d-4adf-8112-31c55c1551ef",
+            "CLOUDFLARED_PUBLIC_HOSTS": ["LMS_HOST", "CMS_HOST"],
+            "CLOUDFLARED_WILDCARD_HOSTS": ["*.example.com"],
+            "LMS_HOST": "example.com",
+            "CMS_HOST": "studio.example.com",
+        }
+        rendered = env.Renderer(config).render_template("cloudflared/apps/config.yml")
+        tunnel_config = yaml.safe_load(rendered)
+        self.assertEqual(tunnel_config["protocol"], "auto")
+        self.assertEqual(tunnel_config["edge-ip-version"], "4")
+        self.assertIs(tunnel_config["post-quantum"], False)
+        ingress = tunnel_config["ingress"]
+        self.assertEqual(
+            [rule.get("hostname") for rule in ingress],
+            ["example.com", "studio.example.com", "*.example.com", None],
+        )
+        self.assertEqual(ingress[2]["originRequest"], {"matchSNItoHost": True})
+
+        config["CLOUDFLARED_TUNNEL_NAME"] = "openedx"
+        config["CLOUDFLARED_DNS_ROUTES_CONCURRENCY"] = 4
+        rendered = env.render_str(config, plugin._read_init_task())
+        self.assertIn("\n$tunnel_uuid example.com\n$tunnel_uuid *.example.com\nEOF\n", rendered)
+
+
+class ComposeServicesTests(unittest.TestCase):
+    def render_services(self, **config):
+        patch = dict(plugin._read_patches())["local-docker-compose-services"]
+        config = {
+            "CLOUDFLARED_DOCKER_IMAGE": "cloudflared",
+            "CLOUDFLARED_TUNNEL_NAME": "openedx",
+            "CLOUDFLARED_METRICS_PORT": 20241,
+            "CLOUDFLARED_METRICS_HOST": "127.0.0.1",
+            "CLOUDFLARED_HA_CONNECTIONS": 2,
+            "CLOUDFLARED_LOG_FILE": False,
+            **config,
+        }
+        return yaml.safe_load(env.render_str(config, patch))
+
+    def test_replicas(self):
+        services = self.render_services(CLOUDFLARED_REPLICAS=3)
+        self.assertEqual(list(services), ["cloudflared", "cloudflared-2", "cloudflared-3"])
+        self.assertEqual(
+            services["cloudflared-3"]["command"],
+            "cloudflared tunnel --metrics 0.0.0.0:20243 --ha-connections 2 run openedx",
+        )
+        logging_services = self.render_services(
+            CLOUDFLARED_REPLICAS=2, CLOUDFLARED_LOG_FILE=True
+        )
+        self.assertIn(
+            " --log-directory /root/.cloudflared/logs/cloudflared-2 run openedx",
+            logging_services["cloudflared-2"]["command"],
+        )
+        self.assertEqual(services["cloudflared-3"]["ports"], ["127.0.0.1:20243:20243"])
+        services = self.render_services(CLOUDFLARED_REPLICAS=1, CLOUDFLARED_METRICS_HOST="")
+        self.assertNotIn("ports", services["cloudflared"])
+
+    def test_invalid_replicas(self):
+        with self.assertRaises(TutorError):
+            self.render_services(CLOUDFLARED_REPLICAS=0)
+
+
+    def test_tunnels(self):
+        services = self.render_services(
+            CLOUDFLARED_REPLICAS=1,
+            CLOUDFLARED_PUBLIC_HOSTS=["LMS_HOST"],
+            CLOUDFLARED_TUNNELS={"openedx-lms": ["LMS_HOST"]},
+            CLOUDFLARED_TUNNEL_UUIDS={"openedx-lms": "0b2e40c2-ee07-4b0b-a0ea-3e1d0e1a0b5c"},
+        )
+        self.assertEqual(list(services), ["cloudflared", "cloudflared-openedx-lms"])
+        self.assertEqual(
+            services["cloudflared"]["command"],
+            "cloudflared tunnel --metrics 0.0.0.0:20241 --ha-connections 2 run openedx",
+        )
+        self.assertEqual(
+            services["cloudflared-openedx-lms"]["command"],
+            "cloudflared tunnel --metrics 0.0.0.0:20242 --ha-connections 2 run"
+            " --credentials-file /root/.cloudflared/0b2e40c2-ee07-4b0b-a0ea-3e1d0e1a0b5c.json openedx-lms",
+        )
+        self.assertIn(
+            "../plugins/cloudflared/apps/config.yml:/root/.cloudflared/config.yml",
+            services["cloudflared-openedx-lms"]["volumes"],
+        )
+
+
+class TunnelsTests(unittest.TestCase):
+    config = {
+        "CLOUDFLARED_TUNNEL_NAME": "openedx",
+        "CLOUDFLARED_TUNNEL_UUID": "6ff42ae2-765d-4adf-8112-31c55c1551ef",
+        "CLOUDFLARED_TUNNELS": {"openedx-lms": ["LMS_HOST"]},
+        "CLOUDFLARED_TUNNEL_UUIDS": {"openedx-lms": "0b2e40c2-ee07-4b0b-a0ea-3e1d0e1a0b5c"},
+        "CLOUDFLARED_DNS_ROUTES_CONCURRENCY": 4,
+        "CLOUDFLARED_PUBLIC_HOSTS": ["LMS_HOST", "CMS_HOST"],
+        "CLOUDFLARED_WILDCARD_HOSTS": ["*.example.com"],
+        "LMS_HOST": "example.com",
+        "CMS_HOST": "studio.example.com",
+    }
+
+    def test_config(self):
+        # All tunnels share the ingress rules of config.yml, DNS routes each host to its tunnel
+        config = yaml.safe_load(
+            env.Renderer(self.config).render_template("cloudflared/apps/config.yml")
+        )
+        self.assertEqual(config["tunnel"], "6ff42ae2-765d-4adf-8112-31c55c1551ef")
+        self.assertEqual(
+            [rule.get("hostname") for rule in config["ingress"]],
+            ["example.com", "studio.example.com", "*.example.com", None],
+        )
+
+    def test_init_task(self):
+        rendered = env.render_str(self.config, plugin._read_init_task())
+        self.assertIn("cloudflared tunnel create openedx\n", rendered)
+        self.assertIn("cloudflared tunnel create openedx-lms\n", rendered)
+        self.assertIn("info -o json openedx | grep -oE '\"id\": *\"[0-9a-f-]+\"' | head -n 1 | cut -d '\"' -f 4)", rendered)
+        self.assertIn("info -o json openedx-lms | grep", rendered)
+        self.assertIn("\n$tunnel_uuid *.example.com\nEOF\n", rendered)
+        self.assertIn("\n$tunnel_uuid example.com\nEOF\n", rendered)
+        self.assertIn('echo "openedx-lms $tunnel_uuid" >> "$tunnel_uuids.tmp"\n', rendered)
+
+
+class DockerfileTests(unittest.TestCase):
+    def test_pinned_version_and_base_images(self):
+        config = {
+            "CLOUDFLARED_CONNECTOR_VERSION": "2024.12.2",
+            "CLOUDFLARED_RUNTIME_IMAGE": "registry.local/alpine:3.20",
+            "CLOUDFLARED_BUILDER_IMAGE": "registry.local/debian:bookworm-slim",
+        }
+        rendered = env.Renderer(config).render_template(
+            "cloudflared/build/cloudflared/Dockerfile"
+        )
+        self.assertIn("ARG CLOUDFLARED_CONNECTOR_VERSION=2024.12.2\n", rendered)
+        self.assertIn("FROM registry.local/debian:bookworm-slim AS package-local\n", rendered)
+        self.assertIn("FROM registry.local/alpine:3.20\n", rendered)
+        self.assertNotIn("jq", rendered)
+
+    def test_dist_build_context(self):
+        mounts = hooks.Filters.IMAGES_BUILD_MOUNTS.apply([], "/home/ci/cloudflared-dist")
+        self.assertIn(("cloudflared", "cloudflared-dist"), mounts)
+        self.assertEqual(hooks.Filters.IMAGES_BUILD_MOUNTS.apply([], "/home/ci/dist"), [])
+
+    def test_image_is_qualified_with_the_registry(self):
+        defaults = dict(hooks.Filters.CONFIG_DEFAULTS.iterate())
+        config = {**defaults, "DOCKER_REGISTRY": "registry.local/"}
+        self.assertEqual(
+            env.render_unknown(config, defaults["CLOUDFLARED_DOCKER_IMAGE"]),
+            "registry.local/ghassanmas/cloudflared:2024.12.2",
+        )
+        self.assertIn(
+            ("cloudflared", "{{ CLOUDFLARED_DOCKER_IMAGE }}"),
+            list(hooks.Filters.IMAGES_PUSH.iterate()),
+        )
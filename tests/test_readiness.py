@@ -0,0 +1,106 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from click.testing import CliRunner
+from tutor.exceptions import TutorError
+
+from tutorcloudflared import cli, readiness
+
+
+class ReadyHandler(BaseHTTPRequestHandler):
+    "Report the connector as ready from the second request on"
+
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        connections = 4 if self.requests > 1 else 0
+        body = json.dumps({"status": 200 if connections else 503, "readyConnections": connections}).encode()
+        self.send_response(200 if connections else 503)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class WaitReadyTests(unittest.TestCase):
+    def test_wait_ready(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), type("Handler", (ReadyHandler,), {}))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f"http://127.0.0.1:{server.server_address[1]}/ready"
+        self.assertEqual(readiness.wait_ready(url, timeout=2, interval=0.05), 4)
+
+    def test_timeout(self):
+        with self.assertRaises(TutorError):
+            readiness.wait_ready("http://127.0.0.1:9/ready", timeout=0.2, interval=0.05)
+
+
+class ConnectionsHandler(BaseHTTPRequestHandler):
+    "Always report the same number of ready connections"
+
+    connections = 2
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        body = json.dumps({"readyConnections": self.connections}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(test, handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), type("Handler", (handler,), {}))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    return server
+
+
+class WaitAllReadyTests(unittest.TestCase):
+    def test_all_ready(self):
+        servers = [start_server(self, ReadyHandler), start_server(self, ConnectionsHandler)]
+        urls = [f"http://127.0.0.1:{s.server_address[1]}/ready" for s in servers]
+        connections = readiness.wait_all_ready(urls, timeout=2, interval=0.05)
+        self.assertEqual(connections, {urls[0]: 4, urls[1]: 2})
+
+    def test_min_connections_and_backoff(self):
+        server = start_server(self, ConnectionsHandler)
+        url = f"http://127.0.0.1:{server.server_address[1]}/ready"
+        with self.assertRaises(TutorError) as context:
+            readiness.wait_all_ready(
+                [url, "http://127.0.0.1:9/ready"],
+                timeout=0.6,
+                interval=0.05,
+                min_connections=4,
+            )
+        message = str(context.exception)
+        self.assertIn("2 out of 2 connector(s) were not ready", message)
+        self.assertIn("only 2 out of 4 connection(s) are ready", message)
+        # 0.05, 0.1, 0.2, 0.25 then the deadline, instead of 12 polls without backoff
+        self.assertLessEqual(server.RequestHandlerClass.requests, 6)
+
+    def test_command(self):
+        server = start_server(self, ConnectionsHandler)
+        url = f"http://127.0.0.1:{server.server_address[1]}/ready"
+        runner = CliRunner()
+        result = runner.invoke(
+            cli.wait_ready_command, ["--url", url, "--timeout", "1"], obj=None
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+        result = runner.invoke(
+            cli.wait_ready_command,
+            ["--url", url, "--timeout", "0.3", "--min-connections", "4"],
+            obj=None,
+        )
+        self.assertNotEqual(result.exit_code, 0)
@@ -0,0 +1,175 @@
+import json
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from tutor.exceptions import TutorError
+
+from tutorcloudflared import resolvers
+
+NAMESERVERS = ["ada.ns.cloudflare.com", "bob.ns.cloudflare.com"]
+
+
+def build_response(query: bytes, rcode: int = 0, truncated: bool = False) -> bytes:
+    "Answer an NS query, with compressed names as real resolvers do"
+    (query_id,) = struct.unpack_from("!H", query)
+    question = query[12:]
+    flags = 0x8180 | rcode | (0x0200 if truncated else 0)
+    answers = [] if rcode or truncated else NAMESERVERS
+    response = struct.pack("!HHHHHH", query_id, flags, 1, len(answers), 0, 0) + question
+    # Offset of the "ns.cloudflare.com" suffix of the first answer, that the next ones point to
+    suffix_offset = len(response) + 12 + 4
+    for index, nameserver in enumerate(answers):
+        labels = nameserver.split(".")
+        if index == 0:
+            # The ".cloudflare.com" suffix points to the question
+            rdata = b"".join(bytes([len(l)]) + l.encode() for l in labels[:2]) + b"\xc0\x0c"
+        else:
+            rdata = bytes([len(labels[0])]) + labels[0].encode() + struct.pack("!H", 0xC000 | suffix_offset)
+        response += b"\xc0\x0c" + struct.pack("!HHIH", 2, 1, 300 - index, len(rdata)) + rdata
+    return response
+
+
+class DNSServer:
+    "A stand-in recursive resolver for cloudflare.com, over UDP and TCP"
+
+    def __init__(self, truncate: bool = False, drop: int = 0, rcode: int = 0, cut: bool = False):
+        self.truncate = truncate
+        # Send truncated responses whose answer records are cut off
+        self.cut = cut
+        self.drop = drop
+        self.rcode = rcode
+        self.udp_queries = 0
+        self.tcp_queries = 0
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp.bind(("127.0.0.1", 0))
+        self.port = self.udp.getsockname()[1]
+        self.tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.tcp.bind(("127.0.0.1", self.port))
+        self.tcp.listen()
+        threading.Thread(target=self.serve_udp, daemon=True).start()
+        threading.Thread(target=self.serve_tcp, daemon=True).start()
+
+    def serve_udp(self):
+        while True:
+            try:
+                query, address = self.udp.recvfrom(512)
+            except OSError:
+                return
+            self.udp_queries += 1
+            if self.udp_queries <= self.drop:
+                continue
+            if self.cut:
+                response = bytearray(build_response(query, self.rcode))
+                response[2] |= 0x02
+                self.udp.sendto(bytes(response[:-12]), address)
+            else:
+                self.udp.sendto(build_response(query, self.rcode, self.truncate), address)
+
+    def serve_tcp(self):
+        while True:
+            try:
+                connection, _address = self.tcp.accept()
+            except OSError:
+                return
+            with connection:
+                self.tcp_queries += 1
+                (length,) = struct.unpack("!H", connection.recv(2))
+                response = build_response(connection.recv(length), self.rcode)
+                connection.sendall(struct.pack("!H", len(response)) + response)
+
+    def close(self):
+        self.udp.close()
+        self.tcp.close()
+
+
+class DNSResolverTests(unittest.TestCase):
+    def resolver(self, **kwargs):
+        server = DNSServer(**kwargs)
+        self.addCleanup(server.close)
+        return server, resolvers.DNSResolver(["127.0.0.1"], port=server.port, attempt_timeout=0.2)
+
+    def test_udp(self):
+        server, resolver = self.resolver()
+        started = time.monotonic()
+        self.assertEqual(resolver.lookup_ns("cloudflare.com"), (NAMESERVERS, 299))
+        self.assertLess(time.monotonic() - started, 0.1)
+        self.assertEqual((server.udp_queries, server.tcp_queries), (1, 0))
+
+    def test_tcp_fallback(self):
+        server, resolver = self.resolver(truncate=True)
+        self.assertEqual(resolver.lookup_ns("cloudflare.com"), (NAMESERVERS, 299))
+        self.assertEqual((server.udp_queries, server.tcp_queries), (1, 1))
+
+    def test_tcp_fallback_of_cut_off_response(self):
+        server, resolver = self.resolver(cut=True)
+        started = time.monotonic()
+        self.assertEqual(resolver.lookup_ns("cloudflare.com"), (NAMESERVERS, 299))
+        self.assertLess(time.monotonic() - started, 0.1)
+        self.assertEqual((server.udp_queries, server.tcp_queries), (1, 1))
+
+    def test_retries(self):
+        server, resolver = self.resolver(drop=2)
+        self.assertEqual(resolver.lookup_ns("cloudflare.com")[0], NAMESERVERS)
+        self.assertEqual(server.udp_queries, 3)
+
+    def test_errors(self):
+        _server, resolver = self.resolver(rcode=resolvers.NXDOMAIN)
+        self.assertEqual(resolver.lookup_ns("cloudflare.com"), ([], 0))
+        _server, resolver = self.resolver(rcode=2)
+        with self.assertRaises(resolvers.ResolverError):
+            resolver.lookup_ns("cloudflare.com")
+        _server, resolver = self.resolver(drop=10)
+        with self.assertRaises(resolvers.ResolverError):
+            resolver.lookup_ns("cloudflare.com", timeout=0.5)
+
+    def test_read_resolv_conf(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "resolv.conf")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("# comment\nsearch example.com\nnameserver 10.0.0.2\nnameserver fe80::1%eth0\n")
+            self.assertEqual(resolvers.read_resolv_conf(path), ["10.0.0.2", "fe80::1"])
+            self.assertEqual(resolvers.read_resolv_conf(os.path.join(directory, "missing")), ["127.0.0.1"])
+
+    def test_doh_query(self):
+        queries = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                queries.append(parse_qs(urlsplit(self.path).query))
+                body = json.dumps(
+                    {"Status": 0, "Answer": [{"data": f"{n}.", "TTL": 300} for n in NAMESERVERS]}
+                ).encode()
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        resolver = resolvers.DoHResolver(f"http://127.0.0.1:{server.server_address[1]}/resolve")
+        self.assertEqual(resolver.lookup_ns("example.com&type=A"), (NAMESERVERS, 300))
+        self.assertEqual(queries, [{"name": ["example.com&type=A"], "type": ["NS"]}])
+
+    def test_resolver_is_abstract(self):
+        with self.assertRaises(TypeError):
+            resolvers.Resolver()
+
+    def test_get_resolver(self):
+        resolver = resolvers.get_resolver({"CLOUDFLARED_DNS_RESOLVER": "dns", "CLOUDFLARED_DNS_NAMESERVERS": ["10.0.0.2"]})
+        self.assertEqual(resolver.nameservers, ["10.0.0.2"])
+        self.assertIsInstance(resolvers.get_resolver({}), resolvers.DoHResolver)
+        with self.assertRaises(TutorError):
+            resolvers.get_resolver({"CLOUDFLARED_DNS_RESOLVER": "smoke-signals"})
@@ -0,0 +1,96 @@
+import json
+import os
+import tempfile
+import unittest
+
+from tutor.exceptions import TutorError
+
+from tutorcloudflared import tunnels
+
+UUID = "6ff42ae2-765d-4adf-8112-31c55c1551ef"
+OTHER_UUID = "0b2e40c2-ee07-4b0b-a0ea-3e1d0e1a0b5c"
+
+
+class FindTunnelUUIDTests(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.credentials_dir = tunnels.get_credentials_dir(self.root.name)
+        os.makedirs(self.credentials_dir)
+
+    def tearDown(self):
+        self.root.cleanup()
+
+    def write(self, filename, content):
+        with open(os.path.join(self.credentials_dir, filename), "w", encoding="utf-8") as f:
+            f.write(content)
+
+    def test_single_credentials_file(self):
+        self.write("cert.pem", "not json")
+        self.write(f"{UUID}.json", json.dumps({"AccountTag": "a", "TunnelSecret": "s", "TunnelID": UUID}))
+        self.assertEqual(tunnels.find_tunnel_uuid(self.root.name, "openedx"), UUID)
+
+    def test_recorded_uuids(self):
+        self.write(f"{UUID}.json", json.dumps({"AccountTag": "a", "TunnelSecret": "s", "TunnelID": UUID}))
+        self.write(f"{OTHER_UUID}.json", json.dumps({"AccountTag": "a", "TunnelSecret": "s", "TunnelID": OTHER_UUID}))
+        self.write("tunnel-uuids", f"openedx {UUID}\nopenedx-lms {OTHER_UUID}\n")
+        self.assertEqual(tunnels.find_tunnel_uuid(self.root.name, "openedx"), UUID)
+        self.assertEqual(tunnels.find_tunnel_uuid(self.root.name, "openedx-lms"), OTHER_UUID)
+        self.assertIsNone(tunnels.find_tunnel_uuid(self.root.name, "missing"))
+
+    def test_recorded_uuid_without_credentials(self):
+        # e.g the tunnel was created on another machine
+        self.write(f"{UUID}.json", json.dumps({"TunnelID": UUID}))
+        self.write("tunnel-uuids", f"openedx {OTHER_UUID}\n")
+        self.assertIsNone(tunnels.find_tunnel_uuid(self.root.name, "openedx"))
+
+    def test_unreadable_credentials(self):
+        # Credentials files are only readable by the container user
+        self.write(f"{UUID}.json", "")
+        os.chmod(os.path.join(self.credentials_dir, f"{UUID}.json"), 0)
+        self.write("tunnel-uuids", f"openedx {UUID}\n")
+        self.assertEqual(tunnels.find_tunnel_uuid(self.root.name, "openedx"), UUID)
+
+    def test_ambiguous_credentials(self):
+        self.write(f"{UUID}.json", json.dumps({"TunnelID": UUID}))
+        self.write(f"{OTHER_UUID}.json", json.dumps({"TunnelID": OTHER_UUID}))
+        self.assertIsNone(tunnels.find_tunnel_uuid(self.root.name, "openedx"))
+
+
+class ConnectorsTests(unittest.TestCase):
+    configs = {
+        "CLOUDFLARED_TUNNEL_NAME": "openedx",
+        "CLOUDFLARED_TUNNEL_UUID": UUID,
+        "CLOUDFLARED_PUBLIC_HOSTS": ["LMS_HOST", "CMS_HOST"],
+        "CLOUDFLARED_TUNNELS": {"openedx-lms": ["LMS_HOST"]},
+        "CLOUDFLARED_TUNNEL_UUIDS": {"openedx-lms": OTHER_UUID},
+        "CLOUDFLARED_TUNNEL_REPLICAS": {"openedx-lms": 2},
+        "CLOUDFLARED_REPLICAS": 1,
+        "CLOUDFLARED_METRICS_PORT": 20241,
+    }
+
+    def test_tunnels(self):
+        default, lms = tunnels.get_tunnels(self.configs)
+        self.assertEqual(default, tunnels.Tunnel("openedx", UUID, ["CMS_HOST"], 1, ""))
+        self.assertEqual(
+            lms, tunnels.Tunnel("openedx-lms", OTHER_UUID, ["LMS_HOST"], 2, "-openedx-lms")
+        )
+
+    def test_connectors(self):
+        connectors = tunnels.get_connectors(self.configs)
+        self.assertEqual(
+            [(c.service, c.metrics_port, c.tunnel.name) for c in connectors],
+            [
+                ("cloudflared", 20241, "openedx"),
+                ("cloudflared-openedx-lms", 20242, "openedx-lms"),
+                ("cloudflared-openedx-lms-2", 20243, "openedx-lms"),
+            ],
+        )
+
+    def test_clashing_services(self):
+        for tunnels_setting in [{"job": []}, {"lms": ["LMS_HOST"], "lms-2": ["CMS_HOST"]}]:
+            with self.assertRaises(TutorError):
+                tunnels.get_connectors(
+                    {**self.configs, "CLOUDFLARED_TUNNELS": tunnels_setting, "CLOUDFLARED_TUNNEL_REPLICAS": {"lms": 2}}
+                )
+        with self.assertRaises(TutorError):
+            tunnels.get_connectors({**self.configs, "CLOUDFLARED_TUNNEL_REPLICAS": {"openedx-lms": 0}})
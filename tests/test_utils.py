@@ -1,7 +1,41 @@
 import unittest
+from unittest import mock
 
 from tutorcloudflared import utils
 
 class UtilsTests(unittest.TestCase):
     def test_get_root_domain(self):
         self.assertEqual(utils.get_first_level_domain("one.two.example.com"),"example.com")
+
+    def test_check_ns(self):
+        response = mock.Mock()
+        response.json.return_value = {
+            "Status": 0,
+            "Answer": [
+                {"name": "example.com.", "type": 2, "data": "adam.ns.cloudflare.com."},
+                {"name": "example.com.", "type": 2, "data": "eve.ns.cloudflare.com."},
+            ],
+        }
+        with mock.patch.object(utils, "get_session") as get_session:
+            get_session.return_value.get.return_value = response
+            self.assertTrue(utils.check_ns("lms.example.com"))
+            response.json.return_value["Answer"][1]["data"] = "ns1.example.net."
+            self.assertFalse(utils.check_ns("lms.example.com"))
+
+    def test_parse_host(self):
+        parsed = utils.parse_host("two.one.example.co.uk")
+        self.assertEqual(parsed.subdomains, ("two", "one"))
+        self.assertEqual(parsed.first_level_domain, "example.co.uk")
+        self.assertEqual(parsed.depth, 2)
+        self.assertIs(parsed, utils.parse_host("two.one.example.co.uk"))
+        self.assertFalse(utils.parse_host("localhost").valid)
+        self.assertEqual(utils.strip_out_subdomains_if_needed("example.com"), "example.com")
+        self.assertEqual(utils.strip_out_subdomains_if_needed("two.one.example.co.uk"), "two.example.co.uk")
+
+    def test_host_index(self):
+        index = utils.HostIndex(
+            {"LMS_HOST": "example.com", "CMS_HOST": "studio.example.com", "MFE_HOST": "apps.example.org"}
+        )
+        self.assertEqual(index.by_domain, {"example.com": ["LMS_HOST", "CMS_HOST"], "example.org": ["MFE_HOST"]})
+        self.assertFalse(index.is_same_domain())
+        self.assertEqual(index.get_conflicted_hosts("example.com"), {"MFE_HOST": "apps.example.org"})
@@ -0,0 +1,96 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tutorcloudflared import warmup
+
+
+class OriginHandler(BaseHTTPRequestHandler):
+    "A cold origin: the first request of each host and path is slow"
+
+    protocol_version = "HTTP/1.1"
+    lock = threading.Lock()
+    seen = set()
+    active = 0
+    max_active = 0
+
+    def do_GET(self):
+        cls = type(self)
+        key = (self.headers["Host"], self.path)
+        with cls.lock:
+            cold = key not in cls.seen
+            cls.seen.add(key)
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        time.sleep(0.1 if cold else 0)
+        with cls.lock:
+            cls.active -= 1
+        status = 500 if self.path == "/broken" else 200
+        body = f"{self.headers['Host']}{self.path}".encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class WarmupTests(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(
+            ("127.0.0.1", 0), type("Handler", (OriginHandler,), {"seen": set()})
+        )
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.origin = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def test_targets(self):
+        configs = {
+            "CLOUDFLARED_PUBLIC_HOSTS": ["LMS_HOST", "CMS_HOST", "DISCOVERY_HOST"],
+            "LMS_HOST": "learn.example.com",
+            "CMS_HOST": "studio.example.com",
+            "CLOUDFLARED_WARMUP_PATHS": {"LMS_HOST": ["/", "/courses"]},
+        }
+        self.assertEqual(
+            warmup.get_targets(configs),
+            [
+                ("LMS_HOST", "learn.example.com", "/"),
+                ("LMS_HOST", "learn.example.com", "/courses"),
+                ("CMS_HOST", "studio.example.com", "/"),
+            ],
+        )
+
+    def test_warmup(self):
+        targets = [
+            warmup.Target("LMS_HOST", "learn.example.com", f"/page{i}") for i in range(6)
+        ] + [warmup.Target("CMS_HOST", "studio.example.com", "/broken")]
+        results = warmup.warmup(targets, self.origin, concurrency=2)
+        self.assertEqual([r.target for r in results], targets)
+        handler = self.server.RequestHandlerClass
+        self.assertEqual(
+            handler.seen,
+            {("learn.example.com", f"/page{i}") for i in range(6)}
+            | {("studio.example.com", "/broken")},
+        )
+        self.assertLessEqual(handler.max_active, 2)
+        for result in results[:-1]:
+            self.assertFalse(result.failed)
+            self.assertGreaterEqual(result.before, 0.1)
+            self.assertLess(result.after, result.before)
+        self.assertTrue(results[-1].failed)
+        self.assertIn("learn.example.com/page0: 200, before ", warmup.format_result(results[0]))
+
+    def test_unreachable_origin(self):
+        target = warmup.Target("LMS_HOST", "learn.example.com", "/")
+        (result,) = warmup.warmup([target], "http://127.0.0.1:9", timeout=1)
+        self.assertTrue(result.failed)
+        self.assertIsNone(warmup.to_dict(result)["after_ms"])
+
+    def test_server_name(self):
+        adapter = warmup.OriginAdapter("learn.example.com", 4)
+        self.assertEqual(
+            adapter.poolmanager.connection_pool_kw["server_hostname"], "learn.example.com"
+        )
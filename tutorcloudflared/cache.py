@@ -0,0 +1,97 @@
+"On-disk cache of NS lookups"
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from .constants import NS_CACHE_MAX_ENTRIES
+
+
+class NSCache:
+    """
+    A small JSON file that remembers the result of NS checks until their TTL
+    expires. Entries are kept in least recently used order, so that the
+    oldest ones are evicted once there are more than `max_entries`.
+
+    Errors while reading or writing the file are ignored, and malformed
+    entries, e.g edited by hand, are dropped: the cache is only an optimization
+    and must never make the doctor fail.
+    """
+
+    def __init__(
+        self, path: str, max_entries: int = NS_CACHE_MAX_ENTRIES, refresh: bool = False
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        # When refreshing, cached entries are never read but fresh results are stored
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        # Whether the entries, or their order, changed since the file was saved
+        self._changed = False
+        try:
+            with open(path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(entries, dict):
+            self._changed = True
+            return
+        for domain, entry in entries.items():
+            if _is_valid(entry):
+                self._entries[domain] = entry
+            else:
+                self._changed = True
+
+    def get(self, domain: str) -> Optional[bool]:
+        "Return the cached result for a domain, or None if missing or expired"
+        if self.refresh:
+            return None
+        with self._lock:
+            entry = self._entries.get(domain)
+            if entry is None:
+                return None
+            self._changed = True
+            if entry["expires"] <= time.time():
+                del self._entries[domain]
+                return None
+            self._entries.move_to_end(domain)
+            return bool(entry["value"])
+
+    def set(self, domain: str, value: bool, ttl: int) -> None:
+        "Store the result for a domain for `ttl` seconds, and save the cache"
+        with self._lock:
+            self._entries[domain] = {"value": value, "expires": time.time() + ttl}
+            self._entries.move_to_end(domain)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def save(self) -> None:
+        "Save the cache if it changed, e.g the order of the entries that were read"
+        with self._lock:
+            if self._changed:
+                self._save()
+
+    def _save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+            self._changed = False
+        except OSError:
+            pass
+
+
+def _is_valid(entry: Any) -> bool:
+    if not isinstance(entry, dict) or "value" not in entry:
+        return False
+    expires = entry.get("expires")
+    return isinstance(expires, (int, float)) and not isinstance(expires, bool)
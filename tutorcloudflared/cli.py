@@ -1,37 +1,69 @@
 from __future__ import annotations
 
+import json
 import subprocess
+import time
 
 import click
-from typing import cast, List
+from typing import cast, Any, Dict, List, Optional, TYPE_CHECKING
 
 from tutor.commands.context import Context
-from tutor import fmt, config
-from tutor.__about__ import __app__
-from tutor.utils import execute
-from .constants import CLOUDFLARE_NS_SETUP_URL
-from .utils import (
-    check_ns,
-    strip_out_subdomains_if_needed,
-    is_default_domain,
-    is_same_domain,
-    is_one_or_less_subdomain,
-    get_first_level_domain,
-    get_conflicted_hosts,
+from tutor import fmt, config, env
+from tutor.exceptions import TutorError
+from .cache import NSCache
+from .constants import (
+    DOCTOR_CHECK_TIMEOUT,
+    DOCTOR_TIMEOUT,
+    LOADTEST_TIMEOUT,
+    METRICS_INTERVAL,
+    NS_CACHE_FILENAME,
+    READY_POLL_INTERVAL,
+    READY_TIMEOUT,
+    WARMUP_CONCURRENCY,
+    WARMUP_TIMEOUT,
 )
+from .hosts import get_public_hosts
+from .profiling import CONFIG, collect, phase
+from .readiness import get_metrics_url, wait_all_ready, wait_ready
+from .tunnels import (
+    UUID_PATTERN,
+    Connector,
+    find_tunnel_uuid,
+    get_connectors,
+    get_credentials_dir,
+    get_tunnels,
+)
+
+# The doctor and its dependencies (requests, tld) are costly to import, so they
+# are only imported when a command needs them, and not on every tutor command.
+if TYPE_CHECKING:
+    from .doctor import CheckResult
 
 
 @click.command()
+@click.option(
+    "--tunnel",
+    "tunnel_name",
+    help="Name of the tunnel [default: CLOUDFLARED_TUNNEL_NAME]",
+)
 @click.pass_obj
-def get_tunnel_uuid(context: Context) -> list[tuple[str, str]]:
+def get_tunnel_uuid(
+    context: Context, tunnel_name: Optional[str]
+) -> list[tuple[str, str]]:
     """
     This command is used to get tunnel UUID which is important to render config.yml file
     """
     configs = config.load(context.root)
-    tunnel_name = configs.get("CLOUDFLARED_TUNNEL_NAME")
+    tunnel_name = tunnel_name or cast(str, configs.get("CLOUDFLARED_TUNNEL_NAME"))
     fmt.echo_info(f"Retriving UUID of tunnel name {tunnel_name}")
+    # The tunnel id is the first "id" of the JSON output, the next ones are the
+    # ids of its connections
     return [
-        ("cloudflared", f"cloudflared tunnel info -o json {tunnel_name} | jq -rc '.id'")
+        (
+            "cloudflared",
+            f"cloudflared tunnel info -o json {tunnel_name}"
+            ' | grep -oE \'"id": *"[0-9a-f-]+"\' | head -n 1 | cut -d \'"\' -f 4',
+        )
     ]
 
 
@@ -41,23 +73,128 @@ def cloudflared() -> None:
 
 
 @click.command()
-def set_tunnel_uuid() -> None:
+@click.pass_obj
+def set_tunnel_uuid(context: Context) -> None:
     """
     This command would set the UUID of the cloudfalred tunnel as a config value, given it would
-    be used for rednering.
+    be used for rednering. The UUID is read from the tunnel-uuids file in the data folder, where
+    the init task records the UUID of each tunnel, provided that its credentials file is in the
+    same folder. Only if it's not found there, it's retrieved by running a cloudflared container.
+    The UUIDs of the tunnels of CLOUDFLARED_TUNNELS are set in CLOUDFLARED_TUNNEL_UUIDS.
     """
+    configs = config.load(context.root)
+    uuids = {}
+    for tunnel in get_tunnels(configs):
+        uuid = find_tunnel_uuid(context.root, tunnel.name)
+        if uuid is None:
+            fmt.echo_info(
+                f"Credentials of tunnel {tunnel.name} were not found in {get_credentials_dir(context.root)}"
+            )
+            uuid = get_tunnel_uuid_from_container(context.root, tunnel.name)
+        if not UUID_PATTERN.match(uuid):
+            raise TutorError(
+                f"Could not retrieve the UUID of tunnel {tunnel.name}, got '{uuid}'. "
+                "Did you run `tutor local do init --limit=cloudflared`?"
+            )
+        uuids[tunnel.name] = uuid
+    default_tunnel, *other_tunnels = uuids
+    values: Dict[str, Any] = {"CLOUDFLARED_TUNNEL_UUID": uuids[default_tunnel]}
+    fmt.echo_info(f"Setting CLOUDFLARED_TUNNEL_UUID={uuids[default_tunnel]}")
+    if other_tunnels or configs.get("CLOUDFLARED_TUNNEL_UUIDS"):
+        values["CLOUDFLARED_TUNNEL_UUIDS"] = {
+            name: uuids[name] for name in other_tunnels
+        }
+        for name in other_tunnels:
+            fmt.echo_info(f"Setting the UUID of tunnel {name} to {uuids[name]}")
+    save_config(context.root, values)
+
+
+def get_tunnel_uuid_from_container(root: str, tunnel_name: str) -> str:
+    "Retrieve the tunnel UUID by running the get-tunnel-uuid job"
     r = subprocess.run(
-        ["bash", "-c", "tutor local do get-tunnel-uuid | tail -n 1"],
+        [
+            "tutor",
+            "--root",
+            root,
+            "local",
+            "do",
+            "get-tunnel-uuid",
+            "--tunnel",
+            tunnel_name,
+        ],
         capture_output=True,
         text=True,
+        check=False,
     )
-    uuid = r.stdout.rstrip("\n")
-    execute("tutor", "config", "save", "--set", f"CLOUDFLARED_TUNNEL_UUID={uuid}")
+    lines = r.stdout.strip().splitlines()
+    return lines[-1].strip() if lines else ""
+
+
+def save_config(root: str, values: Dict[str, Any]) -> None:
+    """
+    Save some config values and render the environment, the same way as
+    `tutor config save --set` does, without running another tutor process.
+    """
+    configs = config.load_minimal(root)
+    configs.update(values)
+    config.save_config_file(root, configs)
+    env.save(root, config.load_full(root))
 
 
 @click.command()
+@click.option(
+    "--timeout",
+    type=float,
+    default=DOCTOR_TIMEOUT,
+    show_default=True,
+    help="Overall deadline, in seconds, for all checks to finish",
+)
+@click.option(
+    "--check-timeout",
+    type=float,
+    default=DOCTOR_CHECK_TIMEOUT,
+    show_default=True,
+    help="Deadline, in seconds, for each single check to finish",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Neither read nor store NS lookups in the cache",
+)
+@click.option(
+    "--refresh",
+    is_flag=True,
+    help="Ignore cached NS lookups, and store the fresh results",
+)
+@click.option(
+    "--origin",
+    help="URL of the local caddy origin, used to check the cache headers of static assets"
+    " [default: http://127.0.0.1:CADDY_HTTP_PORT]",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    show_default=True,
+    help="Print the results as text, or as a single JSON report for CI pipelines",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Report the time spent by each check in network, parsing and the rest",
+)
 @click.pass_obj
-def doctor(context: Context) -> None:
+def doctor(
+    context: Context,
+    timeout: float,
+    check_timeout: float,
+    no_cache: bool,
+    refresh: bool,
+    origin: Optional[str],
+    output_format: str,
+    profile: bool,
+) -> None:
     """
     This command would do the following checks in order:
       1. It checks that user is not using the default tutor host overhang.io
@@ -68,111 +205,75 @@ def doctor(context: Context) -> None:
            If this is true then tutor by default would assing host as subdomain of
            subdomain, however subdomain.subdomain.domain.tld can only be used if
            user is utilziing advance certficate from cloudflare which is not free.
+      5. It checks that the hashed static assets of the LMS and CMS are served by
+         the local origin with an immutable Cache-Control header, so that they can
+         be cached by Cloudflare edge.
+      6. It checks that each wildcard host is in the same zone as the LMS, and
+         reports the public hosts that it covers.
+      7. It checks that the UDP buffers of the host are large enough for QUIC,
+         unless CLOUDFLARED_PROTOCOL is http2.
+      8. When CLOUDFLARED_TUNNELS is set, it checks that each tunnel has its UUID
+         and credentials, and reports the public hosts that it routes.
+    The checks are independent, so they run concurrently, but their results are
+    always printed in the order above.
+    NS records are resolved with the CLOUDFLARED_DNS_RESOLVER backend, and
+    lookups are cached in the project data folder until their TTL expires,
+    use --refresh or --no-cache to bypass the cache.
+    With --format=json, a single JSON report is printed, with the id, status,
+    affected host keys, fix commands and duration of each check. With --profile,
+    the time spent in network, parsing and config loading is reported as well.
     """
 
+    # pylint: disable=import-outside-toplevel
+    from .doctor import get_checks, run_checks
+    from .utils import get_state_path
+
     warnings = 0
     fatal_errors = 0
-    # click.echo(result)
-    configs = config.load(context.root)
-    lms_host = cast(str, configs.get("LMS_HOST"))
-    first_level_domain = get_first_level_domain(lms_host)
-    # is_lms_fld = first_level_domain == lms_host
-    fmt.echo_info(fmt.title("Checking if it's the defautl overhang.io domain"))
-    if lms_host == "overhang.io":
-        fatal_errors += 1
-        fmt.echo_error(
-            """❌ You are using the default host domain overhang.io, please reset via
-        tutor config save --set LMS_HOST=mydomain.com
-        And then rerun this test again
-        """
-        )
-    else:
-        fmt.echo_info("✅ You are not using the default domain")
-    # We retrive all hosts as key value, if the host is defined in tutor config
-    hosts_keys = cast(List[str], configs.get("CLOUDFLARED_PUBLIC_HOSTS"))
-    undefined_hosts = [
-        host_key for host_key in hosts_keys if configs.get(host_key) is None
-    ]
-    defined_hosts = [
-        host_key for host_key in hosts_keys if configs.get(host_key) is not None
-    ]
-    domains = dict(
-        (host_key, value)
-        for host_key, value in [
-            (host_key, cast(str, configs.get(host_key))) for host_key in defined_hosts
-        ]
-    )
-
-    # Check that all hosts share same domain
-    fmt.echo_info(fmt.title("Checking if all hosts shares same root domain"))
-    if is_same_domain(list(domains.values())):
-        fmt.echo_info("✅ All hosts share same root domain")
-    else:
-        fatal_errors += 1
-        # if failed retrive the hosts/domains that conflifct with the LMS
-        different_hosts = get_conflicted_hosts(domains, first_level_domain)
-        fmt.echo_error(
-            f"❌ Not all hosts/domains share same root domain!, found {len(different_hosts.keys())}"
-        )
-        for host_key, host_value in different_hosts.items():
-            fmt.echo_error(
-                f"""You need to change the host of {host_key} given it's current domain {host_value}
-            conflicts with the LMS first level domain which is {first_level_domain}, you might consider 
-            changing it via:"""
-            )
-            fmt.echo(
-                fmt.command(
-                    f"tutor config save --set {host_key}={host_value.split('.')[0]}.{first_level_domain}"
-                )
-            )
+    started = time.perf_counter()
+    # Time spent before the checks run: loading the config
+    timings: Optional[Dict[str, float]] = {} if profile else None
+    with collect(timings):
+        with phase(CONFIG):
+            configs = config.load(context.root)
 
-    # Checking for NS records
-    fmt.echo_info(
-        fmt.title(
-            f"Checking for NS records for first level domain {first_level_domain}..."
-        )
+    ns_cache = (
+        None
+        if no_cache
+        else NSCache(get_state_path(context.root, NS_CACHE_FILENAME), refresh=refresh)
     )
-    result = check_ns(first_level_domain)
-    if result != 0:
-        fmt.echo_error(
-            f"""❌ NS checking failed!
-        It doesn't seem that your domain name serever is handled by Cloudflare
-        Please check this guide {CLOUDFLARE_NS_SETUP_URL}
-        If you already just did that, it might need a couple of minutes for NS to prograte"""
-        )
-        fatal_errors += 1
-    else:
-        fmt.echo_info("✅ Checking for NS settings Passed!.")
-
-    # Printing the hosts that are not set, it can be beacuse, opreator are not necessary utilizing all optional services
-    fmt.echo_info(
-        f"Checks for domains hosts of {','.join(undefined_hosts)} will be skipped because are not defined"
+    checks = get_checks(
+        context.root, configs, check_timeout, cache=ns_cache, origin=origin
     )
 
-    # Here we iterate for on each domain of every defined host:
-    # And check if it's two level subdomain
-    for domain_name, domain_value in domains.items():
-        fmt.echo_info(f"Check for {domain_name} {domain_value}")
-        subdomain_check = is_one_or_less_subdomain(domain_value)
-        if not subdomain_check and subdomain_check is not None:
-            new_value = strip_out_subdomains_if_needed(domain_value)
-            fmt.echo(
-                fmt.alert(
-                    f"""
-           Checking for {domain_name} failed with value of {domain_value},
-           becaues it's a two level subdomain, cloudflare doesn't issue 
-           certificate for a two level subdomain unless you use advance cerificate 
-           which would cost you about 10USD per month.
-           Alternatively you might resovle this issue by changing {domain_name} to
-           {new_value}, by running:\n"""
-                )
-                + fmt.command(f"tutor config save --set {domain_name}={new_value}")
-            )
-            warnings += 1
-        elif subdomain_check is None:
-            fmt.echo_error(
-                f"❌ the value of {domain_name} which is '{domain_value}' doesn't seem to be a correct domain!."
-            )
+    results = []
+    for result in run_checks(checks, check_timeout, timeout, profile=profile):
+        results.append(result)
+        if output_format == "text":
+            echo_check_result(result, profile=profile)
+        warnings += result.warnings
+        fatal_errors += result.fatal_errors
+    if ns_cache is not None:
+        ns_cache.save()
+
+    if output_format == "json":
+        report: Dict[str, Any] = {
+            "status": "error" if fatal_errors else "warning" if warnings else "ok",
+            "fatal_errors": fatal_errors,
+            "warnings": warnings,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            "checks": [result.to_dict(profile=profile) for result in results],
+        }
+        if timings is not None:
+            report["profile"] = {
+                f"{name}_ms": round(seconds * 1000, 3)
+                for name, seconds in timings.items()
+            }
+        click.echo(json.dumps(report, indent=2))
+        return
+
+    if profile:
+        echo_profile(results, timings or {}, time.perf_counter() - started)
 
     # Printing result of tests/checks:
     if (fatal_errors + warnings) > 0:
@@ -197,5 +298,729 @@ def doctor(context: Context) -> None:
         fmt.echo_info(fmt.title("✅ Tests done without any errors or warnings!"))
 
 
+def echo_check_result(result: CheckResult, profile: bool = False) -> None:
+    "Print the title and the messages of a check result"
+    if result.title:
+        fmt.echo_info(fmt.title(result.title))
+    for kind, text in result.messages:
+        if kind == "error":
+            fmt.echo_error(text)
+        elif kind == "alert":
+            fmt.echo(fmt.alert(text))
+        elif kind == "command":
+            fmt.echo(fmt.command(text))
+        else:
+            fmt.echo_info(text)
+    if profile:
+        fmt.echo_info(f"⏱  {result.id}: {format_profile(result)}")
+
+
+def format_profile(result: CheckResult) -> str:
+    "Format the duration of a check and its breakdown in phases"
+    breakdown = ", ".join(
+        f"{name[:-3]} {value:.1f}ms"
+        for name, value in result.to_dict(profile=True)["profile"].items()
+    )
+    return f"{result.duration * 1000:.1f}ms ({breakdown})"
+
+
+def echo_profile(
+    results: List[CheckResult], timings: Dict[str, float], duration: float
+) -> None:
+    "Print where the time of the doctor went, the slowest checks first"
+    fmt.echo_info(fmt.title("Profile"))
+    fmt.echo_info(
+        f"Total {duration * 1000:.1f}ms, before the checks: "
+        + ", ".join(
+            f"{name} {seconds * 1000:.1f}ms" for name, seconds in timings.items()
+        )
+    )
+    for result in sorted(results, key=lambda r: r.duration, reverse=True)[:5]:
+        fmt.echo_info(f"  {result.id}: {format_profile(result)}")
+
+
+@click.command()
+@click.option(
+    "-i",
+    "--interval",
+    type=float,
+    default=METRICS_INTERVAL,
+    show_default=True,
+    help="Seconds between two scrapes, over which rates are computed",
+)
+@click.option("-w", "--watch", is_flag=True, help="Keep reporting every interval")
+@click.option(
+    "-f",
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    show_default=True,
+)
+@click.option(
+    "--url",
+    "urls",
+    multiple=True,
+    help="Metrics endpoint to scrape, instead of the ones of the connectors",
+)
+@click.pass_obj
+def stats(
+    context: Context,
+    interval: float,
+    watch: bool,
+    output_format: str,
+    urls: List[str],
+) -> None:
+    """
+    Scrape the metrics of the cloudflared connectors and report the requests rate,
+    the errors rate, the percentiles of the time it takes to connect to the origin,
+    which is not the response time, and the active streams, per host and for the
+    whole tunnel, along with the number of edge connections.
+    """
+    # pylint: disable=import-outside-toplevel
+    import requests
+
+    from .metrics import format_summary, summarize, take_snapshot
+
+    if not urls:
+        configs = config.load(context.root)
+        urls = [
+            get_metrics_url(configs, connector) for connector in get_connectors(configs)
+        ]
+    try:
+        previous = take_snapshot(urls)
+        while True:
+            time.sleep(interval)
+            current = take_snapshot(urls)
+            summary = summarize(current, previous)
+            if output_format == "json":
+                fmt.echo(json.dumps(summary))
+            else:
+                fmt.echo_info(fmt.title(f"cloudflared metrics over {interval}s"))
+                for name, description in format_summary(summary):
+                    fmt.echo(f"{name}: {description}")
+            if not watch:
+                break
+            previous = current
+    except requests.RequestException as e:
+        raise TutorError(
+            f"Could not scrape the cloudflared metrics: {e}\n"
+            "Are the connectors running, and their metrics ports published?"
+        ) from e
+
+
+@click.command()
+@click.option(
+    "--check",
+    is_flag=True,
+    help="Only report whether a restart is needed, and exit with status 1 if it is",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    help="Restart even if the tunnel config and connectors did not change",
+)
+@click.option(
+    "--record",
+    is_flag=True,
+    help="Record the current tunnel config and connectors as applied, without restarting",
+)
+@click.option(
+    "--ready-timeout",
+    type=float,
+    default=READY_TIMEOUT,
+    show_default=True,
+    help="Time, in seconds, to wait for each restarted connector to be ready",
+)
+@click.pass_obj
+def restart(
+    context: Context, check: bool, force: bool, record: bool, ready_timeout: float
+) -> None:
+    """
+    Restart the cloudflared connectors, only if the rendered tunnel config, or the
+    rendered docker compose definitions of the connectors, changed since they were
+    last restarted by this command. The connectors are recreated one at a time, and
+    each one has to be connected to the Cloudflare edge again before the next one
+    is recreated, so that the tunnel keeps serving requests. A tunnel with a single
+    connector is served by a temporary one while it restarts.
+    """
+    # pylint: disable=import-outside-toplevel
+    from .fingerprint import (
+        get_config_fingerprint,
+        read_applied_fingerprint,
+        save_applied_fingerprint,
+    )
+
+    configs = config.load(context.root)
+    connectors = get_connectors(configs)
+    fingerprint = get_config_fingerprint(
+        context.root, [connector.service for connector in connectors]
+    )
+    if record:
+        save_applied_fingerprint(context.root, fingerprint)
+        fmt.echo_info(
+            f"Recorded the tunnel config and connectors {fingerprint[:12]} as applied"
+        )
+        return
+    applied = read_applied_fingerprint(context.root)
+    if applied == fingerprint and not force:
+        fmt.echo_info(
+            f"The tunnel config and connectors {fingerprint[:12]} did not change,"
+            " no restart needed"
+        )
+        return
+    if check:
+        fmt.echo_alert(
+            f"The tunnel config or connectors changed from {applied[:12] if applied else 'unknown'}"
+            f" to {fingerprint[:12]}, a restart is needed"
+        )
+        raise click.exceptions.Exit(1)
+    # Temporary connectors publish their metrics on the port after the last connector
+    surge_port = max(connector.metrics_port for connector in connectors) + 1
+    for connector in connectors:
+        surge = None
+        if connector.tunnel.replicas == 1:
+            fmt.echo_info(f"Starting a temporary connector for {connector.service}...")
+            surge = start_surge_connector(context.root, configs, connector, surge_port)
+            try:
+                wait_ready(
+                    get_metrics_url(
+                        configs, connector._replace(metrics_port=surge_port), "/ready"
+                    ),
+                    timeout=ready_timeout,
+                )
+            except TutorError:
+                stop_container(surge)
+                raise
+        fmt.echo_info(f"Recreating {connector.service}...")
+        try:
+            recreate_service(context.root, connector.service)
+            connections = wait_ready(
+                get_metrics_url(configs, connector, "/ready"), timeout=ready_timeout
+            )
+        except TutorError:
+            if surge:
+                fmt.echo_alert(
+                    f"The temporary connector {surge} keeps serving the tunnel, stop it"
+                    f" with `docker stop {surge}` once {connector.service} is ready"
+                )
+            raise
+        if surge:
+            stop_container(surge)
+        fmt.echo_info(f"{connector.service} is ready with {connections} connection(s)")
+    save_applied_fingerprint(context.root, fingerprint)
+
+
+@click.command()
+@click.option(
+    "--build-arg",
+    "build_args",
+    multiple=True,
+    help="Build argument of the image, e.g CLOUDFLARED_SOURCE=local",
+)
+@click.option(
+    "--no-build", is_flag=True, help="Only report on the image that was already built"
+)
+@click.option(
+    "--runs",
+    type=int,
+    default=3,
+    show_default=True,
+    help="Number of containers that are started to measure the start time",
+)
+@click.option(
+    "-f",
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    show_default=True,
+)
+@click.pass_obj
+def build_image(
+    context: Context,
+    build_args: List[str],
+    no_build: bool,
+    runs: int,
+    output_format: str,
+) -> None:
+    """
+    Build the connector image with `tutor images build cloudflared`, and report its
+    size and the time it takes to start a container.
+    """
+    # pylint: disable=import-outside-toplevel
+    from .images import format_size, get_image_report
+
+    configs = config.load(context.root)
+    tag = cast(str, configs["CLOUDFLARED_DOCKER_IMAGE"])
+    if not no_build:
+        command = ["tutor", "--root", context.root, "images", "build", "cloudflared"]
+        for build_arg in build_args:
+            command += ["--build-arg", build_arg]
+        if subprocess.run(command, check=False).returncode != 0:
+            raise TutorError(f"Could not build the {tag} image")
+    report = get_image_report(tag, runs)
+    if output_format == "json":
+        fmt.echo(json.dumps(report))
+        return
+    fmt.echo_info(f"Image {tag}: {format_size(report['size'])}")
+    start_time = report["start_time"]
+    if start_time["runs"]:
+        fmt.echo_info(
+            f"Container start time: median {start_time['median'] * 1000:.0f}ms,"
+            f" min {start_time['min'] * 1000:.0f}ms over {start_time['runs']} run(s)"
+        )
+
+
+@click.command()
+@click.option(
+    "--timeout",
+    type=float,
+    default=READY_TIMEOUT,
+    show_default=True,
+    help="Time, in seconds, to wait for all connectors to be ready",
+)
+@click.option(
+    "--min-connections",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of edge connections that each connector should have",
+)
+@click.option(
+    "--interval",
+    type=float,
+    default=READY_POLL_INTERVAL,
+    show_default=True,
+    help="Initial delay, in seconds, between two polls, which then doubles",
+)
+@click.option(
+    "--url",
+    "urls",
+    multiple=True,
+    help="Ready endpoint to poll, instead of the ones of the connectors",
+)
+@click.pass_obj
+def wait_ready_command(
+    context: Context,
+    timeout: float,
+    min_connections: int,
+    interval: float,
+    urls: List[str],
+) -> None:
+    """
+    Wait until all cloudflared connectors are connected to the Cloudflare edge, by
+    polling their /ready metrics endpoint, e.g to run smoke tests right after
+    `tutor local start`. Exit with an error, and the last response of each connector
+    that is not ready, after --timeout seconds.
+    """
+    if not urls:
+        configs = config.load(context.root)
+        urls = [
+            get_metrics_url(configs, connector, "/ready")
+            for connector in get_connectors(configs)
+        ]
+    started = time.monotonic()
+    connections = wait_all_ready(
+        list(urls), timeout=timeout, interval=interval, min_connections=min_connections
+    )
+    elapsed = time.monotonic() - started
+    for url, count in connections.items():
+        fmt.echo_info(f"{url}: {count} connection(s)")
+    fmt.echo_info(f"✅ {len(connections)} connector(s) ready after {elapsed:.1f}s")
+
+
+@click.command()
+@click.option(
+    "--origin",
+    help="URL of the origin, through which the hosts are requested"
+    " [default: http://127.0.0.1:CADDY_HTTP_PORT]",
+)
+@click.option(
+    "-c",
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=WARMUP_CONCURRENCY,
+    show_default=True,
+    help="Number of requests that are sent at the same time",
+)
+@click.option(
+    "--timeout",
+    type=float,
+    default=WARMUP_TIMEOUT,
+    show_default=True,
+    help="Time, in seconds, to wait for each response",
+)
+@click.option(
+    "-f",
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    show_default=True,
+)
+@click.pass_obj
+def warmup(
+    context: Context,
+    origin: Optional[str],
+    concurrency: int,
+    timeout: float,
+    output_format: str,
+) -> None:
+    """
+    Warm up the caches of the origin after a restart, by requesting the
+    CLOUDFLARED_WARMUP_PATHS of each public host through caddy, with the host as the
+    Host header and TLS server name. All paths are requested twice, to report their
+    latency before and after the warm-up. Exit with an error if a path fails on the
+    second request.
+    """
+    # pylint: disable=import-outside-toplevel
+    from .warmup import format_result, get_targets, to_dict, warmup as warmup_targets
+
+    configs = config.load(context.root)
+    origin = origin or f"http://127.0.0.1:{configs.get('CADDY_HTTP_PORT', 80)}"
+    results = warmup_targets(get_targets(configs), origin, concurrency, timeout)
+    if output_format == "json":
+        fmt.echo(json.dumps([to_dict(result) for result in results]))
+    else:
+        for result in results:
+            if result.failed:
+                fmt.echo_error(format_result(result))
+            else:
+                fmt.echo_info(format_result(result))
+    failed = sum(result.failed for result in results)
+    if failed:
+        raise TutorError(f"{failed} out of {len(results)} path(s) failed to warm up")
+
+
+@click.command()
+@click.option(
+    "-l",
+    "--layer",
+    type=click.Choice(["direct", "caddy", "tunnel"]),
+    default="caddy",
+    show_default=True,
+    help="Layer that is load tested: the service of the host, caddy, or the tunnel",
+)
+@click.option(
+    "--host-key",
+    "host_keys",
+    multiple=True,
+    help="Public host to load test, by default all of them, one after the other",
+)
+@click.option("--path", default="/", show_default=True, help="Path that is requested")
+@click.option(
+    "-c",
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=10,
+    show_default=True,
+    help="Number of concurrent clients, each with its own keep-alive connection",
+)
+@click.option(
+    "-d",
+    "--duration",
+    type=float,
+    default=10,
+    show_default=True,
+    help="Duration, in seconds, of the load test of each host",
+)
+@click.option(
+    "-n",
+    "--requests",
+    type=click.IntRange(min=1),
+    help="Stop after this number of requests per host, within --duration",
+)
+@click.option(
+    "--target",
+    help="URL that is requested instead of the one of the layer, e.g a port-forwarded"
+    " service when the container addresses can't be reached from the host, or a local"
+    " `cloudflared tunnel --url` origin",
+)
+@click.option(
+    "--timeout",
+    type=float,
+    default=LOADTEST_TIMEOUT,
+    show_default=True,
+    help="Time, in seconds, to wait for each response",
+)
+@click.option(
+    "-f",
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    show_default=True,
+)
+@click.pass_obj
+def loadtest(
+    context: Context,
+    layer: str,
+    host_keys: List[str],
+    path: str,
+    concurrency: int,
+    duration: float,
+    requests: Optional[int],
+    target: Optional[str],
+    timeout: float,
+    output_format: str,
+) -> None:
+    """
+    Load test the public hosts through one layer, to measure what each hop adds to
+    the latency: "direct" requests the service of the host from
+    CLOUDFLARED_DIRECT_SERVICES, at the address of its container on the docker
+    network, "caddy" the local caddy port, and "tunnel" the public URL, through the
+    Cloudflare edge and the connectors. Requests have the public host as Host
+    header, and the throughput and latency percentiles are reported for each host.
+    """
+    # pylint: disable=import-outside-toplevel
+    import asyncio
+    from urllib.parse import urlsplit
+
+    from .loadtest import format_result, get_layer_url, replace_host, run_load
+
+    configs = config.load(context.root)
+    public_hosts = get_public_hosts(configs)
+    for host_key in host_keys:
+        if host_key not in public_hosts:
+            raise TutorError(f"{host_key} is not a public host that is set")
+    report = []
+    for host_key in host_keys or list(public_hosts):
+        host = public_hosts[host_key]
+        url = target or get_layer_url(configs, layer, host_key, host)
+        if layer == "direct" and not target:
+            service = urlsplit(url).hostname or ""
+            url = replace_host(url, get_container_address(configs, service))
+        if output_format == "text":
+            fmt.echo_info(
+                f"Load testing {host}{path} through {url} with {concurrency} client(s)..."
+            )
+        result = asyncio.run(
+            run_load(url, host, path, concurrency, duration, requests, timeout)
+        ).to_dict()
+        result.update({"host_key": host_key, "host": host, "layer": layer, "url": url})
+        report.append(result)
+        if output_format == "text":
+            fmt.echo(f"{host_key} {host}: {format_result(result)}")
+            for error, count in result["error_messages"].items():
+                fmt.echo_error(f"  {count} x {error}")
+    if output_format == "json":
+        fmt.echo(json.dumps(report))
+
+
+@click.group()
+def logs() -> None:
+    "Analyze the logs of the cloudflared connectors"
+
+
+@logs.command()
+@click.argument("paths", nargs=-1, type=click.Path(dir_okay=False))
+@click.option(
+    "-w",
+    "--window",
+    type=click.FloatRange(min=1),
+    default=60,
+    show_default=True,
+    help="Duration, in seconds, of the time windows that are reported",
+)
+@click.option(
+    "--follow",
+    is_flag=True,
+    help="Keep reading the lines that are appended to the logs, and report each window"
+    " once it's over",
+)
+@click.option(
+    "-f",
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    show_default=True,
+)
+@click.pass_obj
+def analyze(
+    context: Context,
+    paths: List[str],
+    window: float,
+    follow: bool,
+    output_format: str,
+) -> None:
+    """
+    Report the requests, statuses, origin errors, latency percentiles and edge
+    reconnects of each public host, per time window, from the JSON logs of the
+    connectors. By default, all the log files of data/cloudflared/logs are analyzed,
+    including the segments that were rotated. The latency and status of requests are
+    only logged with CLOUDFLARED_LOG_LEVEL=debug.
+    """
+    # pylint: disable=import-outside-toplevel
+    from .logs import (
+        LogAnalyzer,
+        Window,
+        follow_lines,
+        format_window,
+        get_log_files,
+        get_logs_dir,
+        is_rotated,
+        merge_events,
+        parse_events,
+        read_lines,
+    )
+
+    if not paths:
+        paths = get_log_files(get_logs_dir(context.root))
+        if not paths:
+            raise TutorError(
+                f"No log files in {get_logs_dir(context.root)}, is CLOUDFLARED_LOG_FILE enabled?"
+            )
+    if follow:
+        # Rotated segments don't change anymore
+        paths = [path for path in paths if not is_rotated(path)]
+        events = parse_events(follow_lines(paths))
+    else:
+        events = merge_events([parse_events(read_lines(path)) for path in paths])
+
+    def echo(window: Window) -> None:
+        report = window.to_dict()
+        if output_format == "json":
+            fmt.echo(json.dumps(report))
+        else:
+            for line in format_window(report):
+                fmt.echo(line)
+
+    analyzer = LogAnalyzer(window)
+    try:
+        for completed in analyzer.feed(events):
+            echo(completed)
+    except KeyboardInterrupt:
+        pass
+    last = analyzer.flush()
+    if last is not None:
+        echo(last)
+    if analyzer.total is not None and output_format == "text":
+        fmt.echo_info(fmt.title("Total"))
+        for line in format_window(analyzer.total.to_dict()):
+            fmt.echo(line)
+
+
+def recreate_service(root: str, service: str) -> None:
+    """
+    Recreate a docker compose service of the local platform, so that it runs
+    with its current definition. It is recreated even if its definition did not
+    change, as the files that are mounted in it, e.g config.yml, may have.
+    """
+    r = subprocess.run(
+        [
+            "tutor",
+            "--root",
+            root,
+            "local",
+            "dc",
+            "up",
+            "--detach",
+            "--force-recreate",
+            "--no-deps",
+            service,
+        ],
+        check=False,
+    )
+    if r.returncode != 0:
+        raise TutorError(f"Could not recreate {service}")
+
+
+def get_container_address(configs: Dict[str, Any], service: str) -> str:
+    """
+    Return the IP address of the container of a docker compose service of the local
+    platform, on its docker network, through which the host can reach the ports that
+    are not published. That's only the case when docker runs on the host, e.g on
+    Linux, and not in a VM like Docker Desktop.
+    """
+    project = configs.get("LOCAL_PROJECT_NAME") or "tutor_local"
+    r = subprocess.run(
+        [
+            "docker",
+            "ps",
+            "--quiet",
+            "--filter",
+            f"label=com.docker.compose.project={project}",
+            "--filter",
+            f"label=com.docker.compose.service={service}",
+        ],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    container_ids = r.stdout.split()
+    if r.returncode != 0 or not container_ids:
+        raise TutorError(
+            f"The {service} container is not running, start it with"
+            " `tutor local start -d`, or request it with --target"
+        )
+    r = subprocess.run(
+        [
+            "docker",
+            "inspect",
+            "--format",
+            "{{range .NetworkSettings.Networks}}{{.IPAddress}} {{end}}",
+            container_ids[0],
+        ],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    addresses = r.stdout.split()
+    if r.returncode != 0 or not addresses:
+        raise TutorError(f"Could not find the address of the {service} container")
+    return addresses[0]
+
+
+def start_surge_connector(
+    root: str, configs: Dict[str, Any], connector: Connector, port: int
+) -> str:
+    """
+    Start a temporary copy of a connector, which runs the same tunnel while the
+    connector restarts, with its metrics published on `port`. Return the name
+    of its container, which is removed once stopped.
+    """
+    name = f"{connector.service}-surge"
+    host = configs.get("CLOUDFLARED_METRICS_HOST") or "127.0.0.1"
+    r = subprocess.run(
+        [
+            "tutor",
+            "--root",
+            root,
+            "local",
+            "dc",
+            "run",
+            "--detach",
+            "--rm",
+            "--name",
+            name,
+            "--publish",
+            f"{host}:{port}:{connector.metrics_port}",
+            connector.service,
+        ],
+        check=False,
+    )
+    if r.returncode != 0:
+        raise TutorError(
+            f"Could not start a temporary connector for {connector.service}"
+        )
+    return name
+
+
+def stop_container(name: str) -> None:
+    "Stop a container, e.g a temporary connector"
+    r = subprocess.run(["docker", "stop", name], check=False)
+    if r.returncode != 0:
+        raise TutorError(f"Could not stop {name}")
+
+
+cloudflared.add_command(build_image)
 cloudflared.add_command(doctor)
+cloudflared.add_command(loadtest)
+cloudflared.add_command(logs)
+cloudflared.add_command(restart)
 cloudflared.add_command(set_tunnel_uuid)
+cloudflared.add_command(stats)
+cloudflared.add_command(wait_ready_command, name="wait-ready")
+cloudflared.add_command(warmup)
@@ -1,6 +1,5 @@
 "Constans"
 
-
 CLOUDFLARE_NS_SETUP_URL = (
     "https://developers.cloudflare.com/dns/zone-setups/full-setup/setup/"
 )
@@ -13,7 +12,53 @@ TUTOR_PUBLIC_HOSTS = [
     "ECOMMERCE_HOST",
     "PREVIEW_LMS_HOST",
 ]
-GOOGLE_DNS_API_URL = "https://dns.google/resolve?type=ns"
+GOOGLE_DNS_API_URL = "https://dns.google/resolve"
+# Timeouts are in seconds
+DOH_TIMEOUT = 5
+# The DNS wire protocol client tries each name server for up to DNS_ATTEMPT_TIMEOUT,
+# and does DNS_RETRIES more rounds if none of them answered
+DNS_PORT = 53
+DNS_RETRIES = 2
+DNS_ATTEMPT_TIMEOUT = 2
+RESOLV_CONF_PATH = "/etc/resolv.conf"
+DOCTOR_CHECK_TIMEOUT = 10
+DOCTOR_TIMEOUT = 30
+DOCTOR_MAX_WORKERS = 16
+METRICS_TIMEOUT = 5
+METRICS_INTERVAL = 5
+READY_TIMEOUT = 60
+# The /ready endpoint of the connectors is polled with an exponential backoff
+READY_POLL_INTERVAL = 0.25
+READY_MAX_POLL_INTERVAL = 2
+PARSED_HOSTS_CACHE_SIZE = 4096
+WARMUP_TIMEOUT = 30
+WARMUP_CONCURRENCY = 8
+LOADTEST_TIMEOUT = 30
+# UDP buffer size that cloudflared recommends for QUIC, in bytes, and the kernel
+# settings that cap it on the host
+UDP_BUFFER_SIZE = 7500000
+UDP_BUFFER_SYSCTLS = ("net.core.rmem_max", "net.core.wmem_max")
+PROC_SYS_DIR = "/proc/sys"
+# Page of the LMS and CMS that always links to hashed static assets, used to check their cache headers
+CACHE_SAMPLE_PAGE = "/admin/login/"
+
+# Folder that is mounted as ~/.cloudflared in the containers, where tunnel credentials are stored
+CREDENTIALS_DIR = ("data", "cloudflared")
+# File of the credentials folder where the init task records the UUID of each tunnel
+TUNNEL_UUIDS_FILENAME = "tunnel-uuids"
+# Files that the plugin keeps on the host are stored in $(tutor config printroot)/data/cloudflared-plugin
+STATE_DIR = ("data", "cloudflared-plugin")
+NS_CACHE_FILENAME = "ns-cache.json"
+# Folder where the connectors write their log files, one per connector
+LOGS_DIR = ("data", "cloudflared", "logs")
+LOGS_FOLLOW_INTERVAL = 1
+LOGS_MAX_PENDING_REQUESTS = 10000
+# Fingerprint of the tunnel config that the connectors were last restarted with
+CONFIG_FINGERPRINT_FILENAME = "config-fingerprint"
+NS_CACHE_MAX_ENTRIES = 256
+# NS records that are not (yet) handled by Cloudflare are cached for a short time only,
+# so that a freshly delegated zone is re-checked promptly
+NS_CACHE_NEGATIVE_TTL = 60
 
 " The domain of the hostm, can have one or more of the following erros"
 DOAMIN_ERROR = [{"name": "ns_error", "fix": ""}, "different_domain"]
@@ -0,0 +1,625 @@
+"Doctor checks, and the engine that runs them concurrently"
+
+from __future__ import annotations
+
+import os
+import re
+import time
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+    TimeoutError as FutureTimeoutError,
+)
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, cast
+
+import requests
+
+from .cache import NSCache
+from .constants import (
+    CACHE_SAMPLE_PAGE,
+    CLOUDFLARE_NS_SETUP_URL,
+    DOCTOR_CHECK_TIMEOUT,
+    DOCTOR_MAX_WORKERS,
+    DOCTOR_TIMEOUT,
+    PROC_SYS_DIR,
+    UDP_BUFFER_SIZE,
+    UDP_BUFFER_SYSCTLS,
+)
+from .hosts import (
+    get_covering_wildcard,
+    get_public_hosts,
+    get_tunnel_hosts,
+    get_undefined_hosts,
+    get_wildcard_hosts,
+)
+from .profiling import NETWORK, PARSING, collect, phase
+from .resolvers import Resolver, ResolverError, get_resolver
+from .tunnels import UUID_PATTERN, Tunnel, get_credentials_dir, get_tunnels
+from .utils import (
+    HostIndex,
+    ParsedHost,
+    check_ns,
+    get_first_level_domain,
+    get_session,
+    parse_host,
+    strip_out_subdomains_if_needed,
+)
+
+STATIC_ASSET_PATTERN = re.compile(r"""(?:src|href)=["'](/static/[^"'?#]+)""")
+
+
+class CheckResult:
+    """
+    The outcome of a single check. Checks never print by themselves, they
+    record their messages here so that they can run in any order while the
+    output is still printed in a deterministic one.
+    """
+
+    def __init__(self, title: str = "", host_keys: Optional[List[str]] = None) -> None:
+        self.title = title
+        self.messages: List[Tuple[str, str]] = []
+        self.fatal_errors = 0
+        self.warnings = 0
+        # The host keys that the check is about
+        self.host_keys = list(host_keys or [])
+        # Set by run_checks: the id of the check, its wall-clock duration in
+        # seconds, and the time spent in each phase when profiling
+        self.id = ""
+        self.duration = 0.0
+        self.timings: Dict[str, float] = {}
+
+    @property
+    def status(self) -> str:
+        if self.fatal_errors:
+            return "error"
+        if self.warnings:
+            return "warning"
+        return "ok"
+
+    @property
+    def fix_commands(self) -> List[str]:
+        return [text for kind, text in self.messages if kind == "command"]
+
+    def to_dict(self, profile: bool = False) -> Dict[str, Any]:
+        "Return the result as a JSON-serializable dict"
+        report: Dict[str, Any] = {
+            "id": self.id,
+            "title": self.title,
+            "status": self.status,
+            "host_keys": self.host_keys,
+            "fix_commands": self.fix_commands,
+            "messages": [{"kind": kind, "text": text} for kind, text in self.messages],
+            "duration_ms": round(self.duration * 1000, 3),
+        }
+        if profile:
+            report["profile"] = get_profile(self.duration, self.timings)
+        return report
+
+    def info(self, text: str) -> None:
+        self.messages.append(("info", text))
+
+    def error(self, text: str) -> None:
+        self.messages.append(("error", text))
+
+    def alert(self, text: str) -> None:
+        self.messages.append(("alert", text))
+
+    def command(self, text: str) -> None:
+        self.messages.append(("command", text))
+
+
+Check = Tuple[str, Callable[[], CheckResult]]
+
+
+def get_profile(duration: float, timings: Dict[str, float]) -> Dict[str, float]:
+    "Return the time spent in each phase in milliseconds, and in none of them as `other`"
+    profile = {
+        f"{name}_ms": round(seconds * 1000, 3) for name, seconds in timings.items()
+    }
+    profile["other_ms"] = round(max(duration - sum(timings.values()), 0) * 1000, 3)
+    return profile
+
+
+def check_default_domain(lms_host: str) -> CheckResult:
+    "Fail if the LMS is still using the default tutor domain"
+    result = CheckResult(
+        "Checking if it's the defautl overhang.io domain", host_keys=["LMS_HOST"]
+    )
+    if lms_host == "overhang.io":
+        result.fatal_errors += 1
+        result.error(
+            """❌ You are using the default host domain overhang.io, please reset via
+        tutor config save --set LMS_HOST=mydomain.com
+        And then rerun this test again
+        """
+        )
+    else:
+        result.info("✅ You are not using the default domain")
+    return result
+
+
+def check_same_domain(index: HostIndex, first_level_domain: str) -> CheckResult:
+    "Fail if not all hosts share the first level domain of the LMS"
+    result = CheckResult("Checking if all hosts shares same root domain")
+    if index.is_same_domain():
+        result.info("✅ All hosts share same root domain")
+        return result
+    result.fatal_errors += 1
+    # if failed retrive the hosts/domains that conflifct with the LMS
+    different_hosts = index.get_conflicted_hosts(first_level_domain)
+    result.host_keys = list(different_hosts)
+    result.error(
+        f"❌ Not all hosts/domains share same root domain!, found {len(different_hosts.keys())}"
+    )
+    for host_key, host_value in different_hosts.items():
+        result.error(
+            f"""You need to change the host of {host_key} given it's current domain {host_value}
+            conflicts with the LMS first level domain which is {first_level_domain}, you might consider
+            changing it via:"""
+        )
+        result.command(
+            f"tutor config save --set {host_key}={host_value.split('.')[0]}.{first_level_domain}"
+        )
+    return result
+
+
+def check_ns_records(
+    first_level_domain: str,
+    timeout: float = DOCTOR_CHECK_TIMEOUT,
+    cache: Optional[NSCache] = None,
+    resolver: Optional[Resolver] = None,
+    host_keys: Optional[List[str]] = None,
+) -> CheckResult:
+    "Fail if the name servers of the root domain are not handled by Cloudflare"
+    result = CheckResult(
+        f"Checking for NS records for first level domain {first_level_domain}...",
+        host_keys=host_keys,
+    )
+    try:
+        is_cloudflare = check_ns(
+            first_level_domain, timeout=timeout, cache=cache, resolver=resolver
+        )
+    except (ResolverError, ValueError) as e:
+        result.fatal_errors += 1
+        result.error(f"❌ NS checking failed, could not resolve NS records: {e}")
+        return result
+    if not is_cloudflare:
+        result.error(
+            f"""❌ NS checking failed!
+        It doesn't seem that your domain name serever is handled by Cloudflare
+        Please check this guide {CLOUDFLARE_NS_SETUP_URL}
+        If you already just did that, it might need a couple of minutes for NS to prograte"""
+        )
+        result.fatal_errors += 1
+    else:
+        result.info("✅ Checking for NS settings Passed!.")
+    return result
+
+
+def report_undefined_hosts(undefined_hosts: List[str]) -> CheckResult:
+    """
+    Printing the hosts that are not set, it can be beacuse, opreator are not
+    necessary utilizing all optional services
+    """
+    result = CheckResult(host_keys=undefined_hosts)
+    result.info(
+        f"Checks for domains hosts of {','.join(undefined_hosts)} will be skipped because are not defined"
+    )
+    return result
+
+
+def check_subdomain_level(domain_name: str, parsed: ParsedHost) -> CheckResult:
+    "Warn if a host is a subdomain of a subdomain"
+    domain_value = parsed.host
+    result = CheckResult(host_keys=[domain_name])
+    result.info(f"Check for {domain_name} {domain_value}")
+    if parsed.valid and parsed.depth > 1:
+        new_value = strip_out_subdomains_if_needed(domain_value)
+        result.alert(f"""
+           Checking for {domain_name} failed with value of {domain_value},
+           becaues it's a two level subdomain, cloudflare doesn't issue
+           certificate for a two level subdomain unless you use advance cerificate
+           which would cost you about 10USD per month.
+           Alternatively you might resovle this issue by changing {domain_name} to
+           {new_value}, by running:\n""")
+        result.command(f"tutor config save --set {domain_name}={new_value}")
+        result.warnings += 1
+    elif not parsed.valid:
+        result.error(
+            f"❌ the value of {domain_name} which is '{domain_value}' doesn't seem to be a correct domain!."
+        )
+    return result
+
+
+def check_wildcard_host(
+    wildcard_host: str, index: HostIndex, first_level_domain: str
+) -> CheckResult:
+    """
+    Fail if a wildcard host is not in the same zone as the LMS, and warn if it
+    covers two level subdomains. Report the public hosts that it covers, which
+    share its DNS route.
+    """
+    result = CheckResult(f"Checking wildcard host {wildcard_host}")
+    with phase(PARSING):
+        parsed = parse_host(wildcard_host[2:])
+    if not parsed.valid:
+        result.fatal_errors += 1
+        result.error(f"❌ {wildcard_host} doesn't seem to be a correct wildcard host!.")
+        return result
+    if parsed.first_level_domain != first_level_domain:
+        result.fatal_errors += 1
+        result.error(
+            f"""❌ {wildcard_host} is not a subdomain of the LMS first level domain
+        which is {first_level_domain}, you might consider changing it via:"""
+        )
+        result.command(
+            f"tutor config save --set 'CLOUDFLARED_WILDCARD_HOSTS=[\"*.{first_level_domain}\"]'"
+        )
+        return result
+    if parsed.depth > 0:
+        result.warnings += 1
+        result.alert(f"""
+           {wildcard_host} covers two level subdomains, cloudflare doesn't issue
+           certificate for a two level subdomain unless you use advance cerificate.
+           Alternatively you might use *.{first_level_domain} instead.""")
+    result.host_keys = [
+        host_key
+        for host_key, parsed_host in index.hosts.items()
+        if get_covering_wildcard(parsed_host.host, [wildcard_host])
+    ]
+    covered = [
+        f"{host_key} {index.hosts[host_key].host}" for host_key in result.host_keys
+    ]
+    result.info(
+        f"✅ {wildcard_host} routes any host that matches it, with a single DNS record"
+        + (f", including {', '.join(covered)}" if covered else "")
+    )
+    return result
+
+
+def read_sysctl(name: str, sysctl_dir: str = PROC_SYS_DIR) -> int:
+    "Read an integer kernel setting, e.g net.core.rmem_max"
+    path = os.path.join(sysctl_dir, *name.split("."))
+    with open(path, encoding="utf-8") as f:
+        return int(f.read().split()[0])
+
+
+def check_udp_buffers(
+    protocol: str, sysctl_dir: str = PROC_SYS_DIR, minimum: int = UDP_BUFFER_SIZE
+) -> CheckResult:
+    """
+    Warn if the maximum UDP buffer sizes of the host are lower than what cloudflared
+    recommends for QUIC, which then runs with smaller buffers and lower throughput.
+    """
+    result = CheckResult("Checking the UDP buffer sizes of the host for QUIC")
+    if protocol == "http2":
+        result.info("✅ The tunnel uses http2, UDP buffers don't matter")
+        return result
+    try:
+        values = {name: read_sysctl(name, sysctl_dir) for name in UDP_BUFFER_SYSCTLS}
+    except (OSError, ValueError, IndexError) as e:
+        result.alert(f"Could not read the UDP buffer sizes, skipping the check: {e}")
+        return result
+    too_small = {name: value for name, value in values.items() if value < minimum}
+    if not too_small:
+        result.info(f"✅ UDP buffers are large enough for QUIC (>= {minimum} bytes)")
+        return result
+    result.warnings += 1
+    current = ", ".join(f"{name}={value}" for name, value in too_small.items())
+    result.alert(
+        f"The UDP buffers of the host are smaller than the {minimum} bytes that"
+        f" cloudflared recommends for QUIC ({current}), which limits the throughput"
+        " of the tunnel. Raise them with:\n"
+    )
+    settings = [f"{name}={minimum}" for name in UDP_BUFFER_SYSCTLS]
+    result.command(f"sudo sysctl -w {' '.join(settings)}")
+    result.info("And keep them after a reboot with:")
+    result.command(
+        f"printf '%s\\n' {' '.join(settings)} | sudo tee /etc/sysctl.d/90-cloudflared.conf"
+    )
+    return result
+
+
+def check_tunnel(
+    tunnel: Tunnel, hosts: Dict[str, str], credentials_dir: str
+) -> CheckResult:
+    """
+    Warn if the UUID of a tunnel is not set, or if its credentials file is
+    missing, which keeps its connectors from running, and report the public
+    hosts that it routes.
+    """
+    result = CheckResult(f"Checking tunnel {tunnel.name}", host_keys=list(hosts))
+    if not tunnel.uuid:
+        result.warnings += 1
+        result.alert(
+            f"The UUID of tunnel {tunnel.name} is not set, create the tunnel and set it with:\n"
+        )
+        result.command("tutor local do init --limit=cloudflared")
+        result.command("tutor cloudflared set-tunnel-uuid")
+        return result
+    if not UUID_PATTERN.match(tunnel.uuid):
+        result.fatal_errors += 1
+        result.error(
+            f"❌ The UUID of tunnel {tunnel.name} which is '{tunnel.uuid}' is not a valid UUID, reset it with:"
+        )
+        result.command("tutor cloudflared set-tunnel-uuid")
+        return result
+    credentials_path = os.path.join(credentials_dir, f"{tunnel.uuid}.json")
+    if not os.path.exists(credentials_path):
+        result.warnings += 1
+        result.alert(
+            f"The credentials of tunnel {tunnel.name} were not found in {credentials_path},"
+            " they are created along with the tunnel by:\n"
+        )
+        result.command("tutor local do init --limit=cloudflared")
+        return result
+    routed = [f"{host_key} {host}" for host_key, host in hosts.items()]
+    if not routed and tunnel.suffix:
+        result.warnings += 1
+        result.alert(
+            f"Tunnel {tunnel.name} doesn't route any public host that is set,"
+            " so its connectors are idle"
+        )
+        return result
+    result.info(
+        f"✅ Tunnel {tunnel.name} ({tunnel.uuid}) runs {tunnel.replicas} connector(s)"
+        + (f", and routes {', '.join(routed)}" if routed else "")
+    )
+    return result
+
+
+def find_sample_asset(html: str, pattern: str) -> Optional[str]:
+    "Return the path of the first hashed static asset that a page links to"
+    for match in STATIC_ASSET_PATTERN.finditer(html):
+        if re.search(pattern, match.group(1)):
+            return match.group(1)
+    return None
+
+
+def check_cache_headers(
+    origin: str,
+    domain_name: str,
+    domain_value: str,
+    pattern: str,
+    direct: bool = False,
+    timeout: float = DOCTOR_CHECK_TIMEOUT,
+) -> CheckResult:
+    """
+    Warn if a hashed static asset of a host, fetched from the local origin,
+    is not served with an immutable Cache-Control header. The check is skipped
+    if the origin is not reachable, e.g because the platform is not running.
+    """
+    result = CheckResult(
+        f"Checking the cache headers of {domain_name} static assets",
+        host_keys=[domain_name],
+    )
+    if direct:
+        result.alert(
+            f"""{domain_name} is routed directly to its service, so the cache headers
+        that caddy sets don't apply to it"""
+        )
+        return result
+    session = get_session()
+    headers = {"Host": domain_value}
+    try:
+        with phase(NETWORK):
+            response = session.get(
+                f"{origin}{CACHE_SAMPLE_PAGE}",
+                headers=headers,
+                timeout=timeout,
+                allow_redirects=False,
+            )
+        with phase(PARSING):
+            asset = find_sample_asset(response.text, pattern)
+        if asset is None:
+            result.alert(
+                f"Skipped, no hashed static asset was found in {origin}{CACHE_SAMPLE_PAGE}"
+            )
+            return result
+        with phase(NETWORK), session.get(
+            f"{origin}{asset}", headers=headers, timeout=timeout, stream=True
+        ) as response:
+            cache_control = response.headers.get("Cache-Control", "")
+    except requests.RequestException as e:
+        result.alert(f"Skipped, the origin {origin} is not reachable: {e}")
+        return result
+    directives = [d.strip().lower() for d in cache_control.split(",")]
+    if "immutable" in directives and "public" in directives:
+        result.info(f"✅ {asset} is served with Cache-Control: {cache_control}")
+    else:
+        result.warnings += 1
+        result.alert(
+            f"""{asset} is served with Cache-Control: '{cache_control}', so the Cloudflare edge
+        won't cache it for long. Make sure that CLOUDFLARED_CACHE_HEADERS is enabled and restart caddy:"""
+        )
+        result.command("tutor config save --set CLOUDFLARED_CACHE_HEADERS=true")
+        result.command("tutor local restart caddy")
+    return result
+
+
+def get_checks(
+    root: str,
+    configs: Dict[str, Any],
+    check_timeout: float = DOCTOR_CHECK_TIMEOUT,
+    cache: Optional[NSCache] = None,
+    origin: Optional[str] = None,
+) -> List[Check]:
+    """
+    Return the checks of the doctor for the given configuration, in the order
+    in which their results are printed. The hosts are parsed once here, and
+    shared by all checks.
+    """
+    lms_host = cast(str, configs.get("LMS_HOST"))
+    first_level_domain = get_first_level_domain(lms_host)
+    # We retrive all hosts as key value, if the host is defined in tutor config
+    undefined_hosts = get_undefined_hosts(configs)
+    index = HostIndex(get_public_hosts(configs))
+
+    checks: List[Check] = [
+        ("default-domain", partial(check_default_domain, lms_host)),
+        ("same-root-domain", partial(check_same_domain, index, first_level_domain)),
+        (
+            "ns-records",
+            partial(
+                check_ns_records,
+                first_level_domain,
+                timeout=check_timeout,
+                cache=cache,
+                resolver=get_resolver(configs),
+                host_keys=index.by_domain.get(first_level_domain, []),
+            ),
+        ),
+        ("undefined-hosts", partial(report_undefined_hosts, undefined_hosts)),
+    ]
+    # Here we check for every defined host if it's two level subdomain
+    checks += [
+        (
+            f"subdomain-level:{domain_name}",
+            partial(check_subdomain_level, domain_name, parsed),
+        )
+        for domain_name, parsed in index.hosts.items()
+    ]
+    checks += [
+        (
+            f"wildcard-host:{wildcard_host}",
+            partial(check_wildcard_host, wildcard_host, index, first_level_domain),
+        )
+        for wildcard_host in get_wildcard_hosts(configs)
+    ]
+    if configs.get("CLOUDFLARED_CACHE_HEADERS"):
+        origin = origin or f"http://127.0.0.1:{configs.get('CADDY_HTTP_PORT', 80)}"
+        pattern = cast(str, configs["CLOUDFLARED_IMMUTABLE_ASSETS_PATTERN"])
+        direct_services = cast(
+            Dict[str, str], configs.get("CLOUDFLARED_DIRECT_SERVICES") or {}
+        )
+        checks += [
+            (
+                f"cache-headers:{domain_name}",
+                partial(
+                    check_cache_headers,
+                    origin.rstrip("/"),
+                    domain_name,
+                    parsed.host,
+                    pattern,
+                    direct=bool(configs.get("CLOUDFLARED_DIRECT_ROUTING"))
+                    and domain_name in direct_services,
+                    timeout=check_timeout,
+                ),
+            )
+            for domain_name, parsed in index.hosts.items()
+            if domain_name in ("LMS_HOST", "CMS_HOST")
+        ]
+    checks.append(
+        (
+            "udp-buffers",
+            partial(
+                check_udp_buffers, str(configs.get("CLOUDFLARED_PROTOCOL", "auto"))
+            ),
+        )
+    )
+    if configs.get("CLOUDFLARED_TUNNELS"):
+        checks += [
+            (
+                f"tunnel:{tunnel.name}",
+                partial(
+                    check_tunnel,
+                    tunnel,
+                    get_tunnel_hosts(configs, tunnel.name),
+                    get_credentials_dir(root),
+                ),
+            )
+            for tunnel in get_tunnels(configs)
+        ]
+    return checks
+
+
+def run_checks(
+    checks: List[Check],
+    check_timeout: float = DOCTOR_CHECK_TIMEOUT,
+    timeout: float = DOCTOR_TIMEOUT,
+    profile: bool = False,
+) -> Iterator[CheckResult]:
+    """
+    Run all checks concurrently, and yield their results in the same order as
+    they were given, as soon as each one is available. A check that does not
+    finish within `check_timeout` seconds of when it started running, or before
+    the overall `timeout` deadline, is reported as a fatal error. Each result is
+    given the id of its check and its duration, and with `profile` the time spent
+    in each phase.
+    """
+    if not checks:
+        return
+    executor = ThreadPoolExecutor(max_workers=min(len(checks), DOCTOR_MAX_WORKERS))
+    deadline = time.monotonic() + timeout
+    # When each check started running, which is later than when it was
+    # submitted if all workers were busy
+    started: List[Optional[float]] = [None] * len(checks)
+
+    def run(index: int, check_id: str, func: Callable[[], CheckResult]) -> CheckResult:
+        started[index] = time.monotonic()
+        return _run_check(check_id, func, profile)
+
+    futures = [
+        executor.submit(run, index, check_id, func)
+        for index, (check_id, func) in enumerate(checks)
+    ]
+    try:
+        for index, ((check_id, _func), future) in enumerate(zip(checks, futures)):
+            try:
+                yield _wait_for_result(future, started, index, check_timeout, deadline)
+            except FutureTimeoutError:
+                start = started[index]
+                result = CheckResult(check_id)
+                result.id = check_id
+                result.duration = 0.0 if start is None else time.monotonic() - start
+                result.fatal_errors += 1
+                result.error(f"❌ Check did not finish in time: {check_id}")
+                yield result
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def _wait_for_result(
+    future: Future[CheckResult],
+    started: List[Optional[float]],
+    index: int,
+    check_timeout: float,
+    deadline: float,
+) -> CheckResult:
+    """
+    Wait for the result of a check, until `check_timeout` seconds after it
+    started running, or the `deadline`, and raise FutureTimeoutError then.
+    """
+    while True:
+        start = started[index]
+        now = time.monotonic()
+        # A check that didn't start yet has at least check_timeout left
+        limit = min((now if start is None else start) + check_timeout, deadline)
+        try:
+            return future.result(timeout=max(limit - now, 0))
+        except FutureTimeoutError:
+            if start is not None or time.monotonic() >= deadline:
+                raise
+
+
+def _run_check(
+    check_id: str, func: Callable[[], CheckResult], profile: bool
+) -> CheckResult:
+    timings: Optional[Dict[str, float]] = {} if profile else None
+    started = time.perf_counter()
+    with collect(timings):
+        try:
+            result = func()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # A bug or an unexpected error in a check must not lose the
+            # results of the other ones
+            result = CheckResult(check_id)
+            result.fatal_errors += 1
+            result.error(f"❌ Check failed with an unexpected error: {e!r}")
+    result.id = check_id
+    result.duration = time.perf_counter() - started
+    result.timings = timings or {}
+    return result
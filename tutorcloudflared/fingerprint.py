@@ -0,0 +1,83 @@
+"Fingerprint of the rendered tunnel config and connectors, to restart them only when they change"
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from tutor import env, serialize
+from tutor.exceptions import TutorError
+
+from .constants import CONFIG_FINGERPRINT_FILENAME
+from .utils import get_state_path
+
+
+def get_config_path(root: str) -> str:
+    "Return the path of the rendered config.yml that is mounted in the connectors"
+    return env.pathjoin(root, "plugins", "cloudflared", "apps", "config.yml")
+
+
+def get_compose_path(root: str) -> str:
+    "Return the path of the rendered docker compose file that defines the connectors"
+    return env.pathjoin(root, "local", "docker-compose.yml")
+
+
+def compute_fingerprint(text: str, services: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Return the fingerprint of a tunnel config and of the docker compose
+    definitions of the services that run it. The config is parsed and
+    serialized again with sorted keys, so that formatting and comments don't
+    change the fingerprint, while the order of the ingress rules does.
+    """
+    canonical = json.dumps(
+        {"config": serialize.load(text), "services": services or {}},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _read(path: str) -> str:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    except OSError as e:
+        raise TutorError(
+            f"Could not read {path}: {e}\nDid you run `tutor config save`?"
+        ) from e
+
+
+def get_config_fingerprint(root: str, services: List[str]) -> str:
+    """
+    Return the fingerprint of the rendered tunnel config and of the rendered
+    definitions of the connector `services`, e.g their command, image and
+    ports, which the connectors only read when they are created.
+    """
+    compose = serialize.load(_read(get_compose_path(root))) or {}
+    definitions = compose.get("services") or {}
+    return compute_fingerprint(
+        _read(get_config_path(root)),
+        {service: definitions.get(service) for service in services},
+    )
+
+
+def read_applied_fingerprint(root: str) -> Optional[str]:
+    "Return the fingerprint of the config that the connectors were last recreated with"
+    try:
+        with open(
+            get_state_path(root, CONFIG_FINGERPRINT_FILENAME), encoding="utf-8"
+        ) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def save_applied_fingerprint(root: str, fingerprint: str) -> None:
+    "Record the fingerprint of the config that the connectors are running with"
+    path = get_state_path(root, CONFIG_FINGERPRINT_FILENAME)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(fingerprint + "\n")
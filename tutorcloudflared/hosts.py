@@ -0,0 +1,164 @@
+"Resolution of the public hosts that are exposed through the tunnel"
+
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List, Mapping, Optional, cast
+
+from tutor.exceptions import TutorError
+
+WILDCARD_PATTERN = re.compile(r"^\*\.(?:[a-z0-9](?:[a-z0-9-]*[a-z0-9])?\.)+[a-z0-9-]+$")
+# Names of the tunnels of CLOUDFLARED_TUNNELS, which are part of service and file names
+TUNNEL_NAME_PATTERN = re.compile(r"^[a-z](?:[a-z0-9-]*[a-z0-9])?$")
+
+
+def get_public_hosts(configs: Mapping[str, Any]) -> Dict[str, str]:
+    """
+    Return the hosts of CLOUDFLARED_PUBLIC_HOSTS that are set, as a
+    host_key => host_value dict, in the same order as the setting.
+    """
+    hosts_keys = cast(List[str], configs.get("CLOUDFLARED_PUBLIC_HOSTS") or [])
+    return {
+        host_key: cast(str, configs.get(host_key))
+        for host_key in hosts_keys
+        if configs.get(host_key) is not None
+    }
+
+
+def get_undefined_hosts(configs: Mapping[str, Any]) -> List[str]:
+    "Return the keys of CLOUDFLARED_PUBLIC_HOSTS that are not set"
+    hosts_keys = cast(List[str], configs.get("CLOUDFLARED_PUBLIC_HOSTS") or [])
+    return [host_key for host_key in hosts_keys if configs.get(host_key) is None]
+
+
+def get_wildcard_hosts(configs: Mapping[str, Any]) -> List[str]:
+    """
+    Return the CLOUDFLARED_WILDCARD_HOSTS, e.g "*.example.com". Invalid ones
+    raise a TutorError, so that they are reported when rendering.
+    """
+    wildcard_hosts = configs.get("CLOUDFLARED_WILDCARD_HOSTS") or []
+    if not isinstance(wildcard_hosts, list):
+        raise TutorError(
+            f"CLOUDFLARED_WILDCARD_HOSTS should be a list, got '{wildcard_hosts}'"
+        )
+    for wildcard_host in wildcard_hosts:
+        if not isinstance(wildcard_host, str) or not WILDCARD_PATTERN.match(
+            wildcard_host
+        ):
+            raise TutorError(
+                f"Invalid CLOUDFLARED_WILDCARD_HOSTS '{wildcard_host}', "
+                "expected a lower case wildcard host such as *.example.com"
+            )
+    return cast(List[str], wildcard_hosts)
+
+
+def get_covering_wildcard(host: str, wildcard_hosts: List[str]) -> Optional[str]:
+    """
+    Return the wildcard host that covers a host, if any. Like DNS wildcards,
+    "*.example.com" covers "a.example.com" but neither "a.b.example.com" nor
+    "example.com".
+    """
+    for wildcard_host in wildcard_hosts:
+        suffix = wildcard_host[1:]
+        if host.endswith(suffix) and "." not in host[: -len(suffix)]:
+            return wildcard_host
+    return None
+
+
+def get_tunnel_host_keys(configs: Mapping[str, Any]) -> Dict[str, List[str]]:
+    """
+    Return the host keys that each tunnel routes, by tunnel name. The
+    CLOUDFLARED_TUNNEL_NAME tunnel comes first, with the keys of
+    CLOUDFLARED_PUBLIC_HOSTS that CLOUDFLARED_TUNNELS doesn't assign to another
+    tunnel. An invalid CLOUDFLARED_TUNNELS raises a TutorError, so that it's
+    reported when rendering.
+    """
+    default_tunnel = cast(str, configs.get("CLOUDFLARED_TUNNEL_NAME", ""))
+    hosts_keys = cast(List[str], configs.get("CLOUDFLARED_PUBLIC_HOSTS") or [])
+    tunnels = configs.get("CLOUDFLARED_TUNNELS") or {}
+    if not isinstance(tunnels, dict):
+        raise TutorError(
+            f"CLOUDFLARED_TUNNELS should be a dict of tunnel name => host keys, got '{tunnels}'"
+        )
+    assigned: Dict[str, str] = {}
+    for tunnel_name, tunnel_keys in tunnels.items():
+        if not TUNNEL_NAME_PATTERN.match(str(tunnel_name)):
+            raise TutorError(
+                f"Invalid tunnel name '{tunnel_name}' in CLOUDFLARED_TUNNELS, expected"
+                " lower case letters, digits and dashes, starting with a letter"
+            )
+        if tunnel_name == default_tunnel:
+            raise TutorError(
+                f"CLOUDFLARED_TUNNELS can't include the CLOUDFLARED_TUNNEL_NAME tunnel"
+                f" '{tunnel_name}', which routes the hosts that are not assigned"
+            )
+        if not isinstance(tunnel_keys, list):
+            raise TutorError(
+                f"The hosts of tunnel '{tunnel_name}' in CLOUDFLARED_TUNNELS should be"
+                f" a list of host keys, got '{tunnel_keys}'"
+            )
+        for host_key in tunnel_keys:
+            if host_key not in hosts_keys:
+                raise TutorError(
+                    f"'{host_key}' of tunnel '{tunnel_name}' in CLOUDFLARED_TUNNELS"
+                    " is not one of CLOUDFLARED_PUBLIC_HOSTS"
+                )
+            if host_key in assigned:
+                raise TutorError(
+                    f"'{host_key}' is assigned to both tunnels '{assigned[host_key]}'"
+                    f" and '{tunnel_name}' in CLOUDFLARED_TUNNELS"
+                )
+            assigned[host_key] = tunnel_name
+    return {
+        default_tunnel: [key for key in hosts_keys if key not in assigned],
+        **{
+            tunnel_name: [key for key in hosts_keys if assigned.get(key) == tunnel_name]
+            for tunnel_name in tunnels
+        },
+    }
+
+
+def get_tunnel_hosts(
+    configs: Mapping[str, Any], tunnel_name: Optional[str] = None
+) -> Dict[str, str]:
+    """
+    Return the public hosts that are set and routed by a tunnel, by default the
+    CLOUDFLARED_TUNNEL_NAME one, as a host_key => host_value dict.
+    """
+    public_hosts = get_public_hosts(configs)
+    if not configs.get("CLOUDFLARED_TUNNELS"):
+        return public_hosts
+    tunnels = get_tunnel_host_keys(configs)
+    if tunnel_name is None:
+        tunnel_name = next(iter(tunnels))
+    return {
+        host_key: public_hosts[host_key]
+        for host_key in tunnels.get(tunnel_name, [])
+        if host_key in public_hosts
+    }
+
+
+def is_default_tunnel(configs: Mapping[str, Any], tunnel_name: Optional[str]) -> bool:
+    "Return whether a tunnel is the CLOUDFLARED_TUNNEL_NAME one, which is the default"
+    return tunnel_name is None or tunnel_name == configs.get("CLOUDFLARED_TUNNEL_NAME")
+
+
+def get_dns_routes(
+    configs: Mapping[str, Any], tunnel_name: Optional[str] = None
+) -> List[str]:
+    """
+    Return the hosts that need a DNS route to a tunnel, by default the
+    CLOUDFLARED_TUNNEL_NAME one: the wildcard hosts, and the public hosts that
+    are not covered by one of them. Wildcard hosts are only routed by the
+    default tunnel, so the hosts of the other tunnels always get their own DNS
+    route, which takes precedence over a wildcard record.
+    """
+    tunnel_hosts = get_tunnel_hosts(configs, tunnel_name)
+    if not is_default_tunnel(configs, tunnel_name):
+        return list(tunnel_hosts.values())
+    wildcard_hosts = get_wildcard_hosts(configs)
+    return [
+        host
+        for host in tunnel_hosts.values()
+        if get_covering_wildcard(host, wildcard_hosts) is None
+    ] + wildcard_hosts
@@ -0,0 +1,63 @@
+"Size and start time of the connector image, as reported after it is built"
+
+from __future__ import annotations
+
+import statistics
+import subprocess
+import time
+from typing import Any, Dict, List
+
+from tutor.exceptions import TutorError
+
+
+def _docker(*args: str) -> str:
+    try:
+        r = subprocess.run(
+            ["docker", *args], capture_output=True, text=True, check=False
+        )
+    except OSError as e:
+        raise TutorError(f"Could not run docker: {e}") from e
+    if r.returncode != 0:
+        raise TutorError(f"docker {args[0]} failed: {r.stderr.strip()}")
+    return r.stdout.strip()
+
+
+def get_image_size(tag: str) -> int:
+    "Return the size of a local image, in bytes"
+    return int(_docker("image", "inspect", "--format", "{{.Size}}", tag))
+
+
+def measure_start_time(tag: str, runs: int = 3) -> List[float]:
+    """
+    Return the time, in seconds, that it takes to create, start and remove a
+    container of the image that runs `cloudflared --version`, for each run.
+    """
+    durations = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        _docker("run", "--rm", tag, "cloudflared", "--version")
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def get_image_report(tag: str, runs: int = 3) -> Dict[str, Any]:
+    "Return the size and the start time of an image"
+    durations = measure_start_time(tag, runs) if runs > 0 else []
+    return {
+        "image": tag,
+        "size": get_image_size(tag),
+        "start_time": {
+            "median": statistics.median(durations) if durations else None,
+            "min": min(durations, default=None),
+            "runs": len(durations),
+        },
+    }
+
+
+def format_size(size: float) -> str:
+    "Format a number of bytes in human-readable units"
+    for unit in ("B", "kB", "MB"):
+        if size < 1000:
+            return f"{size:.1f}{unit}"
+        size /= 1000
+    return f"{size:.1f}GB"
@@ -0,0 +1,208 @@
+"Rendering helpers for the ingress rules of the cloudflared config.yml"
+
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple, cast
+
+from tutor.exceptions import TutorError
+
+from .hosts import get_wildcard_hosts
+
+DURATION_PATTERN = re.compile(r"^(?:(\d+(?:\.\d+)?)(ns|us|µs|ms|s|m|h))+$")
+DURATION_UNITS = {
+    "ns": 1e-9,
+    "us": 1e-6,
+    "µs": 1e-6,
+    "ms": 1e-3,
+    "s": 1,
+    "m": 60,
+    "h": 3600,
+}
+MAX_DURATION = 24 * 3600
+MAX_KEEP_ALIVE_CONNECTIONS = 10000
+# Origin services that cloudflared can proxy to from an ingress rule
+SERVICE_PATTERN = re.compile(
+    r"^(?:(?:https?|tcp|unix)://[^\s/]+\S*|http_status:\d{3})$"
+)
+# Caddy, which is the default origin of all hosts
+DEFAULT_SERVICE = "http://caddy"
+
+
+def parse_duration(value: Any) -> float:
+    """
+    Parse a duration in the format that cloudflared expects, e.g "30s" or
+    "1m30s", and return it in seconds.
+    """
+    if not isinstance(value, str) or not DURATION_PATTERN.match(value):
+        raise ValueError(
+            f"'{value}' is not a duration, use a number with a unit, e.g 30s, 1m30s or 500ms"
+        )
+    return sum(
+        float(number) * DURATION_UNITS[unit]
+        for number, unit in re.findall(r"(\d+(?:\.\d+)?)(ns|us|µs|ms|s|m|h)", value)
+    )
+
+
+def _duration(value: Any) -> str:
+    seconds = parse_duration(value)
+    if not 0 < seconds <= MAX_DURATION:
+        raise ValueError(f"'{value}' should be longer than 0s and at most 24h")
+    return cast(str, value)
+
+
+def _keep_alive_connections(value: Any) -> str:
+    if (
+        isinstance(value, bool)
+        or not isinstance(value, int)
+        or not 0 <= value <= MAX_KEEP_ALIVE_CONNECTIONS
+    ):
+        raise ValueError(
+            f"'{value}' should be an integer between 0 and {MAX_KEEP_ALIVE_CONNECTIONS}"
+        )
+    return str(value)
+
+
+def _boolean(value: Any) -> str:
+    if not isinstance(value, bool):
+        raise ValueError(f"'{value}' should be true or false")
+    return "true" if value else "false"
+
+
+def _string(value: Any) -> str:
+    if not isinstance(value, str) or not value:
+        raise ValueError(f"'{value}' should be a non-empty string")
+    return json.dumps(value)
+
+
+# originRequest settings of cloudflared that can be configured, and their
+# validator, which also formats the value as YAML.
+# See https://developers.cloudflare.com/cloudflare-one/connections/connect-networks/configure-tunnels/origin-configuration/
+ORIGIN_REQUEST_SETTINGS: Dict[str, Callable[[Any], str]] = {
+    "connectTimeout": _duration,
+    "tlsTimeout": _duration,
+    "tcpKeepAlive": _duration,
+    "keepAliveTimeout": _duration,
+    "keepAliveConnections": _keep_alive_connections,
+    "noHappyEyeballs": _boolean,
+    "http2Origin": _boolean,
+    "disableChunkedEncoding": _boolean,
+    "noTLSVerify": _boolean,
+    "httpHostHeader": _string,
+    "originServerName": _string,
+    "matchSNItoHost": _boolean,
+}
+
+
+def get_origin_request(
+    configs: Mapping[str, Any], host_key: str, host_value: str
+) -> List[Tuple[str, str]]:
+    """
+    Return the originRequest settings of a public host as (name, YAML value)
+    pairs: the CLOUDFLARED_ORIGIN_REQUEST defaults, overridden by the settings
+    of the host in CLOUDFLARED_ORIGIN_REQUEST_OVERRIDES. Invalid settings
+    raise a TutorError, so that they are reported when rendering.
+    Wildcard hosts, whose key is the host itself, match the server name of
+    the origin to the host of each request instead.
+    """
+    defaults = _mapping(configs, "CLOUDFLARED_ORIGIN_REQUEST")
+    overrides = _mapping(configs, "CLOUDFLARED_ORIGIN_REQUEST_OVERRIDES")
+    _check_host_keys(configs, "CLOUDFLARED_ORIGIN_REQUEST_OVERRIDES", overrides)
+    for key, host_settings in overrides.items():
+        if not isinstance(host_settings, dict):
+            raise TutorError(
+                f"Invalid CLOUDFLARED_ORIGIN_REQUEST_OVERRIDES: the settings of '{key}'"
+                f" should be a mapping of originRequest settings, got '{host_settings}'"
+            )
+    settings: Dict[str, Any] = (
+        {"matchSNItoHost": True}
+        if host_value.startswith("*.")
+        else {"originServerName": host_value}
+    )
+    settings.update(defaults)
+    settings.update(overrides.get(host_key) or {})
+    origin_request = []
+    for name, value in settings.items():
+        if name not in ORIGIN_REQUEST_SETTINGS:
+            raise TutorError(
+                f"Unknown originRequest setting '{name}' for {host_key}, "
+                f"expected one of: {', '.join(ORIGIN_REQUEST_SETTINGS)}"
+            )
+        try:
+            origin_request.append((name, ORIGIN_REQUEST_SETTINGS[name](value)))
+        except ValueError as e:
+            raise TutorError(
+                f"Invalid originRequest setting '{name}' for {host_key}: {e}"
+            ) from e
+    return origin_request
+
+
+def _service(value: Any) -> str:
+    if not isinstance(value, str) or not SERVICE_PATTERN.match(value):
+        raise ValueError(
+            f"'{value}' is not a service, use a URL such as http://lms:8000 or http_status:404"
+        )
+    return value
+
+
+def _path(value: Any) -> str:
+    if not isinstance(value, str) or not value:
+        raise ValueError(f"'{value}' should be a non-empty regular expression")
+    try:
+        re.compile(value)
+    except re.error as e:
+        raise ValueError(f"'{value}' is not a valid regular expression: {e}") from e
+    return json.dumps(value)
+
+
+def _mapping(configs: Mapping[str, Any], setting: str) -> Dict[str, Any]:
+    value = configs.get(setting) or {}
+    if not isinstance(value, dict):
+        raise TutorError(f"Invalid {setting}: it should be a mapping, got '{value}'")
+    return value
+
+
+def _check_host_keys(
+    configs: Mapping[str, Any], setting: str, mapping: Mapping[str, Any]
+) -> None:
+    public_hosts = cast(List[str], configs.get("CLOUDFLARED_PUBLIC_HOSTS") or [])
+    wildcard_hosts = get_wildcard_hosts(configs)
+    for host_key in mapping:
+        if host_key not in public_hosts and host_key not in wildcard_hosts:
+            raise TutorError(
+                f"Invalid {setting}: '{host_key}' is not one of CLOUDFLARED_PUBLIC_HOSTS"
+                " nor of CLOUDFLARED_WILDCARD_HOSTS"
+            )
+
+
+def get_ingress_rules(
+    configs: Mapping[str, Any], host_key: str
+) -> List[Tuple[Optional[str], str]]:
+    """
+    Return the ingress rules of a public host as (path, service) pairs. The
+    path-scoped rules of CLOUDFLARED_PATH_SERVICES come first, then the rule
+    for the whole host. When CLOUDFLARED_DIRECT_ROUTING is enabled, the host
+    is routed to its service in CLOUDFLARED_DIRECT_SERVICES instead of caddy;
+    hosts that are not mapped still go through caddy. Wildcard hosts are
+    mapped by the wildcard host itself, e.g "*.example.com". Invalid settings
+    raise a TutorError, so that they are reported when rendering.
+    """
+    path_services = cast(
+        Dict[str, Dict[str, Any]], configs.get("CLOUDFLARED_PATH_SERVICES") or {}
+    )
+    _check_host_keys(configs, "CLOUDFLARED_PATH_SERVICES", path_services)
+    service: Any = DEFAULT_SERVICE
+    if configs.get("CLOUDFLARED_DIRECT_ROUTING"):
+        direct_services = cast(
+            Dict[str, Any], configs.get("CLOUDFLARED_DIRECT_SERVICES") or {}
+        )
+        service = direct_services.get(host_key) or DEFAULT_SERVICE
+    rules: List[Tuple[Optional[str], str]] = []
+    try:
+        for path, path_service in (path_services.get(host_key) or {}).items():
+            rules.append((_path(path), _service(path_service)))
+        rules.append((None, _service(service)))
+    except ValueError as e:
+        raise TutorError(f"Invalid ingress rule for {host_key}: {e}") from e
+    return rules
@@ -0,0 +1,249 @@
+"""
+Load test of a public host through one of the layers that serve it: the
+Django or MFE service directly, caddy, or the tunnel, with keep-alive clients
+that run concurrently in an event loop.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import ssl
+import time
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+from tutor.exceptions import TutorError
+
+from .constants import LOADTEST_TIMEOUT
+from .ingress import DEFAULT_SERVICE, get_ingress_rules
+
+LAYERS = ("direct", "caddy", "tunnel")
+PERCENTILES = (50, 95, 99)
+
+
+def get_layer_url(
+    configs: Mapping[str, Any], layer: str, host_key: str, host: str
+) -> str:
+    """
+    Return the URL through which a public host is served by a layer: its service in
+    CLOUDFLARED_DIRECT_SERVICES for "direct", as it would be rendered in the
+    ingress with CLOUDFLARED_DIRECT_ROUTING, the caddy port of the host for
+    "caddy", and the public URL, through the Cloudflare edge and the connectors,
+    for "tunnel". The service names of "direct" only resolve inside the docker
+    network, see `replace_host`.
+    """
+    if layer == "direct":
+        service = get_ingress_rules(
+            {**configs, "CLOUDFLARED_DIRECT_ROUTING": True}, host_key
+        )[-1][1]
+        if service == DEFAULT_SERVICE:
+            raise TutorError(
+                f"{host_key} has no service in CLOUDFLARED_DIRECT_SERVICES,"
+                " it's only served through caddy"
+            )
+        return service
+    if layer == "caddy":
+        return f"http://127.0.0.1:{configs.get('CADDY_HTTP_PORT', 80)}"
+    if layer == "tunnel":
+        return f"https://{host}"
+    raise TutorError(f"Unknown layer '{layer}', should be one of {', '.join(LAYERS)}")
+
+
+def replace_host(url: str, address: str) -> str:
+    "Return the URL with another host, e.g the address of the container of a service"
+    parts = urlsplit(url)
+    netloc = f"{address}:{parts.port}" if parts.port else address
+    return parts._replace(netloc=netloc).geturl()
+
+
+class Response(NamedTuple):
+    status: int
+    keep_alive: bool
+
+
+class Connection:
+    "A keep-alive HTTP/1.1 connection, which is opened again when the server closes it"
+
+    def __init__(self, url: str, host: str, timeout: float = LOADTEST_TIMEOUT) -> None:
+        parts = urlsplit(url)
+        self.https = parts.scheme == "https"
+        self.address = (parts.hostname or "", parts.port or (443 if self.https else 80))
+        self.host = host
+        self.timeout = timeout
+        self.connections = 0
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def _connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        if self._reader is None or self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(
+                *self.address,
+                ssl=ssl.create_default_context() if self.https else None,
+                server_hostname=self.host if self.https else None,
+            )
+            self.connections += 1
+        return self._reader, self._writer
+
+    async def request(self, path: str) -> int:
+        "Send a GET request, read the full response, and return its status"
+        try:
+            response = await asyncio.wait_for(self._request(path), self.timeout)
+        except BaseException:
+            await self.close()
+            raise
+        if not response.keep_alive:
+            await self.close()
+        return response.status
+
+    async def _request(self, path: str) -> Response:
+        reader, writer = await self._connect()
+        writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+            "User-Agent: tutor-cloudflared-loadtest\r\n\r\n".encode()
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("The connection was closed by the server")
+        version, status = status_line.decode("latin-1").split()[:2]
+        headers: Dict[str, str] = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = (
+            headers.get("connection", "").lower() != "close" and version != "HTTP/1.0"
+        )
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif "content-length" in headers:
+            await reader.readexactly(int(headers["content-length"]))
+        elif status[0] != "1" and status not in ("204", "304"):
+            # The body ends when the connection is closed
+            await reader.read()
+            keep_alive = False
+        return Response(int(status), keep_alive)
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (OSError, ssl.SSLError):
+                pass
+        self._reader = self._writer = None
+
+
+class LoadTestResult:
+    "The latencies, in seconds, of the successful requests, and the failures"
+
+    def __init__(self) -> None:
+        self.latencies: List[float] = []
+        self.statuses: Dict[int, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.connections = 0
+        self.duration = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        "Return the throughput and latency percentiles as a JSON-serializable dict"
+        latencies = sorted(self.latencies)
+        requests = len(latencies) + sum(self.errors.values())
+        percentiles = {p: percentile(latencies, p) for p in PERCENTILES}
+        return {
+            "requests": requests,
+            "errors": sum(self.errors.values()),
+            "statuses": {str(status): count for status, count in self.statuses.items()},
+            "error_messages": self.errors,
+            "connections": self.connections,
+            "duration": self.duration,
+            "requests_per_second": requests / self.duration if self.duration else None,
+            "latency_ms": {
+                f"p{p}": None if value is None else value * 1000
+                for p, value in percentiles.items()
+            },
+        }
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    "Return the nearest-rank percentile of sorted values"
+    if not values:
+        return None
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+async def _client(
+    connection: Connection,
+    path: str,
+    result: LoadTestResult,
+    deadline: float,
+    remaining: List[int],
+) -> None:
+    while time.monotonic() < deadline and remaining[0] != 0:
+        remaining[0] -= 1
+        started = time.perf_counter()
+        try:
+            status = await connection.request(path)
+        except (OSError, EOFError, ValueError, asyncio.TimeoutError) as e:
+            error = str(e) or type(e).__name__
+            result.errors[error] = result.errors.get(error, 0) + 1
+            continue
+        result.latencies.append(time.perf_counter() - started)
+        result.statuses[status] = result.statuses.get(status, 0) + 1
+
+
+async def run_load(
+    url: str,
+    host: str,
+    path: str = "/",
+    concurrency: int = 10,
+    duration: float = 10,
+    requests: Optional[int] = None,
+    timeout: float = LOADTEST_TIMEOUT,
+) -> LoadTestResult:
+    """
+    Send requests for `path` of `host` to `url` from `concurrency` clients,
+    each with its own keep-alive connection, for `duration` seconds or until
+    `requests` requests were sent.
+    """
+    result = LoadTestResult()
+    connections = [Connection(url, host, timeout) for _ in range(concurrency)]
+    # Shared by the clients, which all run in the same thread. -1 is no limit.
+    remaining = [-1 if requests is None else requests]
+    started = time.monotonic()
+    try:
+        await asyncio.gather(
+            *(
+                _client(connection, path, result, started + duration, remaining)
+                for connection in connections
+            )
+        )
+    finally:
+        result.duration = time.monotonic() - started
+        for connection in connections:
+            await connection.close()
+    result.connections = sum(connection.connections for connection in connections)
+    return result
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    "Format a result dict as a single line"
+    rate = result["requests_per_second"]
+    latency = ", ".join(
+        f"{name} {value:.1f}ms"
+        for name, value in result["latency_ms"].items()
+        if value is not None
+    )
+    return (
+        f"{result['requests']} requests"
+        + (f" ({rate:.1f}/s)" if rate is not None else "")
+        + f", {result['errors']} errors"
+        + (f", latency {latency}" if latency else "")
+        + f", {result['connections']} connection(s)"
+    )
@@ -0,0 +1,371 @@
+"""
+Streaming analysis of the JSON logs of the cloudflared connectors. Log lines
+flow through a pipeline of generators, from files to events to time windows,
+so that files of any size are analyzed in bounded memory.
+"""
+
+from __future__ import annotations
+
+import bisect
+import gzip
+import heapq
+import io
+import json
+import os
+import re
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .constants import LOGS_DIR, LOGS_FOLLOW_INTERVAL, LOGS_MAX_PENDING_REQUESTS
+from .metrics import histogram_quantile
+
+TIME_PATTERN = re.compile(
+    r"^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d+))?(Z|[+-]\d\d:?\d\d)?$"
+)
+REQUEST_PATTERN = re.compile(r"^[A-Z]+ (https?://[^\s/]+)\S* HTTP/[\d.]+$")
+STATUS_PATTERN = re.compile(r"^(\d{3})\b")
+# Segments that cloudflared rotates out of its log directory, possibly compressed
+# afterwards by an external tool, e.g cloudflared-2024-05-01T12-00-00.000.log.gz
+ROTATED_PATTERN = re.compile(r"-\d{4}-\d\d-\d\dT\d\d-\d\d-\d\d\.\d{3}\.log(\.gz)?$")
+# Messages of the connectors when an edge connection is lost or retried
+DISCONNECT_MESSAGES = (
+    "Connection terminated",
+    "Retrying connection",
+    "Serve tunnel error",
+    "Unregistered tunnel connection",
+)
+# Upper bounds of the latency histograms, in milliseconds: from 1ms to about
+# 2 minutes, each 19% larger than the previous one
+LATENCY_BUCKETS = tuple(2 ** (i / 4) for i in range(68)) + (float("inf"),)
+PERCENTILES = (50, 95, 99)
+
+
+def parse_time(value: Any) -> Optional[float]:
+    "Parse an RFC 3339 time, with up to nanoseconds, as a UNIX timestamp"
+    match = TIME_PATTERN.match(str(value))
+    if not match:
+        return None
+    base, fraction, offset = match.groups()
+    parsed = datetime.strptime(base, "%Y-%m-%dT%H:%M:%S")
+    if offset and offset != "Z":
+        sign = -1 if offset[0] == "-" else 1
+        hours, minutes = int(offset[1:3]), int(offset[-2:])
+        parsed -= sign * timedelta(hours=hours, minutes=minutes)
+    timestamp = parsed.replace(tzinfo=timezone.utc).timestamp()
+    return timestamp + (float(f"0.{fraction}") if fraction else 0)
+
+
+def get_log_files(directory: str) -> List[str]:
+    """
+    Return the log files of a directory and of its subdirectories, i.e the log
+    directory of each connector. The segments that cloudflared rotated are
+    included, and so are the ones that were compressed afterwards.
+    """
+    return sorted(
+        os.path.join(dirpath, filename)
+        for dirpath, _dirnames, filenames in os.walk(directory)
+        for filename in filenames
+        if filename.endswith((".log", ".log.gz"))
+    )
+
+
+def is_rotated(path: str) -> bool:
+    "Return whether a log file is a rotated segment, which isn't written anymore"
+    return ROTATED_PATTERN.search(path) is not None or path.endswith(".gz")
+
+
+def get_logs_dir(root: str) -> str:
+    "Return the folder where each connector writes its log files, in its own folder"
+    return os.path.join(root, *LOGS_DIR)
+
+
+def open_log(path: str) -> IO[str]:
+    "Open a log file, or a gzip-compressed one, as text"
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(
+            gzip.open(path, "rb"), encoding="utf-8", errors="replace"
+        )
+    return open(path, encoding="utf-8", errors="replace")
+
+
+def read_lines(path: str) -> Iterator[str]:
+    "Yield the lines of a log file, one at a time"
+    with open_log(path) as f:
+        yield from f
+
+
+def follow_lines(
+    paths: List[str], interval: float = LOGS_FOLLOW_INTERVAL
+) -> Iterator[str]:
+    """
+    Yield the lines that are appended to the files, forever, starting from
+    their end. A file that is rotated or truncated is opened again, and read
+    from its start. An empty string is yielded each time there is nothing new,
+    so that the consumer can report what it has so far.
+    """
+    files: Dict[str, Tuple[IO[str], int]] = {}
+    try:
+        while True:
+            new_lines = False
+            for path in paths:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if path not in files:
+                    f = open_log(path)
+                    f.seek(0, os.SEEK_END)
+                    files[path] = (f, stat.st_ino)
+                f, inode = files[path]
+                if inode != stat.st_ino or stat.st_size < f.tell():
+                    f.close()
+                    f = open_log(path)
+                    files[path] = (f, stat.st_ino)
+                # Lines that are still being written are read again once complete
+                while True:
+                    position = f.tell()
+                    line = f.readline()
+                    if not line.endswith("\n"):
+                        f.seek(position)
+                        break
+                    new_lines = True
+                    yield line
+            if not new_lines:
+                yield ""
+                time.sleep(interval)
+    finally:
+        for f, _inode in files.values():
+            f.close()
+
+
+def parse_events(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Parse JSON log lines into events, with their time as a UNIX timestamp in
+    `_time`. Lines that are not JSON, or that have no time, are skipped.
+    Empty lines are passed through as empty events.
+    """
+    for line in lines:
+        if not line:
+            yield {}
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(event, dict):
+            continue
+        timestamp = parse_time(event.get("time"))
+        if timestamp is None:
+            continue
+        event["_time"] = timestamp
+        yield event
+
+
+def merge_events(streams: List[Iterator[Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+    "Merge the events of several files, each in time order, in time order"
+    return heapq.merge(*streams, key=lambda event: float(event["_time"]))
+
+
+class Histogram:
+    "Latencies, in milliseconds, counted in fixed buckets"
+
+    __slots__ = ("counts",)
+
+    def __init__(self) -> None:
+        self.counts = [0] * len(LATENCY_BUCKETS)
+
+    def add(self, latency: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    def update(self, other: Histogram) -> None:
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+
+    def quantiles(self) -> Dict[str, Optional[float]]:
+        cumulative: Dict[float, float] = {}
+        total = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            total += count
+            cumulative[bound] = total
+        return {f"p{p}": histogram_quantile(p / 100, cumulative) for p in PERCENTILES}
+
+
+class HostWindow:
+    "What happened to a public host during a window"
+
+    __slots__ = ("requests", "statuses", "origin_errors", "latency")
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.statuses: Counter[str] = Counter()
+        self.origin_errors = 0
+        self.latency = Histogram()
+
+    def update(self, other: HostWindow) -> None:
+        self.requests += other.requests
+        self.statuses.update(other.statuses)
+        self.origin_errors += other.origin_errors
+        self.latency.update(other.latency)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "statuses": dict(self.statuses),
+            "origin_errors": self.origin_errors,
+            "latency_ms": self.latency.quantiles(),
+        }
+
+
+class Window:
+    "Aggregated events of a time window, per public host"
+
+    def __init__(self, start: float, duration: float) -> None:
+        self.start = start
+        self.duration = duration
+        self.hosts: Dict[str, HostWindow] = {}
+        self.reconnects = 0
+
+    def host(self, hostname: str) -> HostWindow:
+        return self.hosts.setdefault(hostname, HostWindow())
+
+    def update(self, other: Window) -> None:
+        for hostname, stats in other.hosts.items():
+            self.host(hostname).update(stats)
+        self.reconnects += other.reconnects
+
+    def to_dict(self) -> Dict[str, Any]:
+        total = HostWindow()
+        for stats in self.hosts.values():
+            total.update(stats)
+        return {
+            "start": datetime.fromtimestamp(self.start, timezone.utc).isoformat(),
+            "duration": self.duration,
+            "reconnects": self.reconnects,
+            **total.to_dict(),
+            "hosts": {
+                hostname: stats.to_dict()
+                for hostname, stats in sorted(self.hosts.items())
+            },
+        }
+
+
+class LogAnalyzer:
+    """
+    Aggregate log events into windows of `window` seconds. Requests are matched
+    with their response by their cfRay, to measure the latency of the origin;
+    requests whose response is never logged are forgotten after
+    `max_pending` newer ones, so that memory stays bounded.
+    """
+
+    def __init__(
+        self, window: float, max_pending: int = LOGS_MAX_PENDING_REQUESTS
+    ) -> None:
+        self.window = window
+        self.max_pending = max_pending
+        self.current: Optional[Window] = None
+        self.total: Optional[Window] = None
+        self._pending: OrderedDict[str, Tuple[str, float]] = OrderedDict()
+
+    def feed(self, events: Iterable[Dict[str, Any]]) -> Iterator[Window]:
+        """
+        Consume events, and yield each window as soon as it's complete: when a
+        later event comes, or, for the empty events of followed logs, once the
+        window is over.
+        """
+        for event in events:
+            if not event:
+                if (
+                    self.current is not None
+                    and time.time() >= self.current.start + self.window
+                ):
+                    yield self._close()
+                continue
+            timestamp = float(event["_time"])
+            start = timestamp - timestamp % self.window
+            if self.current is None or start > self.current.start:
+                if self.current is not None:
+                    yield self._close()
+                self.current = Window(start, self.window)
+            self._add(self.current, event, timestamp)
+
+    def flush(self) -> Optional[Window]:
+        "Return the window that is still open, if any"
+        return self._close() if self.current is not None else None
+
+    def _close(self) -> Window:
+        window = self.current
+        assert window is not None
+        if self.total is None:
+            self.total = Window(window.start, 0)
+        self.total.update(window)
+        self.total.duration = window.start + window.duration - self.total.start
+        self.current = None
+        return window
+
+    def _add(self, window: Window, event: Dict[str, Any], timestamp: float) -> None:
+        message = str(event.get("message", ""))
+        ray = str(event.get("cfRay", ""))
+        request = REQUEST_PATTERN.match(message)
+        if request:
+            hostname = request.group(1).split("://", 1)[1]
+            window.host(hostname).requests += 1
+            if ray:
+                self._pending[ray] = (hostname, timestamp)
+                while len(self._pending) > self.max_pending:
+                    self._pending.popitem(last=False)
+            return
+        if message.startswith(DISCONNECT_MESSAGES):
+            window.reconnects += 1
+            return
+        if str(event.get("level")) == "error" and (
+            "originService" in event or "origin" in str(event.get("error", "")).lower()
+        ):
+            # The response that follows, usually a 502, is counted as well
+            pending = self._pending.get(ray) if ray else None
+            hostname = pending[0] if pending is not None else _get_hostname(event)
+            window.host(hostname).origin_errors += 1
+            return
+        status = STATUS_PATTERN.match(str(event.get("status") or message))
+        if status and ray in self._pending:
+            hostname, requested = self._pending.pop(ray)
+            stats = window.host(hostname)
+            stats.statuses[status.group(1)] += 1
+            stats.latency.add((timestamp - requested) * 1000)
+
+
+def _get_hostname(event: Dict[str, Any]) -> str:
+    for field in ("host", "hostname", "dest", "url"):
+        value = str(event.get(field) or "")
+        if value:
+            return value.split("://", 1)[-1].split("/", 1)[0]
+    return "unknown"
+
+
+def format_window(window: Dict[str, Any]) -> List[str]:
+    "Format a window dict as lines, the whole window first, then each host"
+    lines = []
+    for name, stats in [(window["start"], window)] + list(window["hosts"].items()):
+        statuses = " ".join(
+            f"{status}:{count}" for status, count in sorted(stats["statuses"].items())
+        )
+        latency = ", ".join(
+            f"{p} {value:.1f}ms"
+            for p, value in stats["latency_ms"].items()
+            if value is not None
+        )
+        line = (
+            f"{stats['requests']} requests"
+            + (f" ({statuses})" if statuses else "")
+            + f", {stats['origin_errors']} origin errors"
+            + (f", latency {latency}" if latency else "")
+        )
+        if stats is window:
+            lines.append(
+                f"{name} ({window['duration']:.0f}s): {line},"
+                f" {window['reconnects']} edge reconnects"
+            )
+        else:
+            lines.append(f"  {name}: {line}")
+    return lines
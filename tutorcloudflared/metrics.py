@@ -0,0 +1,257 @@
+"Scraping and summarizing the Prometheus metrics of the cloudflared connectors"
+
+from __future__ import annotations
+
+import math
+import time
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from .constants import METRICS_TIMEOUT
+from .utils import get_session
+
+REQUESTS_METRIC = "cloudflared_tunnel_total_requests"
+ERRORS_METRIC = "cloudflared_tunnel_request_errors"
+ACTIVE_STREAMS_METRIC = "cloudflared_tunnel_active_streams"
+CONCURRENT_REQUESTS_METRIC = "cloudflared_tunnel_concurrent_requests_per_tunnel"
+HA_CONNECTIONS_METRIC = "cloudflared_tunnel_ha_connections"
+# Time it takes the connectors to connect to the origin. cloudflared exposes no
+# histogram of the response time of requests, which only its debug logs have.
+LATENCY_METRIC = "cloudflared_proxy_connect_latency"
+# Labels that identify the public host of a series. Most cloudflared metrics
+# are tunnel-wide, so series without one of these only count for the tunnel.
+HOSTNAME_LABELS = ("hostname", "host")
+TUNNEL = ""
+PERCENTILES = (50, 90, 99)
+
+
+class Sample(NamedTuple):
+    "A single series value of the Prometheus text format"
+
+    name: str
+    labels: Dict[str, str]
+    value: float
+
+
+def _parse_labels(text: str) -> Dict[str, str]:
+    labels = {}
+    position = 0
+    while position < len(text):
+        equal = text.index("=", position)
+        name = text[position:equal].strip().lstrip(",").strip()
+        # Values are double-quoted, and may contain escaped characters
+        position = text.index('"', equal) + 1
+        value = []
+        while text[position] != '"':
+            if text[position] == "\\":
+                position += 1
+                value.append("\n" if text[position] == "n" else text[position])
+            else:
+                value.append(text[position])
+            position += 1
+        labels[name] = "".join(value)
+        position += 1
+        while position < len(text) and text[position] in ", ":
+            position += 1
+    return labels
+
+
+def parse_metrics(lines: Iterable[str]) -> Iterator[Sample]:
+    """
+    Parse lines in the Prometheus text format, one at a time, so that the
+    metrics are never loaded in memory all at once. Comments and lines that
+    can't be parsed are skipped.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            if "{" in line:
+                name, rest = line.split("{", 1)
+                labels_text, rest = rest.rsplit("}", 1)
+                labels = _parse_labels(labels_text)
+            else:
+                name, rest = line.split(None, 1)
+                labels = {}
+            # The value may be followed by a timestamp
+            value = float(rest.split()[0])
+        except (ValueError, IndexError):
+            continue
+        yield Sample(name.strip(), labels, value)
+
+
+def scrape(url: str, timeout: float = METRICS_TIMEOUT) -> Iterator[Sample]:
+    "Stream the samples of a metrics endpoint"
+    response = get_session().get(url, timeout=timeout, stream=True)
+    with response:
+        response.raise_for_status()
+        # The text format is always utf-8, even when the charset is not specified
+        response.encoding = "utf-8"
+        yield from parse_metrics(
+            line for line in response.iter_lines(decode_unicode=True) if line
+        )
+
+
+class HostStats:
+    "Cumulative metrics of a public host, or of the whole tunnel"
+
+    __slots__ = (
+        "requests",
+        "errors",
+        "active_streams",
+        "concurrent_requests",
+        "latency_buckets",
+    )
+
+    def __init__(self) -> None:
+        self.requests = 0.0
+        self.errors = 0.0
+        # Both gauges count the requests in flight, so the second one is only a
+        # fallback for the connectors that don't expose the first one
+        self.active_streams: Optional[float] = None
+        self.concurrent_requests: Optional[float] = None
+        # Cumulative histogram, as upper bound => count
+        self.latency_buckets: Dict[float, float] = {}
+
+
+class Snapshot:
+    "The metrics of all connectors at a given time"
+
+    def __init__(self, timestamp: Optional[float] = None) -> None:
+        self.timestamp = time.monotonic() if timestamp is None else timestamp
+        self.hosts: Dict[str, HostStats] = {TUNNEL: HostStats()}
+        self.edge_connections = 0.0
+        self.connectors = 0
+
+    def add(self, samples: Iterable[Sample]) -> None:
+        "Add the samples of a connector to the snapshot"
+        self.connectors += 1
+        for sample in samples:
+            if sample.name == HA_CONNECTIONS_METRIC:
+                self.edge_connections += sample.value
+                continue
+            hostname = next(
+                (sample.labels[l] for l in HOSTNAME_LABELS if l in sample.labels),
+                None,
+            )
+            stats = [self.hosts[TUNNEL]]
+            if hostname:
+                stats.append(self.hosts.setdefault(hostname, HostStats()))
+            for host_stats in stats:
+                _add_sample(host_stats, sample)
+
+
+def _add_sample(stats: HostStats, sample: Sample) -> None:
+    if sample.name == REQUESTS_METRIC:
+        stats.requests += sample.value
+    elif sample.name == ERRORS_METRIC:
+        stats.errors += sample.value
+    elif sample.name == ACTIVE_STREAMS_METRIC:
+        stats.active_streams = (stats.active_streams or 0) + sample.value
+    elif sample.name == CONCURRENT_REQUESTS_METRIC:
+        stats.concurrent_requests = (stats.concurrent_requests or 0) + sample.value
+    elif sample.name == f"{LATENCY_METRIC}_bucket" and "le" in sample.labels:
+        upper_bound = float(sample.labels["le"])
+        stats.latency_buckets[upper_bound] = (
+            stats.latency_buckets.get(upper_bound, 0) + sample.value
+        )
+
+
+def take_snapshot(urls: List[str], timeout: float = METRICS_TIMEOUT) -> Snapshot:
+    "Scrape the metrics endpoints of all connectors"
+    snapshot = Snapshot()
+    for url in urls:
+        snapshot.add(scrape(url, timeout=timeout))
+    return snapshot
+
+
+def histogram_quantile(quantile: float, buckets: Dict[float, float]) -> Optional[float]:
+    """
+    Estimate a quantile from cumulative histogram buckets, by linear
+    interpolation within the bucket it falls in, like Prometheus does.
+    """
+    bounds = sorted(buckets)
+    if not bounds or buckets[bounds[-1]] <= 0:
+        return None
+    rank = quantile * buckets[bounds[-1]]
+    lower_bound, lower_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= rank:
+            if math.isinf(bound):
+                return lower_bound
+            if count == lower_count:
+                return bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / (
+                count - lower_count
+            )
+        lower_bound, lower_count = bound, count
+    return lower_bound
+
+
+def summarize(current: Snapshot, previous: Optional[Snapshot] = None) -> Dict[str, Any]:
+    """
+    Summarize a snapshot, per host and for the tunnel as a whole. Rates and
+    percentiles are computed over the time elapsed since the `previous`
+    snapshot, if any, and since the connectors started otherwise.
+    """
+    elapsed = current.timestamp - previous.timestamp if previous else 0
+    hosts = {}
+    for hostname, stats in current.hosts.items():
+        before = previous.hosts.get(hostname, HostStats()) if previous else HostStats()
+        requests = max(stats.requests - before.requests, 0)
+        errors = max(stats.errors - before.errors, 0)
+        buckets = {
+            bound: count - before.latency_buckets.get(bound, 0)
+            for bound, count in stats.latency_buckets.items()
+        }
+        hosts[hostname or "tunnel"] = {
+            "requests": requests,
+            "errors": errors,
+            "requests_per_second": requests / elapsed if elapsed > 0 else None,
+            "errors_per_second": errors / elapsed if elapsed > 0 else None,
+            "error_rate": errors / requests if requests else 0.0,
+            "origin_connect_latency_ms": {
+                f"p{p}": histogram_quantile(p / 100, buckets) for p in PERCENTILES
+            },
+            "active_streams": (
+                stats.active_streams
+                if stats.active_streams is not None
+                else stats.concurrent_requests or 0.0
+            ),
+        }
+    return {
+        "interval": elapsed,
+        "connectors": current.connectors,
+        "edge_connections": current.edge_connections,
+        "hosts": hosts,
+    }
+
+
+def format_summary(summary: Dict[str, Any]) -> List[Tuple[str, str]]:
+    "Format a summary as (name, description) lines, the tunnel first"
+    lines = []
+    for hostname, stats in summary["hosts"].items():
+        rate = stats["requests_per_second"]
+        errors_rate = stats["errors_per_second"]
+        latency = ", ".join(
+            f"{name} {value:.1f}ms"
+            for name, value in stats["origin_connect_latency_ms"].items()
+            if value is not None
+        )
+        description = (
+            f"{stats['requests']:.0f} requests"
+            + (f" ({rate:.2f}/s)" if rate is not None else "")
+            + f", {stats['errors']:.0f} errors"
+            + (f" ({errors_rate:.2f}/s)" if errors_rate is not None else "")
+            + f", error rate {stats['error_rate']:.2%}"
+            + f", {stats['active_streams']:.0f} active streams"
+            + (f", origin connect latency {latency}" if latency else "")
+        )
+        if hostname == "tunnel":
+            description += (
+                f", {summary['edge_connections']:.0f} edge connections"
+                f" from {summary['connectors']} connector(s)"
+            )
+        lines.append((hostname, description))
+    return lines
@@ -0,0 +1,56 @@
+"Transport and logging options of the tunnel config"
+
+from __future__ import annotations
+
+import json
+from typing import Any, List, Mapping, Tuple
+
+from tutor.exceptions import TutorError
+
+# Transports of the connections to the Cloudflare edge, and IP versions of the edge
+PROTOCOLS = ("auto", "quic", "http2")
+EDGE_IP_VERSIONS = ("auto", "4", "6")
+LOG_LEVELS = ("debug", "info", "warn", "error", "fatal")
+LOG_FORMATS = ("default", "json")
+
+
+def get_tunnel_options(configs: Mapping[str, Any]) -> List[Tuple[str, str]]:
+    """
+    Return the (name, value) of the transport and logging settings of the tunnel config,
+    with JSON values. A TutorError is raised for invalid settings, so that they
+    don't make the connectors silently fall back to other ones.
+    """
+    protocol = str(configs.get("CLOUDFLARED_PROTOCOL", "auto"))
+    edge_ip_version = str(configs.get("CLOUDFLARED_EDGE_IP_VERSION", "4"))
+    post_quantum = bool(configs.get("CLOUDFLARED_POST_QUANTUM"))
+    log_level = str(configs.get("CLOUDFLARED_LOG_LEVEL", "info"))
+    log_format = str(configs.get("CLOUDFLARED_LOG_FORMAT", "json"))
+    if protocol not in PROTOCOLS:
+        raise TutorError(
+            f"CLOUDFLARED_PROTOCOL should be one of {', '.join(PROTOCOLS)}, got '{protocol}'"
+        )
+    if edge_ip_version not in EDGE_IP_VERSIONS:
+        raise TutorError(
+            f"CLOUDFLARED_EDGE_IP_VERSION should be one of {', '.join(EDGE_IP_VERSIONS)},"
+            f" got '{edge_ip_version}'"
+        )
+    if log_level not in LOG_LEVELS:
+        raise TutorError(
+            f"CLOUDFLARED_LOG_LEVEL should be one of {', '.join(LOG_LEVELS)}, got '{log_level}'"
+        )
+    if log_format not in LOG_FORMATS:
+        raise TutorError(
+            f"CLOUDFLARED_LOG_FORMAT should be one of {', '.join(LOG_FORMATS)}, got '{log_format}'"
+        )
+    if post_quantum and protocol == "http2":
+        raise TutorError(
+            "CLOUDFLARED_POST_QUANTUM is only supported with the quic protocol,"
+            " but CLOUDFLARED_PROTOCOL is 'http2'"
+        )
+    return [
+        ("protocol", json.dumps(protocol)),
+        ("edge-ip-version", json.dumps(edge_ip_version)),
+        ("post-quantum", json.dumps(post_quantum)),
+        ("loglevel", json.dumps(log_level)),
+        ("output", json.dumps(log_format)),
+    ]
@@ -1,20 +1,20 @@
 from __future__ import annotations
 
 import os
-import os.path
-from glob import glob
+from functools import lru_cache
 
-import pkg_resources
-import appdirs
+import importlib_resources
+import jinja2
 import typing as t
-from typing import cast
 
 from tutor import hooks
-from tutor import config
-from tutor.__about__ import __app__
 
 from .__about__ import __version__
-from .constants import TUTOR_PUBLIC_HOSTS
+from .constants import GOOGLE_DNS_API_URL, TUTOR_PUBLIC_HOSTS
+from .hosts import get_dns_routes, get_public_hosts, get_wildcard_hosts
+from .ingress import get_ingress_rules, get_origin_request
+from .options import get_tunnel_options
+from .tunnels import Connector, Tunnel, get_connectors, get_tunnels
 from .cli import cloudflared as cloudfalred_group
 from .cli import get_tunnel_uuid
 
@@ -28,10 +28,113 @@ hooks.Filters.CONFIG_DEFAULTS.add_items(
         # Each new setting is a pair: (setting_name, default_value).
         # Prefix your setting names with 'CLOUDFLARED_'.
         ("CLOUDFLARED_VERSION", __version__),
-        ("CLOUDFLARED_DOCKER_IMAGE", "cloudflared"),
+        # Release of cloudflared that is installed in the connector image
+        ("CLOUDFLARED_CONNECTOR_VERSION", "2024.12.2"),
+        # Qualified with the registry, as Kubernetes clusters pull it from there
+        (
+            "CLOUDFLARED_DOCKER_IMAGE",
+            "{{ DOCKER_REGISTRY }}ghassanmas/cloudflared:{{ CLOUDFLARED_CONNECTOR_VERSION }}",
+        ),
+        # Base images of the connector image build: the runtime needs a shell for the
+        # jobs, and the builder dpkg-deb to install a local .deb package
+        ("CLOUDFLARED_RUNTIME_IMAGE", "docker.io/alpine:3.20"),
+        ("CLOUDFLARED_BUILDER_IMAGE", "docker.io/debian:bookworm-slim"),
         ("CLOUDFLARED_TUNNEL_NAME", "openedx"),
         ("CLOUDFLARED_TUNNEL_UUID", ""),
+        # Other tunnels, each with its own connectors, that route some of the public
+        # hosts, by tunnel name, e.g {"openedx-lms": ["LMS_HOST", "PREVIEW_LMS_HOST"]}.
+        # The CLOUDFLARED_TUNNEL_NAME tunnel routes the other hosts.
+        ("CLOUDFLARED_TUNNELS", {}),
+        # UUIDs of the CLOUDFLARED_TUNNELS, by tunnel name, set by
+        # `tutor cloudflared set-tunnel-uuid`
+        ("CLOUDFLARED_TUNNEL_UUIDS", {}),
+        # Number of connectors of specific tunnels, by tunnel name, instead of
+        # CLOUDFLARED_REPLICAS
+        ("CLOUDFLARED_TUNNEL_REPLICAS", {}),
         ("CLOUDFLARED_PUBLIC_HOSTS", TUTOR_PUBLIC_HOSTS),
+        # Number of DNS routes that are created in parallel by the init task
+        ("CLOUDFLARED_DNS_ROUTES_CONCURRENCY", 4),
+        # Backend that resolves NS records in `tutor cloudflared doctor`: "doh" for DNS over
+        # HTTPS to CLOUDFLARED_DOH_URL, or "dns" to query CLOUDFLARED_DNS_NAMESERVERS, which
+        # default to the name servers of /etc/resolv.conf
+        ("CLOUDFLARED_DNS_RESOLVER", "doh"),
+        ("CLOUDFLARED_DOH_URL", GOOGLE_DNS_API_URL),
+        ("CLOUDFLARED_DNS_NAMESERVERS", []),
+        # Number of cloudflared connectors that run the tunnel
+        ("CLOUDFLARED_REPLICAS", 1),
+        # Connectors expose their metrics on consecutive ports, starting from this one
+        ("CLOUDFLARED_METRICS_PORT", 20241),
+        # Address of the host on which the metrics ports are published
+        ("CLOUDFLARED_METRICS_HOST", "127.0.0.1"),
+        # Number of connections that each connector opens to the Cloudflare edge
+        ("CLOUDFLARED_HA_CONNECTIONS", 4),
+        # Transport of the edge connections: "auto", "quic" or "http2". QUIC is the
+        # fastest, provided that the UDP buffers of the host are large enough, see
+        # `tutor cloudflared doctor`
+        ("CLOUDFLARED_PROTOCOL", "auto"),
+        # IP version of the edge connections: "4", "6" or "auto"
+        ("CLOUDFLARED_EDGE_IP_VERSION", "4"),
+        # Post-quantum key agreement of the edge connections, which requires QUIC
+        ("CLOUDFLARED_POST_QUANTUM", False),
+        # Logs of the connectors: "debug" is the level that logs every request, which
+        # `tutor cloudflared logs analyze` needs for the latency and status of requests
+        ("CLOUDFLARED_LOG_LEVEL", "info"),
+        # "json" or "default", which is human readable
+        ("CLOUDFLARED_LOG_FORMAT", "json"),
+        # Write the logs of each connector to data/cloudflared/logs/<service>/cloudflared.log
+        ("CLOUDFLARED_LOG_FILE", True),
+        # Kubernetes only: name of the Secret that holds the tunnel credentials file,
+        # under the credentials.json key
+        ("CLOUDFLARED_K8S_CREDENTIALS_SECRET", "cloudflared-credentials"),
+        ("CLOUDFLARED_K8S_CPU_REQUEST", "100m"),
+        # Kubernetes only: scale the connector with a HorizontalPodAutoscaler, on
+        # "cpu" utilization or on the "requests" rate per pod
+        ("CLOUDFLARED_K8S_AUTOSCALING", False),
+        ("CLOUDFLARED_K8S_AUTOSCALING_METRIC", "cpu"),
+        ("CLOUDFLARED_K8S_MIN_REPLICAS", 2),
+        ("CLOUDFLARED_K8S_MAX_REPLICAS", 6),
+        ("CLOUDFLARED_K8S_TARGET_CPU_UTILIZATION", 70),
+        ("CLOUDFLARED_K8S_REQUESTS_METRIC", "cloudflared_tunnel_requests_per_second"),
+        ("CLOUDFLARED_K8S_TARGET_REQUESTS_PER_SECOND", 100),
+        # originRequest settings of all hosts, e.g {"keepAliveConnections": 200}
+        ("CLOUDFLARED_ORIGIN_REQUEST", {}),
+        # originRequest settings of specific hosts, by host key, e.g
+        # {"LMS_HOST": {"connectTimeout": "10s"}}
+        ("CLOUDFLARED_ORIGIN_REQUEST_OVERRIDES", {}),
+        # Route hosts directly to their service, by host key, instead of through caddy
+        ("CLOUDFLARED_DIRECT_ROUTING", False),
+        (
+            "CLOUDFLARED_DIRECT_SERVICES",
+            {
+                "LMS_HOST": "http://lms:8000",
+                "PREVIEW_LMS_HOST": "http://lms:8000",
+                "CMS_HOST": "http://cms:8000",
+                "MFE_HOST": "http://mfe:8002",
+            },
+        ),
+        # Path-scoped services of specific hosts, by host key, e.g
+        # {"LMS_HOST": {"^/media/": "http://media:8080"}}
+        ("CLOUDFLARED_PATH_SERVICES", {}),
+        # Wildcard hosts, e.g "*.example.com", that are routed with a single ingress rule
+        # and DNS record, after the rules of the public hosts
+        ("CLOUDFLARED_WILDCARD_HOSTS", []),
+        # Cache-Control headers that caddy sets, so that the Cloudflare edge caches static assets
+        ("CLOUDFLARED_CACHE_HEADERS", True),
+        # Static assets whose name contains a content hash, e.g lms-main-v1.0123456789ab.css
+        ("CLOUDFLARED_IMMUTABLE_ASSETS_PATTERN", r"[./][0-9a-f]{12,32}\.[0-9a-z]+$"),
+        ("CLOUDFLARED_IMMUTABLE_CACHE_TTL", 31536000),
+        # Set to 0 to not set the Cache-Control header of media files
+        ("CLOUDFLARED_MEDIA_CACHE_TTL", 86400),
+        # Paths that `tutor cloudflared warmup` requests, by host key. Hosts that are
+        # not listed only get their home page requested.
+        (
+            "CLOUDFLARED_WARMUP_PATHS",
+            {
+                "LMS_HOST": ["/", "/courses", "/login"],
+                "CMS_HOST": ["/"],
+                "MFE_HOST": ["/learning/", "/account/", "/authn/login"],
+            },
+        ),
     ]
 )
 
@@ -65,20 +168,24 @@ hooks.Filters.CONFIG_DEFAULTS.add_items(
 # ]
 
 
-with open(
-    pkg_resources.resource_filename(
-        "tutorcloudflared",
-        os.path.join("templates", "cloudflared", "tasks", "cloudflared", "init"),
-    ),
-    encoding="utf8",
-) as f:
-    hooks.Filters.CLI_DO_INIT_TASKS.add_item(("cloudflared", f.read()))
+# The init task template is only read when the `init` job actually runs, and
+# not on every tutor command.
+@hooks.Filters.CLI_DO_INIT_TASKS.add()
+def _add_init_task(tasks: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    tasks.append(("cloudflared", _read_init_task()))
+    return tasks
 
 
-# For each task added to MY_INIT_TASKS, we load the task template
-# and add it to the CLI_DO_INIT_TASKS filter, which tells Tutor to
-# run it as part of the `init` job.
-# Now you have init_task, you may want to add it to CLI_DO_INIT_TASKS or perform other actions.
+@lru_cache(maxsize=None)
+def _read_init_task() -> str:
+    return (
+        importlib_resources.files("tutorcloudflared")
+        / "templates"
+        / "cloudflared"
+        / "tasks"
+        / "cloudflared"
+        / "init"
+    ).read_text(encoding="utf8")
 
 
 ########################################
@@ -104,6 +211,18 @@ hooks.Filters.IMAGES_BUILD.add_items(
 )
 
 
+# A host directory named "cloudflared-dist", that contains a cloudflared binary or
+# .deb package, is the source of the image that is built with
+# `--build-arg CLOUDFLARED_SOURCE=local`, once added with `tutor mounts add`.
+@hooks.Filters.IMAGES_BUILD_MOUNTS.add()
+def _mount_cloudflared_dist(
+    mounts: list[tuple[str, str]], path: str
+) -> list[tuple[str, str]]:
+    if os.path.basename(path) == "cloudflared-dist":
+        mounts.append(("cloudflared", "cloudflared-dist"))
+    return mounts
+
+
 # Images to be pulled as part of `tutor images pull`.
 # Each item is a pair in the form:
 #     ("<tutor_image_name>", "<docker_image_tag>")
@@ -128,6 +247,11 @@ hooks.Filters.IMAGES_PUSH.add_items(
         # "myimage",
         # "docker.io/myimage:{{ CLOUDFLARED_VERSION }}",
         # ),
+        # Kubernetes clusters pull the connector image from a registry
+        (
+            "cloudflared",
+            "{{ CLOUDFLARED_DOCKER_IMAGE }}",
+        ),
     ]
 )
 
@@ -141,7 +265,7 @@ hooks.Filters.IMAGES_PUSH.add_items(
 hooks.Filters.ENV_TEMPLATE_ROOTS.add_items(
     # Root paths for template files, relative to the project root.
     [
-        pkg_resources.resource_filename("tutorcloudflared", "templates"),
+        str(importlib_resources.files("tutorcloudflared") / "templates"),
     ]
 )
 
@@ -164,38 +288,99 @@ hooks.Filters.ENV_TEMPLATE_TARGETS.add_items(
 #  this section as-is :)
 ########################################
 
+
 # For each file in tutorcloudflared/patches,
 # apply a patch based on the file's name and contents.
-for path in glob(
-    os.path.join(
-        pkg_resources.resource_filename("tutorcloudflared", "patches"),
-        "*",
-    )
-):
-    with open(path, encoding="utf-8") as patch_file:
-        hooks.Filters.ENV_PATCHES.add_item((os.path.basename(path), patch_file.read()))
-
-
-def iter_domains() -> t.Iterable[tuple[str, str]]:
-    "It yield host_key, host_value of CLOUDFLARED_PUBLIC_HOSTS that are set"
-    root = appdirs.user_data_dir(__app__)
-    print(root)
-    configs = config.load(root)
-    hosts_keys = cast(t.List[str], configs.get("CLOUDFLARED_PUBLIC_HOSTS"))
-    domains = dict(
-        zip(
-            hosts_keys,
-            [
-                cast(str, configs.get(host))
-                for host in hosts_keys
-                if cast(str, configs.get(host)) is not None
-            ],
+# Patches are only read the first time they are needed, i.e when rendering
+# templates, and not on every tutor command.
+@hooks.Filters.ENV_PATCHES.add()
+def _add_patches(patches: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    patches.extend(_read_patches())
+    return patches
+
+
+@lru_cache(maxsize=None)
+def _read_patches() -> tuple[tuple[str, str], ...]:
+    return tuple(
+        (path.name, path.read_text(encoding="utf-8"))
+        for path in sorted(
+            (importlib_resources.files("tutorcloudflared") / "patches").iterdir(),
+            key=lambda path: path.name,
         )
+        if path.is_file() and not path.name.startswith(".")
     )
-    yield from domains.items()
 
 
-hooks.Filters.ENV_TEMPLATE_VARIABLES.add_item(("iter_domains", iter_domains))
+@jinja2.pass_context
+def iter_domains(context: jinja2.runtime.Context) -> t.Iterable[tuple[str, str]]:
+    """
+    It yield host_key, host_value of CLOUDFLARED_PUBLIC_HOSTS that are set.
+    The hosts are taken from the configuration that is being rendered, so
+    that no configuration is loaded from disk while rendering.
+    """
+    yield from get_public_hosts(context.parent).items()
+
+
+@jinja2.pass_context
+def iter_wildcard_hosts(context: jinja2.runtime.Context) -> t.Iterable[str]:
+    "It yield the CLOUDFLARED_WILDCARD_HOSTS"
+    yield from get_wildcard_hosts(context.parent)
+
+
+@jinja2.pass_context
+def iter_dns_routes(
+    context: jinja2.runtime.Context, tunnel: t.Optional[str] = None
+) -> t.Iterable[str]:
+    "It yield the hosts that need a DNS route, i.e that are not covered by a wildcard host"
+    yield from get_dns_routes(context.parent, tunnel)
+
+
+@jinja2.pass_context
+def iter_tunnels(context: jinja2.runtime.Context) -> t.Iterable[Tunnel]:
+    "It yield the tunnels, the CLOUDFLARED_TUNNEL_NAME one first"
+    yield from get_tunnels(context.parent)
+
+
+@jinja2.pass_context
+def origin_request(
+    context: jinja2.runtime.Context, host_key: str, host_value: str
+) -> list[tuple[str, str]]:
+    "It returns the originRequest settings of a host as (name, value) pairs"
+    return get_origin_request(context.parent, host_key, host_value)
+
+
+@jinja2.pass_context
+def ingress_rules(
+    context: jinja2.runtime.Context, host_key: str
+) -> list[tuple[t.Optional[str], str]]:
+    "It returns the ingress rules of a host as (path, service) pairs"
+    return get_ingress_rules(context.parent, host_key)
+
+
+@jinja2.pass_context
+def iter_connectors(context: jinja2.runtime.Context) -> t.Iterable[Connector]:
+    "It yield the (service, metrics_port, tunnel) of each cloudflared connector replica"
+    yield from get_connectors(context.parent)
+
+
+@jinja2.pass_context
+def tunnel_options(context: jinja2.runtime.Context) -> t.List[t.Tuple[str, str]]:
+    "It returns the (name, value) of the transport and logging settings of the tunnel config"
+    return get_tunnel_options(context.parent)
+
+
+hooks.Filters.ENV_TEMPLATE_VARIABLES.add_items(
+    [
+        ("iter_domains", iter_domains),
+        ("iter_wildcard_hosts", iter_wildcard_hosts),
+        ("iter_dns_routes", iter_dns_routes),
+        ("origin_request", origin_request),
+        ("ingress_rules", ingress_rules),
+        ("iter_connectors", iter_connectors),
+        ("iter_tunnels", iter_tunnels),
+        ("tunnel_options", tunnel_options),
+    ]
+)
 
 ########################################
 # CUSTOM JOBS (a.k.a. "do-commands")
@@ -214,7 +399,7 @@ hooks.Filters.ENV_TEMPLATE_VARIABLES.add_item(("iter_domains", iter_domains))
 #     """
 #     for task in MY_INIT_TASKS:
 #         init_task: str = get_task_contents(task)
-#         return [("cloudflared", "cloudflared tunnel info -o json openedx | jq -rc '.id'")]
+#         return [("cloudflared", "cloudflared tunnel info -o json openedx")]
 
 
 # To add a custom job, define a Click command that returns a list of tasks,
@@ -0,0 +1,48 @@
+"""
+Breakdown of the time that the doctor checks spend in network, parsing and
+config loading. Timings are only collected in the threads that asked for them,
+so that instrumented code costs close to nothing otherwise.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+NETWORK = "network"
+PARSING = "parsing"
+CONFIG = "config"
+
+_state = threading.local()
+
+
+@contextmanager
+def collect(timings: Optional[Dict[str, float]]) -> Iterator[None]:
+    "Add the time of the phases of the current thread to `timings`, if not None"
+    previous = getattr(_state, "timings", None)
+    _state.timings = timings
+    try:
+        yield
+    finally:
+        _state.timings = previous
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """
+    Count the time spent in the block in the `name` phase. Nested phases are
+    only counted in the outermost one.
+    """
+    timings = getattr(_state, "timings", None)
+    if timings is None or getattr(_state, "phase", None) is not None:
+        yield
+        return
+    _state.phase = name
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+        _state.phase = None
@@ -0,0 +1,110 @@
+"Readiness of the cloudflared connectors, from the /ready endpoint of their metrics server"
+
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, List, Mapping
+
+from tutor.exceptions import TutorError
+
+from .constants import READY_MAX_POLL_INTERVAL, READY_POLL_INTERVAL, READY_TIMEOUT
+from .tunnels import Connector
+
+
+def get_metrics_url(
+    configs: Mapping[str, Any], connector: Connector, path: str = "/metrics"
+) -> str:
+    "Return the URL of an endpoint of the metrics server of a connector, from the host"
+    host = configs.get("CLOUDFLARED_METRICS_HOST") or "127.0.0.1"
+    if host == "0.0.0.0":
+        host = "127.0.0.1"
+    return f"http://{host}:{connector.metrics_port}{path}"
+
+
+def wait_ready(
+    url: str,
+    timeout: float = READY_TIMEOUT,
+    interval: float = READY_POLL_INTERVAL,
+    min_connections: int = 1,
+    max_interval: float = READY_MAX_POLL_INTERVAL,
+) -> int:
+    """
+    Poll the /ready endpoint of a connector until it reports at least
+    `min_connections` connections to the Cloudflare edge, and return the number
+    of connections. The delay between two polls starts at `interval` seconds
+    and doubles up to `max_interval`, so that a connector that is ready fast is
+    noticed fast. A TutorError is raised if it's not ready within `timeout`
+    seconds, with the last response or error of the endpoint.
+    """
+    # pylint: disable=import-outside-toplevel
+    import requests
+
+    from .utils import get_session
+
+    deadline = time.monotonic() + timeout
+    delay = interval
+    error = ""
+    while True:
+        remaining = deadline - time.monotonic()
+        try:
+            response = get_session().get(
+                url, timeout=max(min(remaining, max_interval), interval)
+            )
+            if response.status_code == 200:
+                connections = int(response.json().get("readyConnections", 0))
+                if connections >= min_connections:
+                    return connections
+                error = f"only {connections} out of {min_connections} connection(s) are ready"
+            else:
+                error = f"got status {response.status_code}: {response.text.strip()}"
+        except (requests.RequestException, ValueError) as e:
+            error = str(e)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TutorError(
+                f"The connector at {url} was not ready after {timeout}s, {error}"
+            )
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_interval)
+
+
+def wait_all_ready(
+    urls: List[str],
+    timeout: float = READY_TIMEOUT,
+    interval: float = READY_POLL_INTERVAL,
+    min_connections: int = 1,
+) -> Dict[str, int]:
+    """
+    Wait until the connectors at all `urls` are ready, concurrently and within a
+    single `timeout`, and return the number of connections of each one. A
+    TutorError lists the connectors that were not ready.
+    """
+    # pylint: disable=import-outside-toplevel
+    from concurrent.futures import ThreadPoolExecutor
+
+    if not urls:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+        futures = {
+            url: executor.submit(
+                wait_ready,
+                url,
+                timeout=timeout,
+                interval=interval,
+                min_connections=min_connections,
+            )
+            for url in urls
+        }
+    connections: Dict[str, int] = {}
+    errors = []
+    for url, future in futures.items():
+        try:
+            connections[url] = future.result()
+        except TutorError as e:
+            errors.append(str(e))
+    if errors:
+        raise TutorError(
+            f"{len(errors)} out of {len(urls)} connector(s) were not ready:\n"
+            + "\n".join(errors)
+        )
+    return connections
@@ -0,0 +1,316 @@
+"""
+Resolvers of NS records: DNS over HTTPS, and a minimal client of the DNS wire
+protocol, over UDP with a fallback to TCP, for the resolvers of the host.
+"""
+
+from __future__ import annotations
+
+import abc
+import random
+import socket
+import struct
+import time
+from typing import Any, List, Mapping, Optional, Tuple, cast
+
+from tutor.exceptions import TutorError
+
+from .constants import (
+    DNS_ATTEMPT_TIMEOUT,
+    DNS_PORT,
+    DNS_RETRIES,
+    DOH_TIMEOUT,
+    GOOGLE_DNS_API_URL,
+    RESOLV_CONF_PATH,
+)
+from .profiling import NETWORK, PARSING, phase
+
+# Record type and class of NS records
+NS_TYPE = 2
+IN_CLASS = 1
+# DNS header flags and response codes
+QR_FLAG = 0x8000
+TC_FLAG = 0x0200
+RD_FLAG = 0x0100
+NOERROR = 0
+NXDOMAIN = 3
+MAX_POINTERS = 64
+
+
+class ResolverError(Exception):
+    "Exception when NS records could not be resolved"
+
+
+# (name servers, smallest TTL of the answers)
+NSAnswer = Tuple[List[str], int]
+
+
+class Resolver(abc.ABC):
+    "A backend that resolves the NS records of a domain"
+
+    @abc.abstractmethod
+    def lookup_ns(self, domain: str, timeout: float = DOH_TIMEOUT) -> NSAnswer:
+        "Return the name servers of a domain, and the smallest TTL of the answers"
+
+
+class DoHResolver(Resolver):
+    "DNS over HTTPS, with the JSON API of Google public DNS"
+
+    def __init__(self, url: str = GOOGLE_DNS_API_URL) -> None:
+        self.url = url
+
+    def lookup_ns(self, domain: str, timeout: float = DOH_TIMEOUT) -> NSAnswer:
+        # pylint: disable=import-outside-toplevel
+        import requests
+
+        from .utils import get_session
+
+        try:
+            with phase(NETWORK):
+                response = get_session().get(
+                    self.url, params={"name": domain, "type": "NS"}, timeout=timeout
+                )
+                response.raise_for_status()
+            with phase(PARSING):
+                result = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise ResolverError(str(e)) from e
+        if result.get("Status") == NXDOMAIN:
+            return [], 0
+        if result.get("Status") != NOERROR:
+            raise ResolverError(f"DoH query failed with status {result.get('Status')}")
+        answers = [
+            a for a in result.get("Answer", []) if a.get("type", NS_TYPE) == NS_TYPE
+        ]
+        return (
+            [a.get("data", "").rstrip(".") for a in answers],
+            min((int(a.get("TTL", 0)) for a in answers), default=0),
+        )
+
+
+def read_resolv_conf(path: str = RESOLV_CONF_PATH) -> List[str]:
+    """
+    Return the name servers of a resolv.conf file, or the local host if there
+    are none, like the C library does.
+    """
+    nameservers = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == "nameserver":
+                    # Drop the interface of link-local IPv6 addresses
+                    nameservers.append(fields[1].split("%")[0])
+    except OSError:
+        pass
+    return nameservers or ["127.0.0.1"]
+
+
+def build_query(domain: str, query_id: int, record_type: int = NS_TYPE) -> bytes:
+    "Build a recursive query for a record of a domain"
+    header = struct.pack("!HHHHHH", query_id, RD_FLAG, 1, 0, 0, 0)
+    return header + encode_name(domain) + struct.pack("!HH", record_type, IN_CLASS)
+
+
+def encode_name(domain: str) -> bytes:
+    labels = [label.encode("idna") for label in domain.rstrip(".").split(".") if label]
+    if any(len(label) > 63 for label in labels):
+        raise ResolverError(f"'{domain}' is not a valid domain name")
+    return b"".join(bytes([len(label)]) + label for label in labels) + b"\0"
+
+
+def read_name(message: bytes, offset: int) -> Tuple[str, int]:
+    """
+    Read a possibly compressed domain name at `offset` of a message, and return
+    it along with the offset that follows it.
+    """
+    labels = []
+    end = None
+    pointers = 0
+    while True:
+        length = message[offset]
+        if length & 0xC0 == 0xC0:
+            pointers += 1
+            if pointers > MAX_POINTERS:
+                raise ResolverError("Invalid DNS response, too many name pointers")
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | message[offset + 1]
+        elif length == 0:
+            offset += 1
+            break
+        else:
+            labels.append(message[offset + 1 : offset + 1 + length].decode("ascii"))
+            offset += 1 + length
+    return ".".join(labels), offset if end is None else end
+
+
+def parse_header(message: bytes, query_id: int) -> int:
+    """
+    Check that a message is a response to the query, and return its flags. The
+    12 bytes header is there even in a truncated response.
+    """
+    if len(message) < 12:
+        raise ResolverError("Invalid DNS response, it is shorter than its header")
+    response_id, flags = struct.unpack_from("!HH", message)
+    if response_id != query_id or not flags & QR_FLAG:
+        raise ResolverError("Invalid DNS response, it does not match the query")
+    return int(flags)
+
+
+def parse_response(
+    message: bytes, query_id: int, domain: str
+) -> Tuple[int, bool, NSAnswer]:
+    """
+    Parse a response to an NS query, and return its response code, whether it
+    was truncated, and the NS records of the answer section.
+    """
+    flags = parse_header(message, query_id)
+    try:
+        questions, answers = struct.unpack_from("!HH", message, 4)
+        offset = 12
+        for _ in range(questions):
+            name, offset = read_name(message, offset)
+            if name.lower() != domain.rstrip(".").lower():
+                raise ResolverError(f"Invalid DNS response, it's for '{name}'")
+            offset += 4
+        nameservers = []
+        ttls = []
+        for _ in range(answers):
+            _name, offset = read_name(message, offset)
+            record_type, _record_class, ttl, length = struct.unpack_from(
+                "!HHIH", message, offset
+            )
+            offset += 10
+            if record_type == NS_TYPE:
+                nameservers.append(read_name(message, offset)[0])
+                ttls.append(ttl)
+            offset += length
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ResolverError(f"Invalid DNS response: {e}") from e
+    return flags & 0xF, bool(flags & TC_FLAG), (nameservers, min(ttls, default=0))
+
+
+class DNSResolver(Resolver):
+    """
+    A client of the DNS wire protocol, that queries recursive resolvers, such
+    as the local caching resolver, over UDP. Truncated answers are queried
+    again over TCP. Each name server is tried in turn, for `retries` more
+    rounds if none answered.
+    """
+
+    def __init__(
+        self,
+        nameservers: Optional[List[str]] = None,
+        port: int = DNS_PORT,
+        retries: int = DNS_RETRIES,
+        attempt_timeout: float = DNS_ATTEMPT_TIMEOUT,
+    ) -> None:
+        self.nameservers = nameservers or read_resolv_conf()
+        self.port = port
+        self.retries = retries
+        self.attempt_timeout = attempt_timeout
+
+    def lookup_ns(self, domain: str, timeout: float = DOH_TIMEOUT) -> NSAnswer:
+        deadline = time.monotonic() + timeout
+        errors: List[str] = []
+        for _ in range(self.retries + 1):
+            for nameserver in self.nameservers:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ResolverError(
+                        f"DNS query of {domain} timed out after {timeout}s: {'; '.join(errors)}"
+                    )
+                try:
+                    code, answer = self._query(
+                        nameserver, domain, min(remaining, self.attempt_timeout)
+                    )
+                except (OSError, ResolverError) as e:
+                    errors.append(f"{nameserver}: {e}")
+                    continue
+                if code == NXDOMAIN:
+                    return [], 0
+                if code == NOERROR:
+                    return answer
+                errors.append(f"{nameserver}: response code {code}")
+        raise ResolverError(f"DNS query of {domain} failed: {'; '.join(errors)}")
+
+    def _query(
+        self, nameserver: str, domain: str, timeout: float
+    ) -> Tuple[int, NSAnswer]:
+        query_id = random.randrange(0x10000)
+        query = build_query(domain, query_id)
+        family = socket.AF_INET6 if ":" in nameserver else socket.AF_INET
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect((nameserver, self.port))
+            sock.send(query)
+            while True:
+                with phase(NETWORK):
+                    message = sock.recv(65535)
+                try:
+                    flags = parse_header(message, query_id)
+                    break
+                except ResolverError:
+                    # Ignore stray datagrams, until the timeout
+                    continue
+        # The records of a truncated response may be cut off, so that it is
+        # not parsed, and the query is sent again over TCP
+        if flags & TC_FLAG:
+            code, _truncated, answer = self._query_tcp(
+                nameserver, query, query_id, domain, timeout
+            )
+        else:
+            with phase(PARSING):
+                code, _truncated, answer = parse_response(message, query_id, domain)
+        return code, answer
+
+    def _query_tcp(
+        self, nameserver: str, query: bytes, query_id: int, domain: str, timeout: float
+    ) -> Tuple[int, bool, NSAnswer]:
+        with phase(NETWORK), socket.create_connection(
+            (nameserver, self.port), timeout=timeout
+        ) as sock:
+            sock.sendall(struct.pack("!H", len(query)) + query)
+            (length,) = struct.unpack("!H", _recv_exactly(sock, 2))
+            message = _recv_exactly(sock, length)
+        with phase(PARSING):
+            return parse_response(message, query_id, domain)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ResolverError("DNS connection closed before the end of the response")
+        data += chunk
+    return data
+
+
+# Backends of CLOUDFLARED_DNS_RESOLVER
+RESOLVERS = ("doh", "dns")
+
+
+def get_resolver(configs: Mapping[str, Any]) -> Resolver:
+    """
+    Return the resolver that is selected by CLOUDFLARED_DNS_RESOLVER: "doh" for
+    DNS over HTTPS to CLOUDFLARED_DOH_URL, or "dns" for the name servers of
+    CLOUDFLARED_DNS_NAMESERVERS, which default to those of /etc/resolv.conf.
+    """
+    backend = configs.get("CLOUDFLARED_DNS_RESOLVER") or "doh"
+    if backend == "doh":
+        return DoHResolver(
+            cast(str, configs.get("CLOUDFLARED_DOH_URL") or GOOGLE_DNS_API_URL)
+        )
+    if backend == "dns":
+        nameservers = configs.get("CLOUDFLARED_DNS_NAMESERVERS") or []
+        if not isinstance(nameservers, list) or not all(
+            isinstance(n, str) for n in nameservers
+        ):
+            raise TutorError(
+                f"CLOUDFLARED_DNS_NAMESERVERS should be a list of addresses, got '{nameservers}'"
+            )
+        return DNSResolver(cast(List[str], nameservers))
+    raise TutorError(
+        f"Unknown CLOUDFLARED_DNS_RESOLVER '{backend}', expected one of: {', '.join(RESOLVERS)}"
+    )
@@ -0,0 +1,194 @@
+"""
+Named tunnels, the connectors that run them, and their credentials, as written by
+`cloudflared tunnel create` in the data folder
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional
+
+from tutor.exceptions import TutorError
+
+from .constants import CREDENTIALS_DIR, TUNNEL_UUIDS_FILENAME
+from .hosts import get_tunnel_host_keys
+
+UUID_PATTERN = re.compile(
+    r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$"
+)
+
+
+def get_credentials_dir(root: str) -> str:
+    "Return the folder that is mounted as ~/.cloudflared in the cloudflared containers"
+    return os.path.join(root, *CREDENTIALS_DIR)
+
+
+def iter_credentials(root: str) -> List[Dict[str, str]]:
+    """
+    Return the content of the tunnel credentials files. Files that can't be
+    read, e.g because they are only readable by the container user, or that are
+    not credentials, are skipped.
+    """
+    credentials_dir = get_credentials_dir(root)
+    try:
+        filenames = sorted(os.listdir(credentials_dir))
+    except OSError:
+        return []
+    credentials = []
+    for filename in filenames:
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(
+                os.path.join(credentials_dir, filename), encoding="utf-8"
+            ) as credentials_file:
+                content = json.load(credentials_file)
+        except (OSError, ValueError):
+            continue
+        if isinstance(content, dict) and UUID_PATTERN.match(
+            str(content.get("TunnelID", ""))
+        ):
+            credentials.append(content)
+    return credentials
+
+
+def read_tunnel_uuids(root: str) -> Dict[str, str]:
+    """
+    Return the UUID of each tunnel by name, as recorded by the init task in
+    "<name> <uuid>" lines when it creates the tunnels.
+    """
+    uuids = {}
+    try:
+        with open(
+            os.path.join(get_credentials_dir(root), TUNNEL_UUIDS_FILENAME),
+            encoding="utf-8",
+        ) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 2 and UUID_PATTERN.match(fields[1]):
+                    uuids[fields[0]] = fields[1]
+    except OSError:
+        pass
+    return uuids
+
+
+def find_tunnel_uuid(root: str, tunnel_name: str) -> Optional[str]:
+    """
+    Return the UUID of the tunnel named `tunnel_name`, as recorded by the init
+    task, if its "<uuid>.json" credentials file is there. Credentials files don't
+    include the tunnel name, so without a record, e.g after the init task of an
+    older version, a single credentials file is assumed to belong to the tunnel.
+    Return None when the UUID can't be known for sure.
+    """
+    uuids = read_tunnel_uuids(root)
+    if uuids:
+        uuid = uuids.get(tunnel_name)
+        if uuid and os.path.isfile(
+            os.path.join(get_credentials_dir(root), f"{uuid}.json")
+        ):
+            return uuid
+        return None
+    credentials = iter_credentials(root)
+    if len(credentials) == 1:
+        return credentials[0]["TunnelID"]
+    return None
+
+
+class Tunnel(NamedTuple):
+    "A named tunnel, and the public hosts that it routes"
+
+    name: str
+    uuid: str
+    host_keys: List[str]
+    replicas: int
+    # Suffix of the names of its services and resources: empty for the
+    # CLOUDFLARED_TUNNEL_NAME tunnel, "-<name>" for the ones of CLOUDFLARED_TUNNELS
+    suffix: str
+
+
+class Connector(NamedTuple):
+    "A cloudflared connector replica, i.e a docker compose service"
+
+    service: str
+    metrics_port: int
+    tunnel: Tunnel
+
+
+def _check_replicas(name: str, replicas: Any) -> int:
+    if isinstance(replicas, bool) or not isinstance(replicas, int) or replicas < 1:
+        raise TutorError(f"{name} should be a positive integer, got '{replicas}'")
+    return replicas
+
+
+def get_tunnels(configs: Mapping[str, Any]) -> List[Tunnel]:
+    """
+    Return the tunnels, the CLOUDFLARED_TUNNEL_NAME one first, then the ones
+    of CLOUDFLARED_TUNNELS. Each one runs CLOUDFLARED_REPLICAS connectors,
+    unless CLOUDFLARED_TUNNEL_REPLICAS sets another number for it.
+    """
+    replicas = _check_replicas(
+        "CLOUDFLARED_REPLICAS", configs.get("CLOUDFLARED_REPLICAS", 1)
+    )
+    tunnel_replicas = configs.get("CLOUDFLARED_TUNNEL_REPLICAS") or {}
+    tunnel_uuids = configs.get("CLOUDFLARED_TUNNEL_UUIDS") or {}
+    tunnels = []
+    for index, (name, host_keys) in enumerate(get_tunnel_host_keys(configs).items()):
+        if index == 0:
+            uuid = str(configs.get("CLOUDFLARED_TUNNEL_UUID") or "")
+            suffix = ""
+        else:
+            uuid = str(tunnel_uuids.get(name) or "")
+            suffix = f"-{name}"
+        tunnels.append(
+            Tunnel(
+                name,
+                uuid,
+                host_keys,
+                _check_replicas(
+                    f"CLOUDFLARED_TUNNEL_REPLICAS of tunnel '{name}'",
+                    tunnel_replicas.get(name, replicas),
+                ),
+                suffix,
+            )
+        )
+    return tunnels
+
+
+def get_connectors(configs: Mapping[str, Any]) -> List[Connector]:
+    """
+    Return the connectors that run the tunnels. The connectors of the
+    CLOUDFLARED_TUNNEL_NAME tunnel are the "cloudflared" service, then
+    "cloudflared-2", "cloudflared-3"... and those of another tunnel are
+    "cloudflared-<name>", "cloudflared-<name>-2"... Each one exposes its metrics
+    on its own port, counting from CLOUDFLARED_METRICS_PORT.
+    """
+    tunnels = get_tunnels(configs)
+    count = sum(tunnel.replicas for tunnel in tunnels)
+    metrics_port = configs.get("CLOUDFLARED_METRICS_PORT")
+    if (
+        isinstance(metrics_port, bool)
+        or not isinstance(metrics_port, int)
+        or not 1024 <= metrics_port <= 65535 - count
+    ):
+        raise TutorError(
+            f"CLOUDFLARED_METRICS_PORT should be a port between 1024 and {65535 - count}, got '{metrics_port}'"
+        )
+    connectors: List[Connector] = []
+    for tunnel in tunnels:
+        for index in range(tunnel.replicas):
+            service = f"cloudflared{tunnel.suffix}" + (f"-{index + 1}" if index else "")
+            connectors.append(
+                Connector(service, metrics_port + len(connectors), tunnel)
+            )
+    services = [connector.service for connector in connectors] + ["cloudflared-job"]
+    duplicates = sorted(
+        {service for service in services if services.count(service) > 1}
+    )
+    if duplicates:
+        raise TutorError(
+            f"The names of the tunnels of CLOUDFLARED_TUNNELS clash with other"
+            f" services: {', '.join(duplicates)}"
+        )
+    return connectors
@@ -1,10 +1,27 @@
 "Utils methods"
 
+import os
+import threading
+from functools import lru_cache
+
 import requests
 from tld import get_tld, Result
-from typing import Union, Optional, List, Dict
+from typing import Union, Optional, List, Dict, Tuple, TYPE_CHECKING
+
+from .constants import (
+    DOH_TIMEOUT,
+    NS_CACHE_NEGATIVE_TTL,
+    PARSED_HOSTS_CACHE_SIZE,
+    STATE_DIR,
+)
+from .profiling import PARSING, phase
+from .resolvers import DoHResolver, Resolver
+
+if TYPE_CHECKING:
+    from .cache import NSCache
 
-from .constants import GOOGLE_DNS_API_URL
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
 
 
 class DomainExcpetion(Exception):
@@ -15,6 +32,74 @@ def _get_tld_object(domain: str) -> Optional[Union[str, Result, None]]:
     return get_tld(domain, as_object=True, fix_protocol=True, fail_silently=True)
 
 
+class ParsedHost:
+    """
+    The parts of a host name, e.g for two.one.example.co.uk:
+    subdomains=("two", "one"), domain="example", suffix="co.uk" and depth=2.
+    A host that is not a correct domain is not `valid`, and has no parts.
+    """
+
+    __slots__ = ("host", "subdomains", "domain", "suffix", "depth", "valid")
+
+    def __init__(
+        self, host: str, subdomains: Tuple[str, ...], domain: str, suffix: str
+    ) -> None:
+        self.host = host
+        self.subdomains = subdomains
+        self.domain = domain
+        self.suffix = suffix
+        self.depth = len(subdomains)
+        self.valid = bool(domain and suffix)
+
+    @property
+    def first_level_domain(self) -> str:
+        return f"{self.domain}.{self.suffix}"
+
+
+@lru_cache(maxsize=PARSED_HOSTS_CACHE_SIZE)
+def parse_host(host: str) -> ParsedHost:
+    """
+    Parse a host into its parts. Parsing is the costly part of all domain
+    checks, so that it's done only once per host.
+    """
+    with phase(PARSING):
+        tld_object = _get_tld_object(host)
+    if isinstance(tld_object, Result):
+        subdomains = (
+            tuple(tld_object.subdomain.split(".")) if tld_object.subdomain else ()
+        )
+        return ParsedHost(host, subdomains, tld_object.domain, tld_object.tld)
+    return ParsedHost(host, (), "", "")
+
+
+class HostIndex:
+    """
+    The public hosts, parsed and grouped by their first level domain. Invalid
+    hosts are kept in `hosts` but are not part of any group.
+    """
+
+    def __init__(self, hosts: Dict[str, str]) -> None:
+        self.hosts = {host_key: parse_host(value) for host_key, value in hosts.items()}
+        self.by_domain: Dict[str, List[str]] = {}
+        for host_key, parsed in self.hosts.items():
+            if parsed.valid:
+                self.by_domain.setdefault(parsed.first_level_domain, []).append(
+                    host_key
+                )
+
+    def is_same_domain(self) -> bool:
+        "Check if all valid hosts share the same first level domain"
+        return len(self.by_domain) == 1
+
+    def get_conflicted_hosts(self, root_domain: str) -> Dict[str, str]:
+        "Return the valid hosts that don't share same fld with root domain"
+        return {
+            host_key: parsed.host
+            for host_key, parsed in self.hosts.items()
+            if parsed.valid and parsed.first_level_domain != root_domain
+        }
+
+
 def get_first_level_domain(domain: str) -> str:
     """
     Takes a domain as an arugment, and return the first level domain.
@@ -22,12 +107,17 @@ def get_first_level_domain(domain: str) -> str:
     2. openedx.herokuapp.com => openedx.herokuapp.com
     (This because herokuapp.com is a public tld suffix)
     """
-    tld_object = _get_tld_object(domain)
-    if isinstance(tld_object, Result):
-        return f"{tld_object.domain}.{tld_object.tld}"
+    parsed = parse_host(domain)
+    if parsed.valid:
+        return parsed.first_level_domain
     raise DomainExcpetion(f"Error the value of {domain} is not a correct domain!")
 
 
+def get_state_path(root: str, *path: str) -> str:
+    "Return the path of a file the plugin keeps in the project data folder"
+    return os.path.join(root, *STATE_DIR, *path)
+
+
 def get_hosts() -> str:
     """
     This function takes the config and return a list of all
@@ -44,26 +134,63 @@ def get_hosts() -> str:
 #     return result
 
 
-def check_ns(domain: str) -> bool:
-    """This funciton takes a domain as argument, and check
-    wether it's Name Server is cloudflare or not, by doing DOH
-    (DNS over HTTPS) Using Google public free https://google.dns
+def get_session() -> requests.Session:
+    """
+    Return the HTTP session that is shared by all the checks, so that
+    connections are kept alive between requests. It's safe to call
+    from multiple threads.
+    """
+    global _session  # pylint: disable=global-statement
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        return _session
 
+
+def lookup_ns(
+    domain: str, timeout: float = DOH_TIMEOUT, resolver: Optional[Resolver] = None
+) -> Tuple[bool, int]:
+    """
+    Check wether the name servers of the first level domain of `domain` are
+    Cloudflare's, with the given resolver, by default DOH (DNS over HTTPS)
+    Using Google public free https://google.dns. Return the result along with
+    the number of seconds it can be cached for, which is the smallest TTL of
+    the NS answers.
     """
-    request = requests.get(
-        f"{GOOGLE_DNS_API_URL}&name={get_first_level_domain(domain)}"
+    if resolver is None:
+        resolver = DoHResolver()
+    nameservers, ttl = resolver.lookup_ns(
+        get_first_level_domain(domain), timeout=timeout
     )
-    result = request.json()
-    if result["Status"] == 0:
-        answers = result.get("Answer", [])
-        if len(answers) > 0:
-            ns_answers = [
-                a.get("data", "")
-                for a in answers
-                if a.get("date", "").endswith("ns.cloudflare")
-            ]
-            return len(answers) == len(ns_answers)
-    return False
+    if nameservers and all(
+        nameserver.rstrip(".").endswith(".ns.cloudflare.com")
+        for nameserver in nameservers
+    ):
+        return True, ttl
+    return False, NS_CACHE_NEGATIVE_TTL
+
+
+def check_ns(
+    domain: str,
+    timeout: float = DOH_TIMEOUT,
+    cache: Optional["NSCache"] = None,
+    resolver: Optional[Resolver] = None,
+) -> bool:
+    """This funciton takes a domain as argument, and check
+    wether it's Name Server is cloudflare or not. When a cache is given, a
+    result that did not expire yet is returned without any network request.
+    """
+    first_level_domain = get_first_level_domain(domain)
+    if cache is not None:
+        cached = cache.get(first_level_domain)
+        if cached is not None:
+            return cached
+    is_cloudflare, ttl = lookup_ns(
+        first_level_domain, timeout=timeout, resolver=resolver
+    )
+    if cache is not None:
+        cache.set(first_level_domain, is_cloudflare, ttl)
+    return is_cloudflare
 
 
 def is_one_or_less_subdomain(domain: str) -> Union[int, None]:
@@ -72,13 +199,13 @@ def is_one_or_less_subdomain(domain: str) -> Union[int, None]:
     subdomain of a subdomain, given Cloudflare free only allows for one
     level of subdomain.
     """
-    domain_obj = _get_tld_object(domain)
-    if isinstance(domain_obj, Result):
-        return domain_obj.subdomain.count(".") == 0
+    parsed = parse_host(domain)
+    if parsed.valid:
+        return parsed.depth <= 1
     return None
 
 
-def strip_out_subdomains_if_needed(domain: str) -> Union[str, Result, None]:
+def strip_out_subdomains_if_needed(domain: str) -> Optional[str]:
     """
     This function takes a full domain as an argugemnt and convert
     it to one level subdomain.
@@ -91,10 +218,12 @@ def strip_out_subdomains_if_needed(domain: str) -> Union[str, Result, None]:
     two.one.example.com => two.example.com
     two.one.example.co.uk => two.example.co.uk
     """
-    tld_obj = _get_tld_object(domain)
-    if isinstance(tld_obj, Result):
-        return f"{tld_obj.subdomain.split('.')[0]}.{tld_obj.domain}.{tld_obj.tld}"
-    return None
+    parsed = parse_host(domain)
+    if not parsed.valid:
+        return None
+    if parsed.depth <= 1:
+        return domain
+    return f"{parsed.subdomains[0]}.{parsed.first_level_domain}"
 
 
 def is_default_domain(domain: str) -> bool:
@@ -108,14 +237,10 @@ def is_same_domain(hosts: List[str]) -> bool:
     corresponding first level domain, add them to a set, and if they
     are share same first level
     """
-    domains = {f"{get_first_level_domain(host)}" for host in hosts}
+    domains = {get_first_level_domain(host) for host in hosts}
     return len(domains) == 1
 
 
 def get_conflicted_hosts(hosts: Dict[str, str], root_domain: str) -> Dict[str, str]:
     "It filters hosts that don't share same fld with root domain"
-    return {
-        host_key: host_value
-        for host_key, host_value in hosts.items()
-        if get_first_level_domain(host_value) != root_domain
-    }
+    return HostIndex(hosts).get_conflicted_hosts(root_domain)
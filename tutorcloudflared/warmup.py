@@ -0,0 +1,167 @@
+"Warm-up of the origin caches, by requesting the hot paths of the public hosts"
+
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple, cast
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .constants import WARMUP_CONCURRENCY, WARMUP_TIMEOUT
+from .hosts import get_public_hosts
+
+
+class Target(NamedTuple):
+    "A path of a public host to warm up"
+
+    host_key: str
+    host: str
+    path: str
+
+
+class WarmupResult(NamedTuple):
+    """
+    The response of a target and its latency, the first time it was requested
+    (`before`) and the second time (`after`), in seconds. The status and the
+    error are the ones of the second time.
+    """
+
+    target: Target
+    status: Optional[int]
+    before: Optional[float]
+    after: Optional[float]
+    error: str
+
+    @property
+    def failed(self) -> bool:
+        return bool(self.error) or self.status is None or self.status >= 500
+
+
+def get_targets(configs: Mapping[str, Any]) -> List[Target]:
+    """
+    Return the hot paths of the public hosts, from CLOUDFLARED_WARMUP_PATHS by
+    host key, and only the home page of hosts that have none.
+    """
+    warmup_paths = cast(
+        Dict[str, List[str]], configs.get("CLOUDFLARED_WARMUP_PATHS") or {}
+    )
+    return [
+        Target(host_key, host, path)
+        for host_key, host in get_public_hosts(configs).items()
+        for path in warmup_paths.get(host_key, ["/"])
+    ]
+
+
+class OriginAdapter(HTTPAdapter):
+    """
+    Send requests for a public host to the origin, with the public host as the
+    TLS server name, so that the origin presents and is checked against the
+    certificate of the public host.
+    """
+
+    def __init__(self, host: str, pool_maxsize: int) -> None:
+        self.host = host
+        super().__init__(pool_connections=1, pool_maxsize=pool_maxsize)
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        kwargs["server_hostname"] = self.host
+        kwargs["assert_hostname"] = self.host
+        super().init_poolmanager(*args, **kwargs)
+
+
+def get_sessions(
+    hosts: List[str], origin: str, concurrency: int
+) -> Dict[str, requests.Session]:
+    "Return a session by host, each with its own pool of connections to the origin"
+    sessions = {}
+    for host in hosts:
+        session = requests.Session()
+        session.headers["Host"] = host
+        session.mount(origin, OriginAdapter(host, concurrency))
+        sessions[host] = session
+    return sessions
+
+
+def fetch(
+    session: requests.Session, url: str, timeout: float = WARMUP_TIMEOUT
+) -> Tuple[int, float]:
+    "Request a URL and return its status and how long the full response took"
+    started = time.perf_counter()
+    with session.get(url, timeout=timeout, allow_redirects=False) as response:
+        # Read the body, the response is not complete before
+        for _chunk in response.iter_content(chunk_size=65536):
+            pass
+        return response.status_code, time.perf_counter() - started
+
+
+def warmup(
+    targets: List[Target],
+    origin: str,
+    concurrency: int = WARMUP_CONCURRENCY,
+    timeout: float = WARMUP_TIMEOUT,
+) -> List[WarmupResult]:
+    """
+    Request all targets through the origin, `concurrency` at a time, then
+    request them all again to measure the latency of the warm origin. Results
+    are returned in the same order as the targets.
+    """
+    origin = origin.rstrip("/")
+    sessions = get_sessions(
+        list(dict.fromkeys(target.host for target in targets)), origin, concurrency
+    )
+
+    def run(target: Target) -> Tuple[Optional[int], Optional[float], str]:
+        try:
+            status, duration = fetch(
+                sessions[target.host], f"{origin}{target.path}", timeout
+            )
+            return status, duration, ""
+        except requests.RequestException as e:
+            return None, None, str(e)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+            before = list(executor.map(run, targets))
+            after = list(executor.map(run, targets))
+    finally:
+        for session in sessions.values():
+            session.close()
+    return [
+        WarmupResult(
+            target,
+            second[0],
+            first[1],
+            second[1],
+            second[2],
+        )
+        for target, first, second in zip(targets, before, after)
+    ]
+
+
+def format_result(result: WarmupResult) -> str:
+    "Format a result as a single line"
+    target = result.target
+    line = f"{target.host_key} {target.host}{target.path}"
+    if result.error:
+        return f"{line}: {result.error}"
+    latencies = ", ".join(
+        f"{name} {value * 1000:.1f}ms"
+        for name, value in (("before", result.before), ("after", result.after))
+        if value is not None
+    )
+    return f"{line}: {result.status}, {latencies}"
+
+
+def to_dict(result: WarmupResult) -> Dict[str, Any]:
+    "Return a result as a JSON-serializable dict"
+    return {
+        "host_key": result.target.host_key,
+        "host": result.target.host,
+        "path": result.target.path,
+        "status": result.status,
+        "before_ms": None if result.before is None else round(result.before * 1000, 3),
+        "after_ms": None if result.after is None else round(result.after * 1000, 3),
+        "error": result.error,
+    }